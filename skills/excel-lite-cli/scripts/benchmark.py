@@ -0,0 +1,906 @@
+#!/usr/bin/env python3
+"""
+excel_tool.py 性能基准。
+
+运行：
+  python scripts/benchmark.py engines                    # 生成 5 万行测试文件，对比各读取引擎
+  python scripts/benchmark.py engines --rows 200000      # 指定行数
+  python scripts/benchmark.py engines a.xlsx b.xlsx      # 用已有文件对比
+  python scripts/benchmark.py normalize --rows 500000    # 文本清洗：逐值 map vs 向量化
+  python scripts/benchmark.py views --rows 500000        # 列类型视图：filter/sort/aggregate 共享转换
+  python scripts/benchmark.py dedup --rows 1000000       # dedup：drop_duplicates vs 摘要判重（整表 / 分块）
+  python scripts/benchmark.py formula --rows 500000      # add_column 公式：df.eval vs 编译后向量计算
+  python scripts/benchmark.py backend --rows 500000      # clean 处理后端：pandas vs polars
+  python scripts/benchmark.py category --rows 500000     # 低基数文本列：普通文本 vs 分类编码（清洗、内存、步骤）
+  python scripts/benchmark.py preview --rows 500000     # clean 预览：整表执行 vs 样本执行（耗时随行数的变化）
+  python scripts/benchmark.py startup                    # 冷启动：不读表的命令不应导入 pandas 等重依赖
+  python scripts/benchmark.py suite --rows 10000,100000,2000000 --baseline base.json
+                                                         # 规模基准：生成脏报表逐项计时，慢于基线超过阈值时退出码为 1
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import datetime
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SKILL_DIR = os.path.join(SCRIPT_DIR, "..")
+# 生成的测试文件和结果写到这里（EXCEL_TOOL_BENCH_DIR 覆盖）
+BENCH_DIR = os.environ.get("EXCEL_TOOL_BENCH_DIR") or os.path.join(SKILL_DIR, "test_output", "bench")
+
+sys.path.insert(0, SCRIPT_DIR)
+import excel_tool  # noqa: E402
+
+# 基准测试只测解析本身，不读写解析缓存
+excel_tool.CACHE_ENABLED = False
+
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">\
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>\
+<Default Extension="xml" ContentType="application/xml"/>\
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>\
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>\
+<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>\
+{sheets}</Types>"""
+_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">\
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>\
+</Relationships>"""
+# 样式 0 = 常规，样式 1 = 日期（内置格式 14）
+_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">\
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>\
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>\
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>\
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>\
+<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>\
+<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>\
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>\
+</styleSheet>"""
+
+
+def _col_letter(idx):
+    """0-based 列号 → 列字母"""
+    letters = ""
+    idx += 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _write_package(zf, sheet_names, strings):
+    """写工作表以外的部分：共享字符串、样式、工作簿目录和各种关系（工作表 XML 由调用方写入 sheetN.xml）"""
+    from xml.sax.saxutils import escape, quoteattr
+    sheets = len(sheet_names)
+    zf.writestr("xl/sharedStrings.xml",
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                f'count="{len(strings)}" uniqueCount="{len(strings)}">'
+                + "".join(f'<si><t xml:space="preserve">{escape(t)}</t></si>' for t in strings)
+                + "</sst>")
+    zf.writestr("[Content_Types].xml", _CONTENT_TYPES.format(sheets="".join(
+        f'<Override PartName="/xl/worksheets/sheet{s + 1}.xml" ContentType='
+        '"application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for s in range(sheets))))
+    zf.writestr("_rels/.rels", _ROOT_RELS)
+    zf.writestr("xl/styles.xml", _STYLES)
+    zf.writestr("xl/workbook.xml",
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+                'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+                + "".join(f'<sheet name={quoteattr(name)} sheetId="{s + 1}" r:id="rId{s + 1}"/>'
+                          for s, name in enumerate(sheet_names))
+                + "</sheets></workbook>")
+    zf.writestr("xl/_rels/workbook.xml.rels",
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                + "".join(f'<Relationship Id="rId{s + 1}" Target="worksheets/sheet{s + 1}.xml" '
+                          'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+                          for s in range(sheets))
+                + f'<Relationship Id="rId{sheets + 1}" Target="styles.xml" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+                f'<Relationship Id="rId{sheets + 2}" Target="sharedStrings.xml" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"/>'
+                "</Relationships>")
+
+
+def generate_workbook(path, rows, sheets=1):
+    """直接写 xlsx 内部 XML 生成测试报表（共享字符串 + <dimension>，与 Excel 保存的文件结构一致）。
+
+    每个 Sheet：合并的标题行 + 空行 + 表头 + rows 行数据，含序号列、脏字符、日期、布尔和空值。
+    比 openpyxl 写入快一个数量级，百万行也能在可接受时间内生成。
+    """
+    import zipfile
+
+    regions = ["华东", " 华南 ", "华北\u200b", "西南\xa0", "华中\n"]
+    headers = ["序号", "区域", "型号", "日期", "销量", "单价", "在售", "备注"]
+    base = datetime.date(2024, 1, 1).toordinal() - datetime.date(1899, 12, 30).toordinal()
+
+    strings, string_ids = [], {}
+
+    def sst(text):
+        idx = string_ids.get(text)
+        if idx is None:
+            idx = string_ids[text] = len(strings)
+            strings.append(text)
+        return idx
+
+    def str_cell(ref, text):
+        return f'<c r="{ref}" t="s"><v>{sst(text)}</v></c>'
+
+    ncols = len(headers)
+    last_col = _col_letter(ncols - 1)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for s in range(sheets):
+            with zf.open(f"xl/worksheets/sheet{s + 1}.xml", "w") as out:
+                def w(text):
+                    out.write(text.encode("utf-8"))
+                w('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                  '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                  f'<dimension ref="A1:{last_col}{rows + 3}"/><sheetData>')
+                w(f'<row r="1">{str_cell("A1", "测试报表（自动生成）")}</row>')
+                w('<row r="3">' + "".join(str_cell(f"{_col_letter(c)}3", h)
+                                          for c, h in enumerate(headers)) + "</row>")
+                for i in range(rows):
+                    r = i + 4
+                    cells = [
+                        f'<c r="A{r}"><v>{i + 1}</v></c>',
+                        str_cell(f"B{r}", regions[i % len(regions)]),
+                        str_cell(f"C{r}", f"型号-{i % 97}"),
+                        f'<c r="D{r}" s="1"><v>{base + i % 365}</v></c>',
+                    ]
+                    if i % 17:
+                        cells.append(f'<c r="E{r}"><v>{i % 500}</v></c>')
+                    cells.append(f'<c r="F{r}"><v>{round(1000 + (i % 89) * 3.5, 2)}</v></c>')
+                    cells.append(f'<c r="G{r}" t="b"><v>{int(i % 3 == 0)}</v></c>')
+                    if i % 11 == 0:
+                        cells.append(str_cell(f"H{r}", "备注\t内容"))
+                    w(f'<row r="{r}">{"".join(cells)}</row>')
+                w(f'</sheetData><mergeCells count="1"><mergeCell ref="A1:{last_col}1"/></mergeCells></worksheet>')
+
+        _write_package(zf, [f"Sheet{s + 1}" for s in range(sheets)], strings)
+    return path
+
+
+# 脏报表的列类型：首列为序号，其余按此顺序循环（第二轮起列名带轮次，如 区域2）
+_DIRTY_KINDS = ["区域", "型号", "日期", "销量", "单价", "在售", "备注"]
+_DIRTY_REGIONS = ["华东", "华南", "华北", "西南", "华中", "东北"]
+# 脏字符：首尾空格、零宽空格、不换行空格、制表符、换行、全角空格
+_DIRTY_WRAPS = [" {} ", "{}\u200b", "\xa0{}", "{}\t", "{}\n", "\u3000{}"]
+
+
+def dirty_headers(cols):
+    """generate_dirty_workbook 生成的列名"""
+    names = ["序号"]
+    for c in range(cols - 1):
+        kind, turn = _DIRTY_KINDS[c % len(_DIRTY_KINDS)], c // len(_DIRTY_KINDS)
+        names.append(kind if turn == 0 else f"{kind}{turn + 1}")
+    return names
+
+
+def generate_dirty_workbook(path, rows, cols=8, sheets=1, title_rows=1, dirty=0.2, cardinality=100, seed=0):
+    """按参数生成脏报表，用于规模基准（同样参数生成的文件内容相同）。
+
+    表头之上有 title_rows 行跨全部列合并的标题，标题后空一行（0 时表头在第 1 行）；
+    dirty 为文本单元格带脏字符的比例，cardinality 为型号列的不同值个数；
+    销量约 5% 为空，备注约 90% 为空。
+    """
+    import random
+    import zipfile
+
+    rng = random.Random(seed)
+    headers = dirty_headers(max(cols, 1))
+    kinds = [next((k for k in _DIRTY_KINDS if h.startswith(k)), "序号") for h in headers]
+    base = datetime.date(2024, 1, 1).toordinal() - datetime.date(1899, 12, 30).toordinal()
+    header_row = title_rows + 2 if title_rows else 1
+    last_row = header_row + rows
+    last_col = _col_letter(len(headers) - 1)
+    letters = [_col_letter(c) for c in range(len(headers))]
+
+    strings, string_ids = [], {}
+
+    def sst(text):
+        idx = string_ids.get(text)
+        if idx is None:
+            idx = string_ids[text] = len(strings)
+            strings.append(text)
+        return idx
+
+    def text(value):
+        if rng.random() < dirty:
+            value = rng.choice(_DIRTY_WRAPS).format(value)
+        return f' t="s"><v>{sst(value)}</v></c>'
+
+    def cell(kind, i):
+        """单元格 r 属性之后的部分；None 为空单元格"""
+        if kind == "序号":
+            return f"><v>{i + 1}</v></c>"
+        if kind == "区域":
+            return text(_DIRTY_REGIONS[rng.randrange(len(_DIRTY_REGIONS))])
+        if kind == "型号":
+            return text(f"型号-{rng.randrange(cardinality):05d}")
+        if kind == "日期":
+            return f' s="1"><v>{base + i % 365}</v></c>'
+        if kind == "销量":
+            return None if rng.random() < 0.05 else f"><v>{rng.randrange(1000)}</v></c>"
+        if kind == "单价":
+            return f"><v>{round(rng.uniform(1, 2000), 2)}</v></c>"
+        if kind == "在售":
+            return f' t="b"><v>{int(rng.random() < 0.5)}</v></c>'
+        return text(f"备注{i % 50}") if rng.random() < 0.1 else None
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for s in range(sheets):
+            with zf.open(f"xl/worksheets/sheet{s + 1}.xml", "w") as out:
+                def w(data):
+                    out.write(data.encode("utf-8"))
+                w('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                  '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                  f'<dimension ref="A1:{last_col}{last_row}"/><sheetData>')
+                for t in range(title_rows):
+                    w(f'<row r="{t + 1}"><c r="A{t + 1}" t="s"><v>{sst(f"测试报表 标题{t + 1}")}</v></c></row>')
+                w(f'<row r="{header_row}">' + "".join(
+                    f'<c r="{letters[c]}{header_row}" t="s"><v>{sst(h)}</v></c>'
+                    for c, h in enumerate(headers)) + "</row>")
+                for i in range(rows):
+                    r = header_row + 1 + i
+                    cells = []
+                    for letter, kind in zip(letters, kinds):
+                        body = cell(kind, i)
+                        if body is not None:
+                            cells.append(f'<c r="{letter}{r}"{body}')
+                    w(f'<row r="{r}">{"".join(cells)}</row>')
+                w("</sheetData>")
+                if title_rows:
+                    w(f'<mergeCells count="{title_rows}">' + "".join(
+                        f'<mergeCell ref="A{t + 1}:{last_col}{t + 1}"/>' for t in range(title_rows))
+                      + "</mergeCells>")
+                w("</worksheet>")
+        _write_package(zf, [f"Sheet{s + 1}" for s in range(sheets)], strings)
+    return path
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def _read_all(file_path, engine):
+    """按指定引擎完整跑一遍侦察 + 读取所有 Sheet，返回 (各 Sheet DataFrame, 侦察耗时, 读取耗时)"""
+    excel_tool._set_read_engine(engine)
+    with excel_tool.WorkbookSession(file_path) as session:
+        session.report = lambda: None
+        sheets, t_scout = _timed(excel_tool._auto_detect_sheets, session)
+        frames = {}
+        start = time.perf_counter()
+        for name, cfg in sheets.items():
+            frames[name] = excel_tool.read_to_dataframe(session, name, cfg)
+        t_read = time.perf_counter() - start
+    return frames, t_scout, t_read
+
+
+def bench_engines(files, engines):
+    print(f"{'文件':<28}{'引擎':<10}{'侦察':>9}{'读取':>9}{'行数':>10}  结果一致")
+    for file_path in files:
+        baseline = None
+        for engine in engines:
+            frames, t_scout, t_read = _read_all(file_path, engine)
+            rows = sum(len(df) for df in frames.values())
+            same = "-"
+            if baseline is None:
+                baseline = frames
+            else:
+                same = "是" if frames.keys() == baseline.keys() and all(
+                    frames[k].equals(baseline[k]) for k in frames) else "否"
+            print(f"{os.path.basename(file_path):<28}{engine:<10}"
+                  f"{t_scout:>8.2f}s{t_read:>8.2f}s{rows:>10}  {same}")
+
+
+def _normalize_reference(df):
+    """旧实现：逐值 map(_clean_text)，作为正确性与速度的对照"""
+    import pandas as pd
+    for col in df.select_dtypes(include=["object", "str"]).columns:
+        df[col] = df[col].map(lambda v: excel_tool._clean_text(v) if pd.notna(v) else v)
+        df[col] = df[col].replace(["None", "nan", ""], pd.NA)
+    return df
+
+
+def make_raw_frame(rows, cols):
+    """构造未清洗的宽表：低基数脏文本列、高基数文本列、干净文本列、混合类型列、数值列轮流出现"""
+    import pandas as pd
+    regions = ["华东", " 华南 ", "华北\u200b", "西南\xa0", "华中\n", "None", ""]
+    data = {}
+    for c in range(cols):
+        kind = c % 5
+        if kind == 0:
+            data[f"低基数{c}"] = [regions[i % len(regions)] for i in range(rows)]
+        elif kind == 1:
+            data[f"高基数{c}"] = [f"编号\t{i}" if i % 3 else f"编号{i}" for i in range(rows)]
+        elif kind == 2:
+            data[f"干净{c}"] = [f"型号-{i % 997}" for i in range(rows)]
+        elif kind == 3:
+            data[f"混合{c}"] = [i if i % 4 else f" 备注{i % 50} " for i in range(rows)]
+        else:
+            data[f"数值{c}"] = [i * 1.5 for i in range(rows)]
+    return pd.DataFrame(data)
+
+
+def bench_normalize(rows, cols):
+    df = make_raw_frame(rows, cols)
+    ref, t_ref = _timed(_normalize_reference, df.copy())
+    new, t_new = _timed(excel_tool._normalize_strings, df.copy())
+    same = ref.equals(new) and (ref.dtypes == new.dtypes).all()
+    print(f"[数据] {rows} 行 × {cols} 列")
+    print(f"  逐值 map     {t_ref:8.2f}s")
+    print(f"  向量化       {t_new:8.2f}s   加速 {t_ref / t_new:.1f}x   结果一致: {'是' if same else '否'}")
+    return same
+
+
+VIEW_STEPS = [
+    {"action": "filter", "conditions": [{"column": "编号", "op": "contains", "value": "1"}]},
+    {"action": "filter", "conditions": [{"column": "数量", "op": ">", "value": "10"}]},
+    {"action": "sort", "column": "编号"},
+    {"action": "sort", "column": "数量", "desc": True},
+    {"action": "aggregate", "group_by": ["区域"], "metrics": {"数量": "sum"}},
+]
+
+
+def _run_steps(df, views_factory):
+    for step in VIEW_STEPS:
+        df = excel_tool._apply_step(df, step, views=views_factory())
+    return df
+
+
+def bench_views(rows):
+    """同一列在 filter / sort / aggregate 中反复转换（每步新建视图）vs 整个流程共享一个视图"""
+    import pandas as pd
+    df = pd.DataFrame({
+        "区域": [["华东", "华南", "华北"][i % 3] for i in range(rows)],
+        "编号": [f"A{i:07d}" for i in range(rows)],
+        "数量": [str(i % 500) if i % 11 else "缺货" for i in range(rows)],
+    })
+    ref, t_ref = _timed(_run_steps, df.copy(), excel_tool._ColumnViews)
+    shared = excel_tool._ColumnViews()
+    new, t_new = _timed(_run_steps, df.copy(), lambda: shared)
+    same = ref.equals(new) and (ref.dtypes == new.dtypes).all()
+    print(f"[数据] {rows} 行，{len(VIEW_STEPS)} 个步骤反复用到 编号 / 数量 列")
+    print(f"  每步重新转换 {t_ref:8.2f}s")
+    print(f"  共享列视图   {t_new:8.2f}s   加速 {t_ref / t_new:.1f}x   结果一致: {'是' if same else '否'}")
+    return same
+
+
+def _peak(fn, *args):
+    """运行 fn 两次：第一次计时，第二次用 tracemalloc 记峰值（追踪会拖慢分配，不计时）。
+    返回 (结果, 耗时秒, Python 堆峰值字节)"""
+    import tracemalloc
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return result, elapsed, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _dedup_chunked(df, step, chunk_rows, expected):
+    """分块执行 dedup，逐块与 expected 对比（不拼接输出，峰值只含分块执行本身）"""
+    area = excel_tool._SpillArea(chunk_rows)
+    area.partitions = max(1, min(excel_tool._MAX_FANOUT, -(-len(df) // chunk_rows)))
+    same, offset = True, 0
+    try:
+        chunks = (df.iloc[i:i + chunk_rows] for i in range(0, len(df), chunk_rows))
+        for out in excel_tool._chunked_dedup(chunks, step, area):
+            same &= out.reset_index(drop=True).equals(
+                expected.iloc[offset:offset + len(out)].reset_index(drop=True))
+            offset += len(out)
+    finally:
+        area.close()
+    return same and offset == len(expected)
+
+
+def bench_dedup(rows, keep):
+    """宽文本键去重：drop_duplicates vs 摘要判重（整表），以及分块执行（摘要常驻 / 超限分区落盘）"""
+    import pandas as pd
+    keys = [(i * 7919) % max(rows // 2, 1) for i in range(rows)]
+    df = pd.DataFrame({
+        "客户": [f"客户-{k % 5000:05d}-华东区重点客户" for k in keys],
+        "订单": [f"SO{k:010d}" for k in keys],
+        "金额": [float(i % 1000) for i in range(rows)],
+        "备注": ["加急配送，需电话确认收货时间" if i % 5 else None for i in range(rows)],
+    })
+    cols = ["客户", "订单"]
+    step = {"action": "dedup", "columns": cols, "keep": keep}
+    ref, t_ref, m_ref = _peak(lambda: df.drop_duplicates(subset=cols, keep=keep))
+    (new, _, _), t_new, m_new = _peak(excel_tool._dedup_frame, df, cols, keep)
+    same = ref.equals(new) and ref.index.equals(new.index)
+    chunk_rows = max(rows // 20, 1)
+    results = []
+    for memory in (excel_tool.DEDUP_MEMORY, 0):
+        excel_tool.DEDUP_MEMORY, saved = memory, excel_tool.DEDUP_MEMORY
+        try:
+            with redirect_stdout(io.StringIO()):
+                chunk_same, t_chunk, m_chunk = _peak(_dedup_chunked, df, step, chunk_rows, ref)
+        finally:
+            excel_tool.DEDUP_MEMORY = saved
+        same &= chunk_same
+        results.append((t_chunk, m_chunk))
+    mb = 2 ** 20
+    print(f"[数据] {rows} 行，按 {cols} 去重（keep={keep}），保留 {len(ref)} 行")
+    print(f"  drop_duplicates     {t_ref:8.2f}s   峰值 {m_ref / mb:7.1f}MB")
+    print(f"  摘要判重（整表）    {t_new:8.2f}s   峰值 {m_new / mb:7.1f}MB")
+    print(f"  分块，摘要常驻      {results[0][0]:8.2f}s   峰值 {results[0][1] / mb:7.1f}MB（每块 {chunk_rows} 行）")
+    print(f"  分块，分区落盘      {results[1][0]:8.2f}s   峰值 {results[1][1] / mb:7.1f}MB   "
+          f"结果一致: {'是' if same else '否'}")
+    return same
+
+
+# df.eval 也能算的纯数值公式，用来对比旧写法；新写法额外支持 IF / coalesce 等
+FORMULA_CASES = [
+    "({营收}-{成本})/{营收}*100",
+    "{营收}*{数量}+{成本}*0.5",
+    "abs({营收}-{成本})",
+    "{营收} if {数量} > 50 else {成本}",
+]
+
+
+def _eval_formulas(frames, evaluate):
+    return [evaluate(df, formula) for df in frames for formula in FORMULA_CASES]
+
+
+def _eval_reference(df, formula):
+    """旧写法：每次计算都把 {列名} 换成反引号再交给 df.eval（条件表达式用 where 改写）"""
+    if " if " in formula:
+        body, rest = formula.split(" if ")
+        cond, other = rest.split(" else ")
+        return _eval_reference(df, body).where(_eval_reference(df, cond), _eval_reference(df, other))
+    for h in df.columns:
+        formula = formula.replace("{" + h + "}", f"`{h}`")
+    return df.eval(formula)
+
+
+def _eval_compiled(df, formula):
+    return excel_tool._compile_formula(formula).evaluate(df)
+
+
+def bench_formula(rows, files):
+    """同一批公式在 files 个表上计算：df.eval 每次重新解析 vs 编译一次后向量计算"""
+    import numpy as np
+    import pandas as pd
+    per_file = max(rows // files, 1)
+    rng = np.random.default_rng(0)
+    frames = [pd.DataFrame({"营收": rng.uniform(1, 1000, per_file).round(2),
+                            "成本": rng.uniform(1, 800, per_file).round(2),
+                            "数量": rng.integers(0, 100, per_file)}) for _ in range(files)]
+    excel_tool._formula_cache.clear()
+    ref, t_ref = _timed(_eval_formulas, frames, _eval_reference)
+    new, t_new = _timed(_eval_formulas, frames, _eval_compiled)
+    same = all(np.array_equal(a.to_numpy(), b.to_numpy()) for a, b in zip(ref, new))
+    # numexpr 与 NumPy 两条路径结果也必须一致
+    threshold = excel_tool._NUMEXPR_MIN_ROWS
+    excel_tool._NUMEXPR_MIN_ROWS = float("inf")
+    try:
+        numpy_only = _eval_formulas(frames, _eval_compiled)
+    finally:
+        excel_tool._NUMEXPR_MIN_ROWS = threshold
+    same &= all(np.array_equal(a.to_numpy(), b.to_numpy()) for a, b in zip(numpy_only, new))
+    backend = "numexpr" if excel_tool._numexpr() and per_file >= threshold else "NumPy"
+    print(f"[数据] {files} 个表 × {per_file} 行，{len(FORMULA_CASES)} 个公式（{backend}）")
+    print(f"  df.eval      {t_ref:8.2f}s")
+    print(f"  编译公式     {t_new:8.2f}s   加速 {t_ref / t_new:.1f}x   结果一致: {'是' if same else '否'}")
+    return same
+
+
+# 不读表的命令只需标准库；这些模块出现在 -X importtime 里即视为冷启动退化
+STARTUP_COMMANDS = [["help"], ["help", "filter"], ["steps-path", "报表.xlsx"]]
+HEAVY_MODULES = ("numpy", "pandas", "openpyxl", "win32com")
+
+
+BACKEND_STEPS = [
+    {"action": "trim"},
+    {"action": "replace", "column": "区域", "mapping": {"华东区": "华东", "华南区": "华南"}},
+    {"action": "fill_empty", "column": "备注", "value": "无"},
+    {"action": "regex_replace", "column": "编号", "pattern": "^A0+", "replacement": "A"},
+    {"action": "filter", "conditions": [{"column": "数量", "op": ">", "value": "10"}]},
+    {"action": "dedup", "columns": ["区域", "编号"]},
+    {"action": "add_column", "name": "金额", "formula": "{数量} * {单价}", "round": 2},
+    {"action": "sort", "column": "金额", "desc": True},
+    {"action": "rename", "mapping": {"整数": "序号"}},
+]
+
+
+def _run_backend(df, backend):
+    excel_tool.PROCESS_BACKEND = backend
+    try:
+        plan = excel_tool._CleanPlan(BACKEND_STEPS)
+        return plan.compile(df).run(df, report=False).reset_index(drop=True)
+    finally:
+        excel_tool.PROCESS_BACKEND = "pandas"
+
+
+def bench_backend(rows):
+    """同一组 clean 步骤分别用 pandas / polars 后端执行（都经过执行计划），对比耗时和结果"""
+    import importlib.util
+    import pandas as pd
+    if importlib.util.find_spec("polars") is None:
+        print("[提示] 未安装 polars，跳过（pip install polars）")
+        return True
+    df = pd.DataFrame({
+        "区域": [["华东区", " 华南 ", "华北", "华南区", "西南"][i % 5] for i in range(rows)],
+        "编号": [f"A{i % (rows // 2 + 1):07d}" for i in range(rows)],
+        "数量": [str(i % 500) if i % 11 else "缺货" for i in range(rows)],
+        "单价": [(i % 97) * 1.25 for i in range(rows)],
+        "备注": [f"备注{i % 7}" if i % 3 else None for i in range(rows)],
+        "整数": list(range(rows)),
+    })
+    df = excel_tool._normalize_strings(df)
+    excel_tool._import_now(excel_tool.pl)  # 导入耗时不计入（pandas 此时也已导入）
+    ref, t_ref = _timed(_run_backend, df.copy(), "pandas")
+    new, t_new = _timed(_run_backend, df.copy(), "polars")
+    same = ref.equals(new) and (ref.dtypes == new.dtypes).all()
+    print(f"[数据] {rows} 行，{len(BACKEND_STEPS)} 个步骤 → {len(ref)} 行")
+    print(f"  pandas       {t_ref:8.2f}s")
+    print(f"  polars       {t_new:8.2f}s   加速 {t_ref / t_new:.1f}x   结果一致: {'是' if same else '否'}")
+    return same
+
+
+CATEGORY_STEPS = [
+    {"action": "trim"},
+    {"action": "replace", "column": "区域", "mapping": {"华东区": "华东", "华南区": "华南"}},
+    {"action": "filter", "conditions": [{"column": "类别", "op": "!=", "value": "退货"},
+                                        {"column": "区域", "op": "contains", "value": "华"}]},
+    {"action": "aggregate", "group_by": ["区域", "类别"], "metrics": {"数量": "sum"}},
+]
+
+
+def _run_category(raw, categorize):
+    """返回 ((步骤结果, 还原后的清洗结果, pivot 结果), 清洗耗时, 内存字节, 步骤耗时)"""
+    df, t_norm = _timed(excel_tool._normalize_strings, raw.copy(), categorize)
+    memory = df.memory_usage(deep=True).sum()
+    start = time.perf_counter()
+    out = df
+    for step in CATEGORY_STEPS:
+        out = excel_tool._apply_step(out, step)
+    pivot = excel_tool._apply_step(df, {"action": "pivot", "index": "区域", "columns": "类别",
+                                        "values": "数量", "aggfunc": "count"})
+    t_steps = time.perf_counter() - start
+    return (excel_tool._decode_categories(out), excel_tool._decode_categories(df), pivot), t_norm, memory, t_steps
+
+
+def bench_category(rows):
+    """低基数脏文本列（区域、类别）按普通文本 / 分类编码读入：清洗耗时、内存、replace/filter/aggregate/pivot 耗时"""
+    import pandas as pd
+    raw = pd.DataFrame({
+        "区域": [["华东区", " 华南 ", "华北\u200b", "华南区", "西南\xa0", "None"][i % 6] for i in range(rows)],
+        "类别": [["办公", "家具", "电器", "退货"][i % 4] for i in range(rows)],
+        "编号": [f"A{i:07d}" for i in range(rows)],
+        "数量": [i % 500 for i in range(rows)],
+    })
+    saved = excel_tool.CATEGORY_MIN_ROWS
+    excel_tool.CATEGORY_MIN_ROWS = 1
+    try:
+        ref, n_ref, m_ref, t_ref = _run_category(raw, False)
+        new, n_new, m_new, t_new = _run_category(raw, True)
+    finally:
+        excel_tool.CATEGORY_MIN_ROWS = saved
+    same = all(a.equals(b) and (a.dtypes == b.dtypes).all() for a, b in zip(ref, new))
+    print(f"[数据] {rows} 行，区域 / 类别为低基数列，{len(CATEGORY_STEPS)} 个步骤 + pivot")
+    print(f"  普通文本     清洗 {n_ref:6.2f}s  内存 {m_ref / 2 ** 20:7.1f}MB  步骤 {t_ref:6.2f}s")
+    print(f"  分类编码     清洗 {n_new:6.2f}s  内存 {m_new / 2 ** 20:7.1f}MB  步骤 {t_new:6.2f}s"
+          f"   加速 {t_ref / t_new:.1f}x   结果一致: {'是' if same else '否'}")
+    return same
+
+
+PREVIEW_STEPS = [
+    {"action": "trim"},
+    {"action": "replace", "column": "区域", "mapping": {"华北": "华北区"}},
+    {"action": "filter", "conditions": [{"column": "销量", "op": ">", "value": "100"}]},
+    {"action": "add_column", "name": "金额", "formula": "{销量} * {单价}", "round": 2},
+]
+
+
+def _preview(path, rules, exact):
+    """clean --preview 一次，返回 (预览表格文本, 耗时秒)"""
+    out = io.StringIO()
+    start = time.perf_counter()
+    with redirect_stdout(out):
+        excel_tool.do_clean(path, rules, preview_only=True, exact=exact)
+    elapsed = time.perf_counter() - start
+    text = out.getvalue()
+    return text[text.index("预览前 10 行"):text.index("[提示]", text.index("预览前 10 行"))], elapsed
+
+
+def bench_preview(rows):
+    """不同行数的表上 clean --preview：整表执行随行数增长，样本执行基本不变；逐行步骤的预览结果两者一致"""
+    import json
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    rules = os.path.join(BENCH_DIR, "preview.excel-steps.json")
+    with open(rules, "w", encoding="utf-8") as f:
+        json.dump({"steps": PREVIEW_STEPS}, f, ensure_ascii=False)
+    same = True
+    print(f"{'行数':>10}{'整表预览':>12}{'样本预览':>12}  结果一致")
+    for n in sorted({max(rows // 10, excel_tool.PREVIEW_SAMPLE_ROWS + 1), rows}):
+        path = os.path.join(BENCH_DIR, f"preview-{n}.xlsx")
+        if not os.path.exists(path):
+            generate_workbook(path, n)
+        (exact, t_exact), (sample, t_sample) = _preview(path, rules, True), _preview(path, rules, False)
+        same &= exact == sample
+        print(f"{n:>10}{t_exact:>11.2f}s{t_sample:>11.2f}s  {'是' if exact == sample else '否'}")
+    print(f"结果一致: {'是' if same else '否'}")
+    return same
+
+
+def _startup_run(args):
+    """python -X importtime 运行一次 excel_tool.py，返回 (总耗时秒, 导入耗时秒, 导入的顶层模块集合)"""
+    tool = os.path.join(SCRIPT_DIR, "excel_tool.py")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", tool, *args],
+                            capture_output=True, text=True, encoding="utf-8")
+    wall = time.perf_counter() - start
+    imported, total_us = set(), 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if self_us.strip().isdigit():  # 跳过表头行
+            total_us += int(self_us)
+            imported.add(name.strip().split(".")[0])
+    return wall, total_us / 1e6, imported
+
+
+def bench_startup(runs, max_ms=None):
+    """各命令跑 runs 次取中位数；导入了重依赖或导入耗时超过 max_ms 时返回 False"""
+    ok = True
+    print(f"{'命令':<24}{'总耗时':>10}{'导入':>10}  重依赖")
+    for args in STARTUP_COMMANDS:
+        samples = [_startup_run(args) for _ in range(runs)]
+        wall = statistics.median(s[0] for s in samples)
+        imports = statistics.median(s[1] for s in samples)
+        heavy = sorted(set().union(*(s[2] for s in samples)) & set(HEAVY_MODULES))
+        slow = max_ms is not None and imports * 1000 > max_ms
+        ok &= not heavy and not slow
+        print(f"{' '.join(args):<24}{wall * 1000:>8.0f}ms{imports * 1000:>8.0f}ms  "
+              f"{', '.join(heavy) if heavy else '未导入'}{'  超出预算' if slow else ''}")
+    return ok
+
+
+# 规模基准：13 种清洗操作各一步，分别作用于读入的整表（列名见 dirty_headers）
+SUITE_ACTIONS = [
+    {"action": "trim"},
+    {"action": "replace", "column": "区域", "mapping": {"华东": "华东区", "华南": "华南区"}},
+    {"action": "fill_empty", "column": "销量", "value": 0},
+    {"action": "dedup", "columns": ["区域", "型号"]},
+    {"action": "filter", "conditions": [{"column": "销量", "op": ">", "value": "500"}]},
+    {"action": "regex_replace", "column": "型号", "pattern": "^型号-0*", "replacement": "M"},
+    {"action": "add_column", "name": "金额", "formula": "{销量} * {单价}", "round": 2},
+    {"action": "drop_columns", "columns": ["备注"]},
+    {"action": "sort", "column": "单价", "desc": True},
+    {"action": "aggregate", "group_by": ["区域"], "metrics": {"销量": "sum", "单价": "mean"}},
+    {"action": "rename", "mapping": {"型号": "产品型号"}},
+    {"action": "type_convert", "columns": {"销量": "float", "日期": "datetime"}},
+    {"action": "pivot", "index": "区域", "columns": "在售", "values": "销量", "aggfunc": "sum"},
+]
+SUITE_FORMATS = (".csv", ".csv.gz", ".csv.zst", ".json", ".json.gz", ".jsonl", ".jsonl.gz", ".xlsx")
+# 工作表最多 1048576 行（含表头），超过时不测 .xlsx 导出
+XLSX_MAX_ROWS = 1048575
+
+
+def _quiet(func, *args, **kwargs):
+    with redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def _suite_formats(rows):
+    formats = [f for f in SUITE_FORMATS if not (f == ".xlsx" and rows > XLSX_MAX_ROWS)]
+    if _quiet(excel_tool._output_format, "x.csv.zst") is None:  # 未装 zstandard
+        formats = [f for f in formats if not f.endswith(".zst")]
+    return formats
+
+
+def _suite_run(path, rows):
+    """在一个生成的工作簿上把各项操作各跑一次，返回 {操作名: 耗时秒}（按执行顺序）"""
+    sheet = "Sheet1"
+    times = {}
+    _, times["scout"] = _timed(_quiet, excel_tool.do_scout, path, 8)
+    _, times["auto preview"] = _timed(lambda: _quiet(excel_tool.do_auto, path, "preview",
+                                                     sheet=sheet, n=5, jobs=1))
+    _, times["auto query"] = _timed(lambda: _quiet(excel_tool.do_auto, path, "query", sheet=sheet, jobs=1,
+                                                   where_col="销量", where_op=">", where_val="500",
+                                                   columns=None, sort="desc:单价", top=10))
+    with excel_tool.WorkbookSession(path) as session:
+        session.report = lambda: None
+        cfg = _quiet(excel_tool._auto_detect_sheets, session, [sheet])[sheet]
+        df = excel_tool.read_to_dataframe(session, sheet, cfg)
+        times["read"] = session.timings.get("read", 0.0)
+        times["_normalize_strings"] = session.timings.get("normalize", 0.0)
+    for step in SUITE_ACTIONS:
+        frame = df.copy()
+        _, times[f"clean {step['action']}"] = _timed(_quiet, excel_tool._apply_step, frame, step)
+    out = excel_tool._round_floats(excel_tool._decode_categories(df))
+    for fmt in _suite_formats(rows):
+        target = os.path.join(BENCH_DIR, f"suite-export{fmt}")
+        _, times[f"export {fmt}"] = _timed(excel_tool._write_chunks,
+                                           excel_tool._slices(out, excel_tool.EXPORT_CHUNK_ROWS), target)
+        os.remove(target)
+    return times
+
+
+def _load_baseline(path):
+    import json
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def bench_suite(sizes, params, repeat=1, output=None, baseline=None, threshold=0.25,
+                min_seconds=0.05, update_baseline=False):
+    """生成各行数的脏报表，计时侦察、预览、查询、读取、文本清洗、13 种清洗操作和各导出格式；
+    结果写成 JSON。给出基线时逐项对比：比基线慢 threshold 以上、且多出 min_seconds 以上算回归，
+    有回归时返回 False。基线文件不存在（或 update_baseline）时把本次结果存为基线。"""
+    import json
+    import platform
+    import pandas as pd
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    base = _load_baseline(baseline)
+    if base is not None and base.get("params") != params:
+        print(f"[提示] 基线的生成参数不同（{base.get('params')}），对比仅供参考")
+    base_results = (base or {}).get("results", {}) if not update_baseline else {}
+    # 先导入库和读取引擎，首个行数的计时不含导入耗时
+    excel_tool._import_now(excel_tool.np, excel_tool.pd)
+    excel_tool._import_engine(excel_tool._read_engine())
+    tag = "-".join(f"{k}{v}" for k, v in params.items())
+    results, regressions = {}, []
+    for rows in sizes:
+        path = os.path.join(BENCH_DIR, f"suite-{rows}-{tag}.xlsx")
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            generate_dirty_workbook(path, rows, **params)
+            print(f"[生成] {os.path.basename(path)}（{time.perf_counter() - start:.1f}s）")
+        runs = [_suite_run(path, rows) for _ in range(repeat)]
+        current = {op: statistics.median(run[op] for run in runs) for op in runs[0]}
+        results[str(rows)] = current
+        previous = base_results.get(str(rows), {})
+
+        print(f"\n[数据] {rows} 行 × {params['cols']} 列，{params['sheets']} 个 Sheet，标题 {params['title_rows']} 行，"
+              f"脏字符 {params['dirty']:.0%}，型号 {params['cardinality']} 种" + (f"（{repeat} 次取中位数）" if repeat > 1 else ""))
+        print("  操作                          耗时      基线     变化")  # 按显示宽度对齐下面各列
+        for op, seconds in current.items():
+            old = previous.get(op)
+            change, mark = "", ""
+            if old is not None:
+                change = f"{(seconds - old) / old:+.0%}" if old > 0 else ""
+                if seconds > old * (1 + threshold) and seconds - old > min_seconds:
+                    regressions.append(f"{rows} 行 {op}")
+                    mark = "  ← 超出阈值"
+            old_text = f"{old:.3f}s" if old is not None else "-"
+            print(f"  {op:<24}{seconds:>9.3f}s{old_text:>10}{change:>9}{mark}".rstrip())
+
+    report = {"created": datetime.datetime.now().isoformat(timespec="seconds"),
+              "python": platform.python_version(), "pandas": pd.__version__,
+              "params": params, "repeat": repeat, "results": results}
+    output = output or os.path.join(BENCH_DIR, "suite-results.json")
+    for path in [output] + ([baseline] if baseline and (base is None or update_baseline) else []):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"\n[结果] {output}")
+    if baseline and (base is None or update_baseline):
+        print(f"[基线] 已保存 {baseline}")
+    elif base is not None:
+        if regressions:
+            print(f"[回归] {len(regressions)} 项超出阈值（慢 {threshold:.0%} 以上且多出 {min_seconds}s 以上）："
+                  f"{'；'.join(regressions)}")
+        else:
+            print(f"[回归] 无（阈值：慢 {threshold:.0%} 以上且多出 {min_seconds}s 以上）")
+    return not regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="excel_tool 性能基准")
+    sub = parser.add_subparsers(dest="command")
+
+    p_eng = sub.add_parser("engines", help="对比读取引擎（openpyxl / xml）")
+    p_eng.add_argument("files", nargs="*", help="Excel 文件（省略时自动生成）")
+    p_eng.add_argument("--rows", type=int, default=50000, help="自动生成文件的行数")
+    p_eng.add_argument("--engines", default="openpyxl,xml", help="参与对比的引擎，逗号分隔")
+
+    p_norm = sub.add_parser("normalize", help="文本清洗：逐值 map vs 向量化")
+    p_norm.add_argument("--rows", type=int, default=200000)
+    p_norm.add_argument("--cols", type=int, default=30)
+
+    p_views = sub.add_parser("views", help="列类型视图：每步重新转换 vs 流程内共享")
+    p_views.add_argument("--rows", type=int, default=200000)
+
+    p_dedup = sub.add_parser("dedup", help="dedup：drop_duplicates vs 摘要判重（整表 / 分块）")
+    p_dedup.add_argument("--rows", type=int, default=300000)
+    p_dedup.add_argument("--keep", choices=["first", "last"], default="first")
+
+    p_formula = sub.add_parser("formula", help="add_column 公式：df.eval vs 编译后向量计算")
+    p_formula.add_argument("--rows", type=int, default=200000, help="总行数")
+    p_formula.add_argument("--files", type=int, default=1, help="分成几个表（模拟 batch）")
+
+    p_backend = sub.add_parser("backend", help="clean 处理后端：pandas vs polars")
+    p_backend.add_argument("--rows", type=int, default=200000)
+
+    p_cat = sub.add_parser("category", help="低基数文本列：普通文本 vs 分类编码")
+    p_cat.add_argument("--rows", type=int, default=200000)
+
+    p_preview = sub.add_parser("preview", help="clean 预览：整表执行 vs 样本执行")
+    p_preview.add_argument("--rows", type=int, default=200000)
+
+    p_start = sub.add_parser("startup", help="冷启动：help / steps-path 的导入耗时与重依赖检查")
+    p_start.add_argument("--runs", type=int, default=3, help="每个命令运行次数（取中位数）")
+    p_start.add_argument("--max-ms", type=float, help="导入耗时预算（毫秒），超出时退出码为 1")
+
+    p_suite = sub.add_parser("suite", help="规模基准：生成脏报表，逐项计时并与基线对比")
+    p_suite.add_argument("--rows", default="10000,100000", help="行数，逗号分隔（如 10000,100000,2000000）")
+    p_suite.add_argument("--cols", type=int, default=8, help="列数（含序号列）")
+    p_suite.add_argument("--sheets", type=int, default=1, help="Sheet 数")
+    p_suite.add_argument("--title-rows", type=int, default=1, help="表头之上合并的标题行数")
+    p_suite.add_argument("--dirty", type=float, default=0.2, help="文本单元格带脏字符的比例（0-1）")
+    p_suite.add_argument("--cardinality", type=int, default=100, help="型号列的不同值个数")
+    p_suite.add_argument("--repeat", type=int, default=1, help="每个行数运行次数（取中位数）")
+    p_suite.add_argument("-o", "--output", help="结果 JSON 路径（默认 BENCH_DIR/suite-results.json）")
+    p_suite.add_argument("--baseline", help="基线 JSON：存在时对比，不存在时把本次结果存为基线")
+    p_suite.add_argument("--update-baseline", action="store_true", help="用本次结果覆盖基线")
+    p_suite.add_argument("--threshold", type=float, default=0.25, help="比基线慢多少算回归（默认 0.25 即 25%%）")
+    p_suite.add_argument("--min-seconds", type=float, default=0.05, help="比基线多出不到这么多秒时不算回归")
+
+    args = parser.parse_args()
+
+    if args.command == "engines":
+        files = args.files
+        if not files:
+            os.makedirs(BENCH_DIR, exist_ok=True)
+            path = os.path.join(BENCH_DIR, f"engines-{args.rows}.xlsx")
+            if not os.path.exists(path):
+                print(f"[生成] {path}")
+                generate_workbook(path, args.rows)
+            files = [path]
+        bench_engines(files, args.engines.split(","))
+    elif args.command == "normalize":
+        if not bench_normalize(args.rows, args.cols):
+            sys.exit(1)
+    elif args.command == "views":
+        if not bench_views(args.rows):
+            sys.exit(1)
+    elif args.command == "dedup":
+        if not bench_dedup(args.rows, args.keep):
+            sys.exit(1)
+    elif args.command == "formula":
+        if not bench_formula(args.rows, args.files):
+            sys.exit(1)
+    elif args.command == "backend":
+        if not bench_backend(args.rows):
+            sys.exit(1)
+    elif args.command == "category":
+        if not bench_category(args.rows):
+            sys.exit(1)
+    elif args.command == "preview":
+        if not bench_preview(args.rows):
+            sys.exit(1)
+    elif args.command == "suite":
+        params = {"cols": args.cols, "sheets": args.sheets, "title_rows": args.title_rows,
+                  "dirty": args.dirty, "cardinality": args.cardinality}
+        if not bench_suite([int(n) for n in args.rows.split(",")], params, args.repeat, args.output,
+                           args.baseline, args.threshold, args.min_seconds, args.update_baseline):
+            sys.exit(1)
+    elif args.command == "startup":
+        if not bench_startup(args.runs, args.max_ms):
+            sys.exit(1)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Excel 报表工具 - 处理复杂/乱序报表
-读取层：pywin32（Windows）/ openpyxl（跨平台） - 处理原始结构
+读取层：pywin32（Windows）/ openpyxl（跨平台）/ xml（内置流式解析 xlsx） - 处理原始结构
 处理层：pandas - 查询、清洗、聚合
 """
 
@@ -10,27 +10,174 @@ import sys
 import json
 import argparse
 import re
+import time
+import itertools
+import functools
+import operator
+import pickle
+import random
+import hashlib
+import gzip
+import io
+import heapq
+import bisect
+import glob
+import copy
+import importlib
+import importlib.util
+import socket
+from collections import OrderedDict
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
+
+# ==================== daemon 客户端：在导入 pandas 之前把命令转发给常驻进程 ====================
+
+# 转发给常驻进程执行的命令
+DAEMON_COMMANDS = ("scout", "auto", "clean", "export")
+# socket 所在目录：EXCEL_TOOL_DAEMON_DIR 覆盖，默认与解析缓存同目录
+DAEMON_DIR = os.environ.get("EXCEL_TOOL_DAEMON_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "excel-lite-cli")
+
+
+def _daemon_socket_path():
+    return os.path.join(DAEMON_DIR, "daemon.sock")
+
+
+def _daemon_connect(wait=0.0):
+    """连接常驻进程，wait 秒内重试；连不上抛 OSError"""
+    deadline = time.monotonic() + wait
+    while True:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(_daemon_socket_path())
+            return conn
+        except OSError:
+            conn.close()
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+def _daemon_request(conn, request, out):
+    """发送请求，把返回的输出实时写到 out（二进制流），返回退出码。
+
+    返回按帧传输：b"O" + 4 字节长度 + UTF-8 输出；b"X" + 4 字节退出码表示结束。
+    """
+    conn.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+    reader = conn.makefile("rb")
+    sys.stdout.flush()
+    while True:
+        head = reader.read(5)
+        if len(head) < 5:
+            raise ConnectionError("常驻进程连接中断")
+        value = int.from_bytes(head[1:], "big", signed=True)
+        if head[:1] == b"X":
+            return value
+        out.write(reader.read(value))
+        out.flush()
+
+
+def _daemon_launch():
+    """后台启动常驻进程（脱离当前终端会话，输出丢弃）"""
+    import subprocess
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "daemon", "start", "--foreground"],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+
+def _daemon_forward(argv):
+    """把命令转发给常驻进程（未运行时先启动），返回退出码；用不了常驻进程时返回 None，由本进程执行"""
+    if not hasattr(socket, "AF_UNIX") or not argv or argv[0] not in DAEMON_COMMANDS:
+        return None
+    request = {"cmd": "run", "argv": argv, "cwd": os.getcwd(),
+               "env": {k: v for k, v in os.environ.items() if k.startswith("EXCEL_TOOL_")}}
+    try:
+        try:
+            conn = _daemon_connect()
+        except OSError:
+            _daemon_launch()
+            conn = _daemon_connect(wait=15)
+        with conn:
+            return _daemon_request(conn, request, sys.stdout.buffer)
+    except OSError as e:
+        print(f"[daemon] 常驻进程不可用（{e}），改为本进程执行", file=sys.stderr)
+        return None
+
+
+# ==================== 按需导入：help / steps-path / cache 等不读表的命令不加载 pandas ====================
+
+class _LazyModule:
+    """模块占位：首次访问属性时才导入，并把模块级同名变量换成真正的模块（之后不再经过占位）"""
+
+    def __init__(self, name, alias):
+        self._name = name
+        self._alias = alias
 
-import pandas as pd
+    def _load(self):
+        module = importlib.import_module(self._name)
+        globals()[self._alias] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+np = _LazyModule("numpy", "np")
+pd = _LazyModule("pandas", "pd")
+pl = _LazyModule("polars", "pl")  # 可选：--backend polars 时才用
+
+
+def _import_now(*modules):
+    """立即导入仍是占位的模块（daemon 启动时预热）"""
+    for module in modules:
+        if isinstance(module, _LazyModule):
+            module._load()
 
 # ==================== 引擎检测（仅用于读取原始结构）====================
 
+# None 表示未指定：首次读取时才检测，且只查找是否安装，真正打开工作簿时才导入
 READ_ENGINE = None
 
-try:
-    import win32com.client
-    READ_ENGINE = "pywin32"
-except ImportError:
-    pass
+READ_ENGINES = ("pywin32", "openpyxl", "xml")
 
-if READ_ENGINE is None:
-    try:
+openpyxl = MergedCell = win32com = None
+
+
+def _read_engine():
+    """当前读取引擎；未指定时按 pywin32 → openpyxl → xml 检测可用的第一个"""
+    global READ_ENGINE
+    if READ_ENGINE is None:
+        if importlib.util.find_spec("win32com") is not None:
+            READ_ENGINE = "pywin32"
+        elif importlib.util.find_spec("openpyxl") is not None:
+            READ_ENGINE = "openpyxl"
+        else:
+            # 两者都没有时退回标准库实现的 xml 引擎（仅支持 .xlsx/.xlsm）
+            READ_ENGINE = "xml"
+    return READ_ENGINE
+
+
+def _import_engine(name):
+    """导入引擎依赖（xml 引擎无依赖），缺失时抛 ImportError"""
+    global openpyxl, MergedCell, win32com
+    if name == "pywin32" and win32com is None:
+        import win32com.client
+    elif name == "openpyxl" and openpyxl is None:
         import openpyxl
         from openpyxl.cell.cell import MergedCell
-        READ_ENGINE = "openpyxl"
+
+
+def _set_read_engine(name):
+    """切换读取引擎（--engine / EXCEL_TOOL_ENGINE），立即检查依赖是否可用"""
+    global READ_ENGINE
+    if name not in READ_ENGINES:
+        print(f"错误：未知引擎 '{name}'，可用: {', '.join(READ_ENGINES)}")
+        sys.exit(1)
+    try:
+        _import_engine(name)
     except ImportError:
-        print("错误：需要安装 pywin32（Windows）或 openpyxl（跨平台）")
+        print(f"错误：引擎 {name} 需要安装 {name}")
         sys.exit(1)
+    READ_ENGINE = name
 
 # ==================== 路径与配置 ====================
 
@@ -52,11 +199,233 @@ def get_steps_prefix(excel_path):
 
 def discover_steps_files(excel_path):
     """发现该 Excel 关联的所有 .excel-steps.json 文件"""
-    import glob
     pattern = get_steps_pattern(excel_path)
     return sorted(glob.glob(pattern))
 
 
+# ==================== 环境变量设置（导入时读取；常驻进程按每条命令客户端的环境重新读取）====================
+
+def _load_env_settings():
+    """从 EXCEL_TOOL_* 环境变量读取各项设置到模块全局变量（命令行参数随后覆盖）"""
+    global CACHE_DIR, CACHE_MAX_BYTES, CACHE_ENABLED, CACHE_USE_HASH, JOBS, CATEGORY_MIN_ROWS, \
+        CATEGORY_MAX_RATIO, DEDUP_MEMORY, CHUNK_ROWS, SPILL_DIR, EXPORT_CHUNK_ROWS
+    # 缓存目录：EXCEL_TOOL_CACHE_DIR 覆盖，默认 ~/.cache/excel-lite-cli
+    CACHE_DIR = os.environ.get("EXCEL_TOOL_CACHE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".cache", "excel-lite-cli")
+    # 缓存总大小上限（MB），超出后按最近使用时间淘汰（LRU）
+    CACHE_MAX_BYTES = int(float(os.environ.get("EXCEL_TOOL_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+    # EXCEL_TOOL_NO_CACHE=1 或 --no-cache 关闭缓存
+    CACHE_ENABLED = os.environ.get("EXCEL_TOOL_NO_CACHE") != "1"
+    # EXCEL_TOOL_CACHE_HASH=1 或 --cache-hash：按内容哈希识别文件（文件被 touch、复制或改名后仍命中）
+    CACHE_USE_HASH = os.environ.get("EXCEL_TOOL_CACHE_HASH") == "1"
+    # 多 Sheet 并行读取的进程数（--jobs 优先）；未设置时按文件大小自动决定
+    JOBS = int(os.environ.get("EXCEL_TOOL_JOBS") or 0) or None
+    # 至少这么多行、且不同值不超过行数 CATEGORY_MAX_RATIO 的纯文本列，读入整表时转为分类类型
+    CATEGORY_MIN_ROWS = int(os.environ.get("EXCEL_TOOL_CATEGORY_MIN_ROWS") or 1000)
+    CATEGORY_MAX_RATIO = float(os.environ.get("EXCEL_TOOL_CATEGORY_RATIO") or 0.05)
+    # 分块 dedup 时摘要数组（每行 8 字节）的内存上限，超出后改为按摘要分区落盘
+    DEDUP_MEMORY = int(os.environ.get("EXCEL_TOOL_DEDUP_MB") or 512) * 2 ** 20
+    # clean 分块执行的每块行数（--chunk-size 优先）；未设置时整表在内存中执行
+    CHUNK_ROWS = int(os.environ.get("EXCEL_TOOL_CHUNK_ROWS") or 0) or None
+    # 落盘目录，默认系统临时目录；每次命令建一个子目录，结束时删除
+    SPILL_DIR = os.environ.get("EXCEL_TOOL_SPILL_DIR") or None
+    # 导出时每块行数；内存中同时只有一块
+    EXPORT_CHUNK_ROWS = CHUNK_ROWS or 50000
+
+
+_load_env_settings()
+
+
+# ==================== 解析缓存（按工作簿指纹缓存清洗后的 DataFrame）====================
+
+# 缓存目录 CACHE_DIR、容量上限 CACHE_MAX_BYTES、开关 CACHE_ENABLED / CACHE_USE_HASH 见 _load_env_settings
+# 缓存格式版本，读取/清洗逻辑变化时递增，使旧缓存自动失效
+CACHE_VERSION = 2
+# 常驻进程（daemon）内存缓存上限（MB），按最近使用淘汰；普通命令行进程不启用内存缓存
+MEMORY_CACHE_MAX_BYTES = int(float(os.environ.get("EXCEL_TOOL_DAEMON_CACHE_MB", "512")) * 1024 * 1024)
+# 内存缓存：键 → (对象, 字节数)，daemon 启动时创建
+_memory_cache = None
+# 缓存命中统计（daemon status 用）
+_cache_stats = {"memory": 0, "disk": 0, "miss": 0}
+
+
+def _file_fingerprint(file_path):
+    """工作簿指纹：路径 + 大小 + mtime；开启内容哈希时只用大小 + sha256（与路径无关，
+    复制、改名后仍命中；缓存条目的 JSON 元数据仍记录写入时的路径，供 cache clear <文件> 使用）"""
+    abs_path = os.path.abspath(file_path)
+    st = os.stat(abs_path)
+    if CACHE_USE_HASH:
+        h = hashlib.sha256()
+        with open(abs_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return {"size": st.st_size, "sha256": h.hexdigest()}
+    return {"path": abs_path, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _cache_key(fingerprint, kind, **parts):
+    """由指纹 + 缓存类型 + 附加参数生成缓存键"""
+    payload = {"v": CACHE_VERSION, "pandas": pd.__version__,
+               "file": fingerprint, "kind": kind, **parts}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _cache_paths(key):
+    return (os.path.join(CACHE_DIR, f"{key}.pkl"),
+            os.path.join(CACHE_DIR, f"{key}.json"))
+
+
+def _cache_load(key):
+    """读取缓存，未命中返回 None；命中时刷新 mtime 作为 LRU 时间戳"""
+    if not CACHE_ENABLED:
+        return None
+    if _memory_cache is not None and key in _memory_cache:
+        _memory_cache.move_to_end(key)
+        _cache_stats["memory"] += 1
+        return _memory_copy(_memory_cache[key][0])
+    data_path, _ = _cache_paths(key)
+    try:
+        with open(data_path, "rb") as f:
+            obj = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        _cache_stats["miss"] += 1
+        return None
+    try:
+        os.utime(data_path)
+    except OSError:
+        pass
+    _cache_stats["disk"] += 1
+    _memory_put(key, obj)
+    return obj
+
+
+def _cache_has(key):
+    """缓存中是否有这个键（不读取内容）"""
+    if not CACHE_ENABLED:
+        return False
+    return (_memory_cache is not None and key in _memory_cache) or os.path.exists(_cache_paths(key)[0])
+
+
+def _cache_store(key, obj, meta):
+    """写入缓存（先写临时文件再原子替换），写入后按总大小淘汰"""
+    if not CACHE_ENABLED:
+        return
+    _memory_put(key, obj)
+    data_path, meta_path = _cache_paths(key)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{data_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, data_path)
+        meta = dict(meta, key=key, bytes=os.path.getsize(data_path), created=time.time())
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+    except OSError:
+        # 缓存只是加速手段，写失败（只读目录、磁盘满）不影响主流程
+        return
+    _cache_evict(CACHE_MAX_BYTES)
+
+
+def _memory_copy(obj):
+    # 调用方会就地修改取到的 DataFrame，内存缓存存取都用副本
+    return obj.copy() if isinstance(obj, pd.DataFrame) else copy.deepcopy(obj)
+
+
+def _memory_put(key, obj):
+    """放入内存缓存（仅 daemon 中启用），超出上限时淘汰最久未用的条目"""
+    if _memory_cache is None:
+        return
+    obj = _memory_copy(obj)
+    if isinstance(obj, pd.DataFrame):
+        size = int(obj.memory_usage(deep=True).sum())
+    else:
+        size = len(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+    _memory_cache.pop(key, None)
+    _memory_cache[key] = (obj, size)
+    total = sum(size for _, size in _memory_cache.values())
+    while total > MEMORY_CACHE_MAX_BYTES and len(_memory_cache) > 1:
+        _, (_, size) = _memory_cache.popitem(last=False)
+        total -= size
+
+
+def _cache_entries():
+    """列出所有缓存条目（含元信息、大小、最近使用时间），按最近使用时间升序"""
+    entries = []
+    if not os.path.isdir(CACHE_DIR):
+        return entries
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".pkl"):
+            continue
+        key = name[:-4]
+        data_path, meta_path = _cache_paths(key)
+        try:
+            st = os.stat(data_path)
+        except OSError:
+            continue
+        meta = {}
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            pass
+        meta.update(key=key, bytes=st.st_size, last_used=st.st_mtime)
+        entries.append(meta)
+    entries.sort(key=lambda e: e["last_used"])
+    return entries
+
+
+def _cache_remove(key):
+    for p in _cache_paths(key):
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+
+def _cache_evict(max_bytes):
+    """LRU 淘汰：总大小超过上限时，从最久未使用的条目开始删除"""
+    entries = _cache_entries()
+    total = sum(e["bytes"] for e in entries)
+    removed = 0
+    for e in entries:
+        if total <= max_bytes:
+            break
+        _cache_remove(e["key"])
+        total -= e["bytes"]
+        removed += 1
+    return removed
+
+
+def do_cache(action="list", file_path=None):
+    """cache 命令：查看 / 清理解析缓存"""
+    entries = _cache_entries()
+    if file_path:
+        abs_path = os.path.abspath(file_path)
+        entries = [e for e in entries if e.get("file") == abs_path]
+
+    if action == "clear":
+        for e in entries:
+            _cache_remove(e["key"])
+        scope = os.path.basename(file_path) if file_path else "全部"
+        print(f"[缓存] 已清理 {scope}: {len(entries)} 条, "
+              f"{sum(e['bytes'] for e in entries) / 1024 / 1024:.1f} MB")
+        return
+
+    total = sum(e["bytes"] for e in entries)
+    print(f"[缓存目录] {CACHE_DIR}")
+    print(f"[容量] {total / 1024 / 1024:.1f} MB / 上限 {CACHE_MAX_BYTES / 1024 / 1024:.0f} MB, "
+          f"{len(entries)} 条{'' if CACHE_ENABLED else '（当前已禁用）'}")
+    for e in reversed(entries):
+        used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e["last_used"]))
+        sheet = f" [{e['sheet']}]" if e.get("sheet") else ""
+        if e.get("step"):
+            sheet += f" 前 {e['step']} 步"
+        print(f"  {e.get('kind', '?'):<7}{os.path.basename(e.get('file', '?'))}{sheet}  "
+              f"{e['bytes'] / 1024:.0f} KB  最近使用 {used}")
+    if entries:
+        print(f"\n[清理] python {TOOL_PATH} cache clear [文件]")
 
 
 # ==================== 文本统一清洗 ====================
@@ -80,28 +449,827 @@ def _clean_text(val):
     return s.strip()
 
 
-# ==================== 侦察：openpyxl / pywin32（需要看原始单元格）====================
-
-def scout_pywin32(file_path, rows):
-    excel = win32com.client.Dispatch("Excel.Application")
-    excel.Visible = False
-    excel.DisplayAlerts = False
+# 整列向量化清洗用的替换表：零宽字符→删除，控制字符/特殊空白→空格（逐个转空格后再合并连续空格，
+# 结果与 _clean_text 的"整段替换为一个空格"相同）。逐字符 str.replace 比 str.translate 快一个数量级
+_CLEAN_REPLACEMENTS = ([(ch, "") for ch in "\u200b\u200c\u200d\u200e\u200f\u2060\ufeff"]
+                       + [(ch, " ") for ch in "\r\n\t\x0b\x0c\xa0\u3000"])
+# 整列是否需要清洗：用 \x00 拼接后一次正则扫描，查脏字符、连续空格、任一值的首尾空白
+_RE_NEEDS_CLEAN = re.compile(
+    r"[\u200b-\u200f\u2060\ufeff\r\n\t\x0b\x0c\xa0\u3000]| {2}|(?:^|\x00)\s|\s(?:\x00|$)")
+# 清洗后视为空值的文本
+_NULL_TOKENS = ["None", "nan", ""]
+
+
+# ==================== xml 引擎：直接流式解析 xlsx 内部 XML（不创建 openpyxl 单元格对象）====================
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# 内置日期/时间数字格式 ID（14-22、45-47 及中日韩区域格式 27-36、50-58）
+_BUILTIN_DATE_FMTS = set(range(14, 23)) | set(range(27, 37)) | {45, 46, 47} | set(range(50, 59))
+_BUILTIN_TIMEDELTA_FMTS = {46}
+# 去掉引号内文字和方括号区域设置（保留 [h] [mm] [ss]），与 openpyxl 的判定规则一致
+_RE_FMT_STRIP = re.compile(r'".*?"|\[(?!hh?\]|mm?\]|ss?\])[^\]]*\]')
+_RE_FMT_DATE = re.compile(r"(?<![_\\])[dmhysDMHYS]")
+_RE_FMT_TIMEDELTA = re.compile(r"\[hh?\](:mm(:ss(\.0*)?)?)?|\[mm?\](:ss(\.0*)?)?|\[ss?\](\.0*)?", re.I)
+_RE_CELL_REF = re.compile(r"([A-Z]+)(\d+)")
+# <mergeCells> 在 <sheetData> 之后；标签可能带命名空间前缀（如 <x:mergeCell>）
+_RE_MERGE_START = re.compile(rb"<(?:[\w.-]+:)?mergeCells\b")
+_RE_MERGE_REF = re.compile(rb'<(?:[\w.-]+:)?mergeCell\b[^>]*?\bref="([^"]+)"')
+
+
+def _col_index(letters):
+    """列字母 → 1-based 列号（A→1, AA→27）"""
+    n = 0
+    for ch in letters:
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _parse_ref(ref):
+    """单元格引用 → (行, 列)，如 B3 → (3, 2)"""
+    m = _RE_CELL_REF.match(ref.replace("$", ""))
+    return (int(m.group(2)), _col_index(m.group(1))) if m else (None, None)
+
+
+def _excel_serial_to_datetime(value, date1904=False, timedelta=False):
+    """Excel 序列号 → datetime/time/timedelta（与 openpyxl.utils.datetime.from_excel 一致）"""
+    import datetime as dt
+    if timedelta:
+        td = dt.timedelta(days=value)
+        if td.microseconds:
+            td = dt.timedelta(seconds=td.total_seconds() // 1, microseconds=round(td.microseconds, -3))
+        return td
+    day, fraction = divmod(value, 1)
+    diff = dt.timedelta(milliseconds=round(fraction * 86400 * 1000))
+    if 0 <= value < 1 and diff.days == 0:
+        secs = diff.seconds
+        return dt.time(secs // 3600, secs // 60 % 60, secs % 60, diff.microseconds)
+    if date1904:
+        return dt.datetime(1904, 1, 1) + dt.timedelta(days=day) + diff
+    if 0 < value < 60:
+        day += 1
+    return dt.datetime(1899, 12, 30) + dt.timedelta(days=day) + diff
+
+
+class _XlsxReader:
+    """xlsx 流式读取器：zip 内 XML 增量解析，逐行产出纯值元组。
+
+    只解析需要的部件：workbook.xml（Sheet 列表）、sharedStrings.xml 和 styles.xml
+    （首次读取单元格时加载），以及被读取的 worksheet XML。
+    """
+
+    def __init__(self, file_path):
+        import zipfile
+        self.zf = zipfile.ZipFile(file_path)
+        self._shared_strings = None
+        self._date_styles = None
+        self._sheets = {}
+        self._dimensions = {}
+        self._load_workbook()
+
+    # ---- 工作簿结构 ----
+
+    def _part_rels(self, part):
+        """读取某个部件的关系文件，返回 {Id: (Type, 目标路径)}"""
+        import posixpath
+        import xml.etree.ElementTree as ET
+        base, name = posixpath.split(part)
+        rels_path = posixpath.join(base, "_rels", name + ".rels")
+        if rels_path not in self.zf.namelist():
+            return {}
+        rels = {}
+        for rel in ET.fromstring(self.zf.read(rels_path)).iter(f"{{{_NS_PKG_REL}}}Relationship"):
+            target = rel.get("Target", "")
+            if target.startswith("/"):
+                target = target.lstrip("/")
+            else:
+                target = posixpath.normpath(posixpath.join(base, target))
+            rels[rel.get("Id")] = (rel.get("Type", ""), target)
+        return rels
+
+    def _load_workbook(self):
+        import xml.etree.ElementTree as ET
+        wb_part = "xl/workbook.xml"
+        for rel_type, target in self._part_rels("").values():
+            if rel_type.endswith("/officeDocument"):
+                wb_part = target
+        root = ET.fromstring(self.zf.read(wb_part))
+        ns = root.tag[1:].split("}")[0] if root.tag.startswith("{") else _NS_MAIN
+        self._ns = ns
+        pr = root.find(f"{{{ns}}}workbookPr")
+        self.date1904 = pr is not None and pr.get("date1904") in ("1", "true")
+        rels = self._part_rels(wb_part)
+        self._styles_part = self._sst_part = None
+        for rel_type, target in rels.values():
+            if rel_type.endswith("/sharedStrings"):
+                self._sst_part = target
+            elif rel_type.endswith("/styles"):
+                self._styles_part = target
+        sheets_el = root.find(f"{{{ns}}}sheets")
+        for sh in (sheets_el if sheets_el is not None else []):
+            rid = sh.get(f"{{{_NS_REL}}}id") or sh.get("{http://purl.oclc.org/ooxml/officeDocument/relationships}id")
+            rel_type, target = rels.get(rid, ("", None))
+            if target and rel_type.endswith("/worksheet"):
+                self._sheets[sh.get("name")] = target
+
+    @property
+    def sheet_names(self):
+        return list(self._sheets)
+
+    def _load_shared_strings(self):
+        import xml.etree.ElementTree as ET
+        strings = []
+        if self._sst_part and self._sst_part in self.zf.namelist():
+            si_tag, t_tag, r_tag = (f"{{{self._ns}}}si", f"{{{self._ns}}}t", f"{{{self._ns}}}r")
+            with self.zf.open(self._sst_part) as src:
+                for _, el in ET.iterparse(src):
+                    if el.tag == si_tag:
+                        strings.append(self._rich_text(el, t_tag, r_tag))
+                        el.clear()
+        self._shared_strings = strings
+
+    @staticmethod
+    def _rich_text(el, t_tag, r_tag):
+        """<si>/<is> 的纯文本：直接 <t> + 富文本片段 <r><t>（忽略注音 <rPh>）"""
+        parts = []
+        for child in el:
+            if child.tag == t_tag:
+                parts.append(child.text or "")
+            elif child.tag == r_tag:
+                t = child.find(t_tag)
+                if t is not None:
+                    parts.append(t.text or "")
+        return "".join(parts).replace("x005F_", "")
+
+    def _load_styles(self):
+        """按 cellXfs 顺序标记哪些样式索引是日期 / 时长格式"""
+        import xml.etree.ElementTree as ET
+        date_styles, timedelta_styles = set(), set()
+        if self._styles_part and self._styles_part in self.zf.namelist():
+            ns = self._ns
+            root = ET.fromstring(self.zf.read(self._styles_part))
+            custom = {}
+            fmts = root.find(f"{{{ns}}}numFmts")
+            for fmt in (fmts if fmts is not None else []):
+                custom[int(fmt.get("numFmtId"))] = fmt.get("formatCode", "")
+            xfs = root.find(f"{{{ns}}}cellXfs")
+            for idx, xf in enumerate(xfs if xfs is not None else []):
+                fmt_id = int(xf.get("numFmtId", 0))
+                if fmt_id in custom:
+                    code = custom[fmt_id].split(";")[0]
+                    if _RE_FMT_DATE.search(_RE_FMT_STRIP.sub("", code)):
+                        date_styles.add(idx)
+                        if _RE_FMT_TIMEDELTA.search(code):
+                            timedelta_styles.add(idx)
+                elif fmt_id in _BUILTIN_DATE_FMTS:
+                    date_styles.add(idx)
+                    if fmt_id in _BUILTIN_TIMEDELTA_FMTS:
+                        timedelta_styles.add(idx)
+        self._date_styles = date_styles
+        self._timedelta_styles = timedelta_styles
+
+    def dimension(self, sheet_name):
+        """读取 <dimension ref>，返回 (min_row, min_col, max_row, max_col)；缺失时返回 None。
+
+        只解析到 <sheetData> 开始为止，不读取单元格数据。
+        """
+        if sheet_name in self._dimensions:
+            return self._dimensions[sheet_name]
+        import xml.etree.ElementTree as ET
+        dim_tag, data_tag = f"{{{self._ns}}}dimension", f"{{{self._ns}}}sheetData"
+        result = None
+        with self.zf.open(self._sheets[sheet_name]) as src:
+            for _, el in ET.iterparse(src, events=("start",)):
+                if el.tag == dim_tag:
+                    ref = el.get("ref", "")
+                    first, _, last = ref.partition(":")
+                    r1, c1 = _parse_ref(first)
+                    r2, c2 = _parse_ref(last) if last else (r1, c1)
+                    if r1 is not None and r2 is not None:
+                        result = (r1, c1, r2, c2)
+                    break
+                if el.tag == data_tag:
+                    break
+        self._dimensions[sheet_name] = result
+        return result
+
+    def used_extent(self, sheet_name):
+        """实际有值的范围 (min_row, min_col, max_row, max_col)；工作表没有任何值时返回 None。
+
+        只带样式的单元格（没有 <v> / 内联文本）和空行不计入。扫描整个工作表 XML，但不转换单元格的值。
+        """
+        import pyexpat
+        ns = self._ns
+        ROW, C, V, T = (f"{ns} {tag}" for tag in ("row", "c", "v", "t"))
+        extent = [None, None, 0, 0]
+        row_num = col = 0
+        has_value = collecting = False
+
+        def start(name, attrs):
+            nonlocal row_num, col, has_value, collecting
+            if name == C:
+                ref = attrs.get("r")
+                col = _col_index(ref.rstrip("0123456789")) if ref else col + 1
+                has_value = False
+            elif name == V or name == T:
+                collecting = True
+            elif name == ROW:
+                r = attrs.get("r")
+                row_num = int(r) if r else row_num + 1
+                col = 0
+
+        def chars(data):
+            nonlocal has_value
+            if collecting and data:
+                has_value = True
+
+        def end(name):
+            nonlocal collecting
+            if name == V or name == T:
+                collecting = False
+            elif name == C and has_value:
+                if extent[0] is None:
+                    extent[0] = row_num
+                extent[1] = col if extent[1] is None else min(extent[1], col)
+                extent[2] = row_num
+                extent[3] = max(extent[3], col)
+
+        parser = pyexpat.ParserCreate(namespace_separator=" ")
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = chars
+        with self.zf.open(self._sheets[sheet_name]) as src:
+            parser.ParseFile(src)
+        return tuple(extent) if extent[0] is not None else None
+
+    def merged_ranges(self, sheet_name):
+        """<mergeCells> 中的合并区域 [(min_row, min_col, max_row, max_col), ...]。
+
+        <mergeCells> 位于 <sheetData> 之后：按块解压，只在字节串里查找起始标签，找到后才取各区域的 ref，
+        单元格数据不解析。
+        """
+        tail = b""
+        with self.zf.open(self._sheets[sheet_name]) as src:
+            while True:
+                chunk = src.read(1 << 20)
+                if not chunk:
+                    return []
+                buf = tail + chunk
+                m = _RE_MERGE_START.search(buf)
+                if m:
+                    rest = buf[m.start():] + src.read()
+                    break
+                tail = buf[-64:]
+        ranges = []
+        for ref in _RE_MERGE_REF.findall(rest):
+            first, _, last = ref.decode("ascii").partition(":")
+            r1, c1 = _parse_ref(first)
+            r2, c2 = _parse_ref(last) if last else (r1, c1)
+            if r1 is not None and r2 is not None:
+                ranges.append((r1, c1, r2, c2))
+        return ranges
+
+    # ---- 单元格数据 ----
+
+    def iter_rows(self, sheet_name, min_row=1, max_row=None, max_col=None):
+        """逐行产出值元组（从 A 列开始，按 max_col 补齐/截断），缺失的中间行产出空元组。
+
+        用 expat 增量解析（每次喂 64KB），不构建元素树；取值规则与 openpyxl 只读模式的
+        iter_rows(values_only=True) 一致：共享字符串、内联字符串、数字（含 . 或 E 为 float，
+        否则 int）、布尔、错误值，日期样式的数字转 datetime。
+        """
+        import datetime
+        import pyexpat
+        if self._shared_strings is None:
+            self._load_shared_strings()
+        if self._date_styles is None:
+            self._load_styles()
+        sst = self._shared_strings
+        date_styles, timedelta_styles, date1904 = self._date_styles, self._timedelta_styles, self.date1904
+        ns = self._ns
+        ROW, C, V, IS, T, RPH = (f"{ns} {tag}" for tag in ("row", "c", "v", "is", "t", "rPh"))
+        col_cache = {}
+
+        parser = pyexpat.ParserCreate(namespace_separator=" ")
+        parser.buffer_text = True
+        done = []  # 本批解析完成的 (行号, {列号: 值})
+        row_num = 0
+        cells = None
+        col = 0
+        ctype = cstyle = None
+        text = None
+        collecting = in_is = in_rph = False
+
+        def start(name, attrs):
+            nonlocal row_num, cells, col, ctype, cstyle, text, collecting, in_is, in_rph
+            if name == C:
+                ref = attrs.get("r")
+                if ref:
+                    letters = ref.rstrip("0123456789")
+                    c = col_cache.get(letters)
+                    if c is None:
+                        c = col_cache[letters] = _col_index(letters)
+                    col = c
+                else:
+                    col += 1
+                ctype = attrs.get("t")
+                cstyle = attrs.get("s")
+                text = None
+            elif name == V:
+                collecting = True
+                text = ""
+            elif name == ROW:
+                r = attrs.get("r")
+                row_num = int(r) if r else row_num + 1
+                cells = {}
+                col = 0
+            elif name == IS:
+                in_is = True
+                text = ""
+            elif name == T:
+                collecting = in_is and not in_rph
+            elif name == RPH:
+                in_rph = True
+
+        def chars(data):
+            nonlocal text
+            if collecting:
+                text += data
+
+        def end(name):
+            nonlocal collecting, in_is, in_rph
+            if name == V or name == T:
+                collecting = False
+            elif name == C:
+                value = text
+                if value and not in_is:
+                    if ctype is None or ctype == "n":
+                        value = float(value) if ("." in value or "E" in value or "e" in value) else int(value)
+                        if cstyle and int(cstyle) in date_styles:
+                            try:
+                                value = _excel_serial_to_datetime(
+                                    value, date1904, timedelta=int(cstyle) in timedelta_styles)
+                            except (OverflowError, ValueError):
+                                value = "#VALUE!"
+                    elif ctype == "s":
+                        value = sst[int(value)]
+                    elif ctype == "b":
+                        value = value == "1" or value == "true"
+                    elif ctype == "d":
+                        value = datetime.datetime.fromisoformat(value.rstrip("Z"))
+                elif in_is:
+                    value = value.replace("x005F_", "")
+                    in_is = False
+                else:
+                    value = None
+                # 无值单元格也占位，行宽与 openpyxl 一致（到该行最后一个 <c>）
+                cells[col] = value
+            elif name == ROW:
+                done.append((row_num, cells))
+            elif name == RPH:
+                in_rph = False
+
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = chars
+
+        empty_row = (None,) * max_col if max_col else ()
+        next_row = min_row
+        with self.zf.open(self._sheets[sheet_name]) as src:
+            while True:
+                chunk = src.read(1 << 16)
+                parser.Parse(chunk, not chunk)
+                for idx, row_cells in done:
+                    if idx < min_row:
+                        continue
+                    if max_row is not None and idx > max_row:
+                        return
+                    while next_row < idx:
+                        next_row += 1
+                        yield empty_row
+                    next_row = idx + 1
+                    width = max_col or (max(row_cells) if row_cells else 0)
+                    yield tuple([row_cells.get(i) for i in range(1, width + 1)])
+                done.clear()
+                if not chunk:
+                    break
+
+    def close(self):
+        self.zf.close()
+
+
+def scout_xml(session, rows, names):
+    """xml 引擎侦察：范围取自 <dimension>，只解析每个 Sheet 的前 rows 行。
+
+    预览行只到各行最后一个有值的单元格，不按声明的范围补齐（范围可能被格式刷等撑到整张表）。
+    """
+    reader = session.open()
     result = {}
+    with session.timed("scout"):
+        for name in names:
+            dim = reader.dimension(name)
+            if dim is None:
+                # 没有 <dimension> 时扫描一遍得到实际范围
+                dim = reader.used_extent(name) or (1, 1, 0, 0)
+            min_row, min_col, total_rows, total_cols = dim
+            lines = []
+            for row in reader.iter_rows(name, min_row=min_row,
+                                        max_row=min(min_row + rows - 1, total_rows)):
+                cells = []
+                for v in row:
+                    val = _clean_text(v)
+                    cells.append(val if val else "[空]")
+                lines.append(cells)
+            lines = _trim_preview(lines)
+            result[name] = {
+                "total_rows": total_rows, "total_cols": total_cols,
+                "start_row": min_row, "start_col": min_col,
+                "used_cols": len(lines[0]) if lines else 0,
+                "preview": lines
+            }
+    return result
+
+
+# ==================== 性能剖析：--profile 按阶段 / 步骤记录耗时、行数和内存 ====================
+
+# EXCEL_TOOL_PROFILE=1 等同 --profile，设为文件路径时同时写出（daemon 执行的命令和 batch 子进程同样生效）
+_profiler = None
+
+
+class _Profiler:
+    """记录一条命令各阶段（打开、侦察、推断配置、读取、清洗字符、各清洗步骤、写出）的
+    墙钟时间、CPU 时间、行数变化和内存。
+
+    内存两项：tracemalloc 统计的 Python 分配峰值（含 numpy / pandas 数组），进程 RSS（结束时 / 历史峰值）。
+    阶段可以嵌套（如侦察里打开工作簿），内层的分配峰值计入外层。CPU 时间是本进程所有线程之和，
+    不含子进程；并行子进程的记录由 merge 并入，按进程号区分。
+    """
+
+    def __init__(self, output=None):
+        import tracemalloc
+        self.output = output
+        self.records = []
+        self.origin = time.time()
+        self._tracemalloc = tracemalloc
+        self._peaks = []  # 外层各阶段在内层重置峰值之前见到的分配峰值
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+
+    def close(self):
+        """停止由本剖析器开启的 tracemalloc（daemon 中后续命令不再承担追踪开销）"""
+        if self._started:
+            self._tracemalloc.stop()
+            self._started = False
+
+    @contextmanager
+    def span(self, name, kind="phase", rows_in=None):
+        """记录一段执行；yield 出的记录可以补填 rows_out"""
+        tm = self._tracemalloc
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], tm.get_traced_memory()[1])
+        tm.reset_peak()
+        self._peaks.append(0)
+        record = {"name": name, "kind": kind, "depth": len(self._peaks) - 1, "pid": os.getpid(),
+                  "rows_in": rows_in, "rows_out": None}
+        record["ts"], wall, cpu = time.time(), time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            peak = max(self._peaks.pop(), tm.get_traced_memory()[1])
+            rss = _rss_mb()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            record.update(wall=time.perf_counter() - wall, cpu=time.process_time() - cpu,
+                          py_peak_mb=peak / (1024 * 1024), rss_mb=rss,
+                          max_rss_mb=max(rss or 0, _peak_memory_mb() or 0) or None)
+            self.records.append(record)
+
+    def merge(self, records, depth=0):
+        """并入子进程的记录（时间戳同为 time.time()，可直接排在一条时间线上）"""
+        for record in records:
+            self.records.append(dict(record, depth=record["depth"] + depth))
+
+    def ordered(self):
+        """本进程的记录在前，子进程的记录按进程分组，组内按开始时间"""
+        main = os.getpid()
+        return sorted(self.records, key=lambda r: (r["pid"] != main, r["pid"], r["ts"], r["depth"]))
+
+    def report(self):
+        print(f"\n[性能剖析] 墙钟 / CPU 单位秒，内存单位 MB（Py峰值: tracemalloc 分配峰值；RSS: 结束时 / 进程峰值）")
+        print("     墙钟     CPU       行数(入→出)   Py峰值           RSS  阶段")  # 按显示宽度对齐下面各列
+        main = os.getpid()
+        for r in self.ordered():
+            rows = ""
+            if r["rows_in"] is not None or r["rows_out"] is not None:
+                rows = f"{_fmt_rows(r['rows_in'])}→{_fmt_rows(r['rows_out'])}"
+            rss = f"{_fmt_mb(r['rss_mb'])} / {_fmt_mb(r['max_rss_mb'])}"
+            proc = "" if r["pid"] == main else f"  [进程 {r['pid']}]"
+            print(f"  {r['wall']:7.3f} {r['cpu']:7.3f} {rows:>17} {r['py_peak_mb']:8.1f} {rss:>13}  "
+                  f"{'  ' * r['depth']}{r['name']}{proc}")
+        if any(r["pid"] != main for r in self.records):
+            return  # 有并行子进程时各阶段在时间上重叠，不计算余量
+        for r in self.records:
+            if r["kind"] == "command":
+                inner = sum(c["wall"] for c in self.records if c["depth"] == 1 and c["pid"] == main)
+                print(f"[性能剖析] 未归入以上阶段 {max(r['wall'] - inner, 0):.3f}s（导入库、加载规则、打印预览等）；"
+                      f"开启剖析时 tracemalloc 会拖慢 Python 分配，总耗时偏高")
+
+    def write(self, path):
+        """路径以 .trace / .trace.json 结尾时写 Chrome trace 格式（chrome://tracing、Perfetto 可打开），
+        否则写记录列表 JSON（便于多次运行对比）"""
+        lower = path.lower()
+        records = self.ordered()
+        if lower.endswith(".trace") or lower.endswith(".trace.json"):
+            events = [{"name": r["name"], "cat": r["kind"], "ph": "X", "pid": r["pid"], "tid": r["pid"],
+                       "ts": round((r["ts"] - self.origin) * 1e6), "dur": round(r["wall"] * 1e6),
+                       "args": {k: r[k] for k in ("cpu", "rows_in", "rows_out", "py_peak_mb", "rss_mb", "max_rss_mb")}}
+                      for r in records]
+            data = {"traceEvents": events, "displayTimeUnit": "ms"}
+        else:
+            data = {"started": self.origin,
+                    "records": [dict(r, start=r["ts"] - self.origin) for r in records]}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        print(f"[性能剖析] 已写出 {path}")
+
+
+@contextmanager
+def _profiled(name, kind="phase", rows_in=None):
+    """未开启剖析时不做任何记录；yield 出的 dict 可填 rows_out"""
+    if _profiler is None:
+        yield {}
+    else:
+        with _profiler.span(name, kind, rows_in) as record:
+            yield record
+
+
+def _profile_start(setting):
+    """按 --profile / EXCEL_TOOL_PROFILE 开启：None、""（未设置）、"0" 不开启，"1" 只打印表格，其余视为输出路径"""
+    global _profiler
+    if _profiler is not None:
+        _profiler.close()
+    if setting is None or setting == "0":
+        _profiler = None
+        return
+    _profiler = _Profiler(None if setting in ("", "1") else setting)
+
+
+def _profile_finish():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return
+    profiler.close()
+    if not profiler.records:
+        return
+    profiler.report()
+    if profiler.output:
+        profiler.write(profiler.output)
+
+
+def _frame_rows(df):
+    """行数；polars 后端查询中有增删行的步骤时返回 None（不为了统计而提前 collect）"""
+    return df._rows if isinstance(df, _PolarsFrame) else len(df)
+
+
+def _rss_mb():
+    """进程当前 RSS（MB），只在有 /proc 的平台上可取，其余返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def _fmt_rows(n):
+    return "?" if n is None else str(n)
+
+
+def _fmt_mb(mb):
+    return "-" if mb is None else f"{mb:.0f}"
+
+
+# ==================== 工作簿会话：一次命令只打开一次工作簿 ====================
+
+class WorkbookSession:
+    """一次命令内共享的工作簿句柄。
+
+    首次需要读取时才打开（全部命中缓存时不打开），侦察和各 Sheet 的读取共用同一句柄，
+    命令结束时关闭，并按阶段累计耗时。Sheet 列表只来自工作簿目录，不加载工作表。
+    """
+
+    _PHASE_NAMES = {"open": "打开", "scout": "侦察", "guess": "推断配置", "read": "读取", "normalize": "清洗字符"}
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.engine = _read_engine()
+        self.open_count = 0
+        self.scouted = 0
+        self.jobs = 1
+        self.timings = {}
+        self._handle = None
+        self._sheet_names = None
+        self.declared = {}  # openpyxl：各 Sheet 的 <dimension> 声明范围（取用工作表时记下后清除）
+
+    def open(self):
+        """返回引擎句柄：openpyxl 为 Workbook，pywin32 为 (Application, Workbook)，xml 为 _XlsxReader"""
+        if self._handle is None:
+            with self.timed("open"):
+                _import_engine(self.engine)
+                if self.engine == "xml":
+                    self._handle = _XlsxReader(self.file_path)
+                elif self.engine == "pywin32":
+                    excel = win32com.client.Dispatch("Excel.Application")
+                    excel.Visible = False
+                    excel.DisplayAlerts = False
+                    try:
+                        wb = excel.Workbooks.Open(os.path.abspath(self.file_path))
+                    except Exception:
+                        excel.Quit()
+                        raise
+                    self._handle = (excel, wb)
+                else:
+                    self._handle = openpyxl.load_workbook(self.file_path, read_only=True, data_only=True)
+            self.open_count += 1
+        return self._handle
+
+    def sheet_names(self):
+        """工作簿的 Sheet 名列表，只读 workbook.xml 不加载任何工作表（按工作簿指纹缓存）"""
+        if self._sheet_names is None:
+            key = _cache_key(_file_fingerprint(self.file_path), "sheets", engine=self.engine)
+            names = _cache_load(key)
+            if names is None:
+                handle = self.open()
+                if self.engine == "xml":
+                    names = handle.sheet_names
+                elif self.engine == "pywin32":
+                    _, wb = handle
+                    names = [wb.Sheets(i).Name for i in range(1, wb.Sheets.Count + 1)]
+                else:
+                    names = list(handle.sheetnames)
+                _cache_store(key, names, {"kind": "sheets", "file": os.path.abspath(self.file_path)})
+            self._sheet_names = names
+        return self._sheet_names
+
+    def close(self):
+        if self._handle is None:
+            return
+        if self.engine == "pywin32":
+            excel, wb = self._handle
+            try:
+                wb.Close(False)
+            finally:
+                excel.Quit()
+        else:
+            self._handle.close()
+        self._handle = None
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            with _profiled(self._PHASE_NAMES.get(phase, phase)):
+                yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0.0) + time.perf_counter() - start
+
+    def report(self):
+        """打印各阶段耗时；未做任何计时（如参数错误提前返回）时不输出"""
+        if not self.timings:
+            return
+        parts = [f"{self._PHASE_NAMES.get(k, k)} {v:.2f}s" for k, v in self.timings.items()]
+        scouted = ""
+        if self.scouted and self._sheet_names:
+            scouted = f"，侦察 {self.scouted}/{len(self._sheet_names)} 个 Sheet"
+        if self.jobs > 1:
+            scouted += f"，{self.jobs} 进程并行读取，读取耗时为各进程累计"
+        print(f"\n[耗时] {' | '.join(parts)}（工作簿打开 {self.open_count} 次{scouted}）")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        if exc_type is None:
+            self.report()
+        return False
+
+
+# 多 Sheet 并行读取的进程数 JOBS（EXCEL_TOOL_JOBS，--jobs 优先）见 _load_env_settings
+# 自动模式下小于该大小的工作簿串行读取（进程启动开销大于收益）
+_PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+
+def _resolve_jobs(session, count, jobs):
+    """并行读取的进程数：显式指定优先；自动时大文件且多 Sheet 才并行，pywin32 始终串行"""
+    jobs = jobs or JOBS
+    if session.engine == "pywin32" or count < 2:
+        return 1
+    if jobs is None:
+        if os.path.getsize(session.file_path) < _PARALLEL_MIN_BYTES:
+            return 1
+        jobs = os.cpu_count() or 1
+    return max(1, min(jobs, count))
+
+
+def _map_sheets(session, func, sheets, *args, jobs=None, announce=None):
+    """对多个 Sheet 执行 func(session, Sheet名, 配置, *args)，按 Sheet 顺序逐个产出 (Sheet名, 结果)。
+
+    并行时每个进程独立打开工作簿、只解析分到的 Sheet；进程内的输出按 Sheet 顺序转印，
+    耗时和打开次数累加到 session。announce(Sheet名) 在该 Sheet 的输出之前调用。
+    """
+    jobs = _resolve_jobs(session, len(sheets), jobs)
+    if jobs == 1:
+        for name, cfg in sheets.items():
+            if announce:
+                announce(name)
+            yield name, func(session, name, cfg, *args)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+    session.jobs = jobs
+    settings = _worker_settings()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_sheet_job, settings, session.file_path, func, name, cfg, *args)
+                   for name, cfg in sheets.items()]
+        for name, future in zip(sheets, futures):
+            result, output, timings, opens, records = future.result()
+            if announce:
+                announce(name)
+            print(output, end="")
+            for phase, seconds in timings.items():
+                session.timings[phase] = session.timings.get(phase, 0.0) + seconds
+            session.open_count += opens
+            if records and _profiler is not None:
+                _profiler.merge(records, depth=1)
+            yield name, result
+
+
+def _sheet_job(settings, file_path, func, sheet_name, sheet_cfg, *args):
+    """进程池任务：返回 (结果, 输出文本, 各阶段耗时, 工作簿打开次数, 剖析记录)"""
+    _apply_worker_settings(settings)
+    session = WorkbookSession(file_path)
+    out = io.StringIO()
     try:
-        wb = excel.Workbooks.Open(os.path.abspath(file_path))
-        for i in range(1, wb.Sheets.Count + 1):
-            ws = wb.Sheets(i)
+        with redirect_stdout(out), _profiled(f"Sheet {sheet_name}", "sheet"):
+            result = func(session, sheet_name, sheet_cfg, *args)
+    finally:
+        session.close()
+    return result, out.getvalue(), session.timings, session.open_count, _worker_profile(settings)
+
+
+def _worker_settings():
+    """命令行设置的全局开关，传给子进程（spawn 方式启动的子进程不继承）"""
+    return {"engine": _read_engine(), "cache": CACHE_ENABLED, "cache_hash": CACHE_USE_HASH,
+            "backend": PROCESS_BACKEND, "profile": _profiler is not None, "fill_merged": FILL_MERGED}
+
+
+def _apply_worker_settings(settings):
+    global CACHE_ENABLED, CACHE_USE_HASH, FILL_MERGED
+    if settings["engine"] != READ_ENGINE:
+        _set_read_engine(settings["engine"])
+    CACHE_ENABLED, CACHE_USE_HASH = settings["cache"], settings["cache_hash"]
+    FILL_MERGED = settings["fill_merged"]
+    if settings["backend"] != PROCESS_BACKEND:
+        _set_process_backend(settings["backend"])
+    # 进程池会复用子进程：每个任务重新开始记录，记录随结果交回主进程
+    _profile_start("1" if settings["profile"] else None)
+
+
+def _worker_profile(settings):
+    """子进程任务的剖析记录（主进程内执行时直接记在主进程的剖析器里，返回 None）"""
+    return _profiler.records if settings and _profiler is not None else None
+
+
+# ==================== 侦察：openpyxl / pywin32 / xml（需要看原始单元格）====================
+
+def scout_pywin32(session, rows, names):
+    _, wb = session.open()
+    result = {}
+    with session.timed("scout"):
+        for name in names:
+            ws = wb.Sheets(name)
             used = ws.UsedRange
             if used is None:
+                result[name] = {"total_rows": 0, "total_cols": 0,
+                                "start_row": 1, "start_col": 1, "preview": []}
                 continue
             total_rows = used.Rows.Count
             total_cols = used.Columns.Count
             start_row = used.Row
             start_col = used.Column
+            # UsedRange 含只设了格式的单元格，预览只取到最后一个有值的列
+            extent = _pywin32_used_extent(ws)
+            end_col = extent[3] if extent else start_col - 1
             lines = []
             for r in range(start_row, min(start_row + rows, start_row + total_rows)):
                 cells = []
-                for c in range(start_col, start_col + total_cols):
+                for c in range(start_col, end_col + 1):
                     cell = ws.Cells(r, c)
                     val = _clean_text(cell.Text)
                     if not val:
@@ -110,65 +1278,77 @@ def scout_pywin32(file_path, rows):
                         val = f"{val}[合并]"
                     cells.append(val)
                 lines.append(cells)
+            lines = _trim_preview(lines)
             result[ws.Name] = {
                 "total_rows": total_rows, "total_cols": total_cols,
                 "start_row": start_row, "start_col": start_col,
+                "used_cols": start_col - 1 + len(lines[0]) if lines else 0,
                 "preview": lines
             }
-        wb.Close(False)
-    finally:
-        excel.Quit()
     return result
 
 
-def scout_openpyxl(file_path, rows):
-    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+def _trim_preview(lines):
+    """去掉预览右侧全空的列（只带样式的单元格、被撑大的范围），各行补齐到同一宽度"""
+    width = max((max((i + 1 for i, v in enumerate(row) if v != "[空]"), default=0) for row in lines), default=0)
+    return [row[:width] + ["[空]"] * (width - len(row)) for row in lines]
+
+
+def scout_openpyxl(session, rows, names):
     result = {}
-    for ws in wb:
-        total_rows = ws.max_row or 0
-        total_cols = ws.max_column or 0
-        min_row = ws.min_row or 1
-        min_col = ws.min_column or 1
-        lines = []
-        for row in ws.iter_rows(min_row=min_row,
-                                max_row=min(min_row + rows - 1, total_rows),
-                                values_only=False):
-            cells = []
-            for cell in row:
-                val = _clean_text(cell.value)
-                if not val:
-                    val = "[空]"
-                if isinstance(cell, MergedCell):
-                    val = f"{val}[合并]"
-                cells.append(val)
-            lines.append(cells)
-        result[ws.title] = {
-            "total_rows": total_rows, "total_cols": total_cols,
-            "start_row": min_row, "start_col": min_col,
-            "preview": lines
-        }
-    wb.close()
+    with session.timed("scout"):
+        for name in names:
+            ws = _openpyxl_ws(session, name)
+            min_row, min_col, total_rows, total_cols = session.declared[name]
+            lines = []
+            for row in ws.iter_rows(min_row=min_row,
+                                    max_row=min(min_row + rows - 1, total_rows),
+                                    values_only=False):
+                cells = []
+                for cell in row:
+                    val = _clean_text(cell.value)
+                    if not val:
+                        val = "[空]"
+                    if isinstance(cell, MergedCell):
+                        val = f"{val}[合并]"
+                    cells.append(val)
+                lines.append(cells)
+            lines = _trim_preview(lines)
+            result[ws.title] = {
+                "total_rows": total_rows, "total_cols": total_cols,
+                "start_row": min_row, "start_col": min_col,
+                "used_cols": len(lines[0]) if lines else 0,
+                "preview": lines
+            }
     return result
 
 
 def do_scout(file_path, rows=8, sheet=None):
-    result = scout_pywin32(file_path, rows) if READ_ENGINE == "pywin32" else scout_openpyxl(file_path, rows)
-    found = False
-    for sheet_name, info in result.items():
-        if sheet and sheet_name != sheet:
-            continue
-        found = True
-        print(f"\n=== {sheet_name} "
-              f"({info['total_rows']}行 × {info['total_cols']}列, "
-              f"起始:R{info['start_row']}C{info['start_col']}) ===")
-        for idx, row in enumerate(info["preview"]):
-            display_row = info['start_row'] + idx
-            print(f"  行{display_row}: {' | '.join(str(v) for v in row)}")
-    if sheet and not found:
-        available = list(result.keys())
-        print(f"\n[错误] Sheet '{sheet}' 不存在")
-        print(f"[可用 Sheet] {', '.join(available)}")
-    return result
+    with WorkbookSession(file_path) as session:
+        names = session.sheet_names()
+        if sheet and sheet not in names:
+            print(f"\n[错误] Sheet '{sheet}' 不存在")
+            print(f"[可用 Sheet] {', '.join(names)}")
+            return {}
+        result = _scout_raw(session, rows, [sheet] if sheet else names)
+        for sheet_name, info in result.items():
+            # 标题行报告实际有数据的范围；声明的范围（<dimension> / UsedRange）不同时一并列出
+            used = _used_extent(session, sheet_name)
+            declared = (info["start_row"], info["start_col"], info["total_rows"], info["total_cols"])
+            info["used"] = used
+            if used is None:
+                print(f"\n=== {sheet_name} (无数据，声明范围 {info['total_rows']}行 × {info['total_cols']}列) ===")
+            else:
+                print(f"\n=== {sheet_name} "
+                      f"({used[2]}行 × {used[3]}列, 起始:R{used[0]}C{used[1]}) ===")
+                if used != declared:
+                    print(f"  [范围] 声明 {info['total_rows']}行 × {info['total_cols']}列"
+                          f"（起始:R{info['start_row']}C{info['start_col']}），"
+                          f"多出的部分只有格式或为空，读取时跳过")
+            for idx, row in enumerate(info["preview"]):
+                display_row = info['start_row'] + idx
+                print(f"  行{display_row}: {' | '.join(str(v) for v in row)}")
+        return result
 
 
 def _guess_config(scout_data):
@@ -220,7 +1400,7 @@ def _guess_config(scout_data):
             if not is_serial and len(data_rows) >= 2:
                 nums = []
                 for row in data_rows:
-                    val = str(row[0]).replace("[空]", "").strip()
+                    val = str(row[0] if row else "").replace("[空]", "").strip()
                     try:
                         nums.append(int(float(val)))
                     except (ValueError, TypeError):
@@ -245,182 +1425,770 @@ def _guess_config(scout_data):
             "data_start_row": config_data,
             "columns": {},
             "skip_cols": skip_cols,
+            # 读取到第几列为止（侦察到的最后一个有值的列），不按声明的范围读到空列
+            "max_col": info.get("used_cols") or None,
             "notes": "，".join(notes) if notes else "标准格式"
         }
 
     return config
 
 
-def _scout_raw(file_path, rows=8):
-    """侦察原始结构，返回 dict"""
-    return scout_pywin32(file_path, rows) if READ_ENGINE == "pywin32" else scout_openpyxl(file_path, rows)
-
-
-def _auto_detect_sheets(file_path):
-    """自动侦察并推断所有 Sheet 的配置，返回 sheets dict"""
-    scout_data = _scout_raw(file_path, 8)
-    config = _guess_config(scout_data)
-    return config["sheets"]
-
-
-# ==================== 读取为 DataFrame：openpyxl / pywin32 读原始数据 → pandas ====================
-
-def _normalize_strings(df):
-    """清理字符串列：零宽字符、控制字符、特殊空白统一处理"""
+def _scout_raw(session, rows=8, names=None):
+    """侦察原始结构（names 指定时只侦察这些 Sheet），返回 dict"""
+    if names is None:
+        names = session.sheet_names()
+    session.scouted += len(names)
+    if session.engine == "pywin32":
+        return scout_pywin32(session, rows, names)
+    if session.engine == "xml":
+        return scout_xml(session, rows, names)
+    return scout_openpyxl(session, rows, names)
+
+
+def _auto_detect_sheets(session, names=None):
+    """自动侦察并推断 Sheet 的配置，返回 {Sheet名: 配置}（每个 Sheet 单独按工作簿指纹缓存）。
+
+    names 指定时只侦察这些 Sheet，其余 Sheet 的工作表 XML 不会被读取。
+    --fill-merged 时配置加上 "fill_merged": True（不写入缓存的推断结果；解析缓存的键含配置，两种读法分开缓存）。
+    """
+    if names is None:
+        names = session.sheet_names()
+    fingerprint = _file_fingerprint(session.file_path)
+    keys = {n: _cache_key(fingerprint, "config", engine=session.engine, sheet=n) for n in names}
+    sheets = {}
+    for name in names:
+        cached = _cache_load(keys[name])
+        if cached is not None:
+            sheets[name] = cached
+    missing = [n for n in names if n not in sheets]
+    if missing:
+        raw = _scout_raw(session, 8, missing)
+        for name, info in raw.items():
+            # 声明的范围比侦察到的宽：可能只是格式撑大，也可能是前几行之后才有值的列，按实际范围定列数
+            if info["start_col"] - 1 + info["total_cols"] > info["used_cols"]:
+                used = _used_extent(session, name)
+                info["used_cols"] = max(info["used_cols"], used[3] if used else 0)
+        with session.timed("guess"):
+            guessed = _guess_config(raw)["sheets"]
+        for name in missing:
+            sheets[name] = guessed[name]
+            _cache_store(keys[name], guessed[name],
+                         {"kind": "config", "file": os.path.abspath(session.file_path), "sheet": name})
+    if FILL_MERGED:
+        return {n: dict(sheets[n], fill_merged=True) for n in names}
+    return {n: sheets[n] for n in names}
+
+
+# ==================== 读取为 DataFrame：openpyxl / pywin32 / xml 读原始数据 → pandas ====================
+
+# --fill-merged 或 EXCEL_TOOL_FILL_MERGED=1：合并单元格的每个格子都填左上角的值（自动推断的配置加上 fill_merged）
+FILL_MERGED = False
+
+
+def _normalize_strings(df, categorize=False):
+    """清理字符串列：零宽字符、控制字符、特殊空白统一处理；categorize 时低基数纯文本列转为分类类型"""
     str_cols = df.select_dtypes(include=["object", "str"]).columns
     for col in str_cols:
-        df[col] = df[col].map(lambda v: _clean_text(v) if pd.notna(v) else v)
-        df[col] = df[col].replace(["None", "nan", ""], pd.NA)
+        df[col] = _normalize_series(df[col], categorize)
     return df
 
 
-def read_to_dataframe(file_path, sheet_name, sheet_cfg):
-    """读取 Excel 指定 Sheet 并返回 pandas DataFrame（自动清理脏字符）"""
-    if READ_ENGINE == "pywin32":
-        df = _read_pywin32_to_df(file_path, sheet_name, sheet_cfg)
+def _normalize_series(s, categorize=False):
+    """整列清洗，结果与逐值 _clean_text 后把 "None"/"nan"/"" 置空完全一致。
+
+    非空值先统一转成文本（纯文本列不用转），再整批交给 _clean_strings；
+    纯文本列已经干净时原样返回。categorize 时低基数纯文本列返回分类列（还原后与上述结果一致）。
+    """
+    mask = s.notna().to_numpy()
+    arr = s.to_numpy(dtype=object, copy=True)
+    vals = arr[mask]
+    if not len(vals):
+        return s
+    is_text = pd.api.types.infer_dtype(vals, skipna=False) == "string"
+    if categorize and is_text:
+        out = _normalize_categories(s, mask, vals)
+        if out is not None:
+            return out
+    if not is_text:
+        # 混合类型列（文本夹数字/日期）：_clean_text 同样是先 str() 再清洗
+        vals = np.array([str(v) for v in vals], dtype=object)
+    cleaned = _clean_strings(vals)
+    if cleaned is None:
+        if is_text and s.dtype != object:
+            return s
+        cleaned = vals
+    arr[mask] = cleaned
+    # 重新装箱，让 pandas 像逐值 map 之后一样重新推断类型，再把空值文本置空
+    out = pd.Series(arr, index=s.index, name=s.name)
+    is_null_token = out.isin(_NULL_TOKENS)
+    return out.mask(is_null_token, pd.NA) if is_null_token.any() else out
+
+
+def _clean_strings(vals):
+    """批量 _clean_text 一组字符串（object 数组），全部已经干净且没有空值文本时返回 None。
+
+    清洗时用 \x00 把所有值拼成一个长字符串，一次正则检查是否需要清洗；
+    需要时在长字符串上一次性做字符替换、合并空格，再按 \x00 拆回并逐段去首尾空白。
+    低基数列（去重后不到一半）只处理去重后的值，再按编码映射回每一行。
+    文本本身含 \x00 时（拼接后无法拆回，pandas 去重也会截断）逐值 _clean_text。
+    """
+    joined = "\x00".join(vals)
+    if joined.count("\x00") != len(vals) - 1:
+        cleaned = np.empty(len(vals), dtype=object)
+        cleaned[:] = [_clean_text(v) for v in vals]
+        return cleaned
+    codes, uniques = pd.factorize(vals)
+    if len(uniques) * 2 <= len(vals):
+        joined = "\x00".join(uniques)
     else:
-        df = _read_openpyxl_to_df(file_path, sheet_name, sheet_cfg)
-    return _normalize_strings(df)
-
+        codes, uniques = None, vals
+    if not _RE_NEEDS_CLEAN.search(joined) and not pd.Series(uniques).isin(_NULL_TOKENS).any():
+        return None
+    for ch, repl in _CLEAN_REPLACEMENTS:
+        if ch in joined:
+            joined = joined.replace(ch, repl)
+    if "  " in joined:
+        joined = _RE_MULTI_SPACE.sub(" ", joined)
+    cleaned = np.empty(len(uniques), dtype=object)
+    cleaned[:] = [p.strip() for p in joined.split("\x00")]
+    return cleaned if codes is None else cleaned[codes]
+
+
+def read_to_dataframe(session, sheet_name, sheet_cfg, wanted=None):
+    """读取 Excel 指定 Sheet 并返回 pandas DataFrame（自动清理脏字符，命中缓存时跳过解析）。
+
+    wanted(列名) 给出时边读边跳过其余列（不建表也不清洗，各列类型与整表读取一致），
+    跳过了列的结果不写缓存；命中缓存或在常驻进程中时仍返回整表，由调用方选列。
+    低基数纯文本列为分类类型（见 _normalize_categories），不按分类处理的调用方用 _decode_categories 还原。
+    """
+    key = _sheet_cache_key(session, sheet_name, sheet_cfg)
+    df = _cache_load(key)
+    if df is not None:
+        print(f"[缓存] 命中 {sheet_name}（跳过解析）")
+        return df
+    with session.timed("read"):
+        headers, rows = _sheet_rows(session, sheet_name, sheet_cfg)
+        keep = None
+        if wanted is not None and _memory_cache is None:
+            keep = [i for i, h in enumerate(headers) if wanted(h)]
+            if len(keep) < len(headers):
+                headers = [headers[i] for i in keep]
+                rows = ([row[i] for i in keep] for row in rows)
+            else:
+                keep = None
+        df = pd.DataFrame(list(rows), columns=headers)
+    with session.timed("normalize"):
+        df = _normalize_strings(df, categorize=True)
+    if keep is None:
+        _cache_store(key, df, {"kind": "sheet", "file": os.path.abspath(session.file_path), "sheet": sheet_name})
+    return df
 
-def _read_pywin32_to_df(file_path, sheet_name, cfg):
-    excel = win32com.client.Dispatch("Excel.Application")
-    excel.Visible = False
-    excel.DisplayAlerts = False
-    try:
-        wb = excel.Workbooks.Open(os.path.abspath(file_path))
-        ws = wb.Sheets(sheet_name)
-        header_row = cfg["header_row"] + 1
-        data_start = cfg["data_start_row"] + 1
-        used = ws.UsedRange
-        end_row = used.Row + used.Rows.Count - 1
-        end_col = used.Column + used.Columns.Count - 1
-        skip_cols = set(cfg.get("skip_cols", []))
-        col_map = cfg.get("columns", {})
-
-        headers = []
-        col_indices = []
-        for c in range(1, end_col + 1):
-            if (c - 1) in skip_cols:
-                continue
-            raw = _clean_text(ws.Cells(header_row, c).Text) or ""
-            headers.append(col_map.get(raw, raw))
-            col_indices.append(c)
 
-        data = []
-        for r in range(data_start, end_row + 1):
-            row = [ws.Cells(r, c).Value for c in col_indices]
-            if any(v is not None and str(v).strip() for v in row):
-                data.append(row)
+def _sheet_cache_key(session, sheet_name, sheet_cfg):
+    return _cache_key(_file_fingerprint(session.file_path), "sheet",
+                      engine=session.engine, sheet=sheet_name, cfg=sheet_cfg)
 
-        wb.Close(False)
-        return pd.DataFrame(data, columns=headers)
-    finally:
-        excel.Quit()
 
+def _sheet_rows(session, sheet_name, cfg, columns=None):
+    """按配置逐行读取 Sheet，返回 (列名列表, 数据行迭代器)。
 
-def _read_openpyxl_to_df(file_path, sheet_name, cfg):
-    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
-    try:
-        ws = wb[sheet_name]
-        header_row = cfg["header_row"] + 1
-        data_start = cfg["data_start_row"] + 1
-        skip_cols = set(cfg.get("skip_cols", []))
-        col_map = cfg.get("columns", {})
-
-        header_cells = list(ws.iter_rows(min_row=header_row, max_row=header_row))[0]
-        headers = []
-        col_indices = []
-        for idx, cell in enumerate(header_cells):
-            if idx in skip_cols:
-                continue
-            raw = _clean_text(cell.value) or ""
-            headers.append(col_map.get(raw, raw))
-            col_indices.append(idx)
+    跳过序号列和全空行，值未经清洗；
+    columns 指定时只产出这些列（是否空行仍按所有列判断），列不存在时抛 KeyError。
+    配置含 "fill_merged": True 时，数据区内合并单元格的每个格子都取左上角的值（见 _MergeIndex）。
+    """
+    header_row = cfg["header_row"] + 1
+    data_start = cfg["data_start_row"] + 1
+    skip_cols = set(cfg.get("skip_cols", []))
+    col_map = cfg.get("columns", {})
 
-        data = []
-        for row in ws.iter_rows(min_row=data_start, values_only=True):
-            filtered = [row[i] for i in col_indices]
-            if any(v is not None and str(v).strip() for v in filtered):
-                data.append(filtered)
+    width = cfg.get("max_col")
+    fill_merged = cfg.get("fill_merged", False)
 
-        return pd.DataFrame(data, columns=headers)
-    finally:
-        wb.close()
+    if session.engine == "pywin32":
+        header_values, read_rows = _pywin32_sheet(session, sheet_name, header_row, data_start, width, fill_merged)
+    elif session.engine == "xml":
+        header_values, read_rows = _xml_sheet(session, sheet_name, header_row, data_start, width)
+    else:
+        header_values, read_rows = _openpyxl_sheet(session, sheet_name, header_row, data_start, width)
+    if fill_merged and session.engine != "pywin32":
+        index = _merged_index(session, sheet_name)
+        if index is not None:
+            read_rows = functools.partial(index.fill, read_rows, first_row=data_start)
+
+    headers = []
+    col_indices = []
+    for idx, value in enumerate(header_values):
+        if idx in skip_cols:
+            continue
+        raw = _clean_text(value) or ""
+        headers.append(col_map.get(raw, raw))
+        col_indices.append(idx)
+
+    rows = (row for row in read_rows(col_indices)
+            if any(v is not None and str(v).strip() for v in row))
+    if columns is not None:
+        for c in columns:
+            if c not in headers:
+                raise KeyError(c)
+        keep = [i for i, h in enumerate(headers) if h in columns]
+        headers = [headers[i] for i in keep]
+        rows = ([row[i] for i in keep] for row in rows)
+    return headers, rows
+
+
+def _pywin32_sheet(session, sheet_name, header_row, data_start, width=None, fill_merged=False):
+    """返回 (表头行的值, read_rows)：read_rows(col_indices) 逐行产出指定列（0-based）的值。
+
+    width 为读取的列数（配置中的 max_col）；行只读到最后一个有值的行（UsedRange 含只设了格式的行）。
+    fill_merged 时空单元格若在合并区域内，取 MergeArea 左上角的值（本来就逐格读取，不另建索引）。
+    """
+    _, wb = session.open()
+    ws = wb.Sheets(sheet_name)
+    extent = _pywin32_used_extent(ws)
+    end_row = extent[2] if extent else 0
+    end_col = width or (extent[3] if extent else 0)
+    header_values = [ws.Cells(header_row, c).Text for c in range(1, end_col + 1)]
+
+    def read_rows(col_indices):
+        for r in range(data_start, end_row + 1):
+            row = [ws.Cells(r, c + 1).Value for c in col_indices]
+            if fill_merged:
+                for j, c in enumerate(col_indices):
+                    if row[j] is None:
+                        cell = ws.Cells(r, c + 1)
+                        if cell.MergeCells:
+                            row[j] = cell.MergeArea.Cells(1, 1).Value
+            yield row
+    return header_values, read_rows
+
+
+def _openpyxl_sheet(session, sheet_name, header_row, data_start, width=None):
+    ws = _openpyxl_ws(session, sheet_name)
+    # 没有 width（非自动推断的配置）时按声明的列数，与表头为空但有数据的列也读入
+    width = width or session.declared[sheet_name][3] or None
+    header_values = next(ws.iter_rows(min_row=header_row, max_row=header_row, max_col=width,
+                                      values_only=True), ())
+
+    def read_rows(col_indices):
+        for row in ws.iter_rows(min_row=data_start, max_col=width, values_only=True):
+            # 没有 <dimension> 的文件各行长度不一，越界按空值处理
+            n = len(row)
+            yield [row[i] if i < n else None for i in col_indices]
+    return header_values, read_rows
+
+
+def _xml_sheet(session, sheet_name, header_row, data_start, width=None):
+    reader = session.open()
+    dim = reader.dimension(sheet_name)
+    max_col = width or (dim[3] if dim else None)
+    header_values = next(reader.iter_rows(sheet_name, min_row=header_row, max_row=header_row,
+                                          max_col=max_col), ())
+
+    def read_rows(col_indices):
+        for row in reader.iter_rows(sheet_name, min_row=data_start, max_col=max_col):
+            n = len(row)
+            yield [row[i] if i < n else None for i in col_indices]
+    return header_values, read_rows
+
+
+class _MergeIndex:
+    """合并区域的按列区间索引：每列一组按起始行排序、互不重叠的区间 (首行, 末行, 左上角)。
+
+    一张表的 <mergeCells> 只解析一次；逐行读取时每个空单元格用二分查找定位所在区间，
+    每行的代价是 O(有合并区域的列数 × log 区间数)，与合并区域总数无关。
+    """
+
+    def __init__(self, ranges):
+        by_col = {}
+        for r1, c1, r2, c2 in ranges:
+            for c in range(c1 - 1, c2):  # 0-based 列号，与 read_rows 的 col_indices 一致
+                by_col.setdefault(c, []).append((r1, r2, (r1, c1 - 1)))
+        self.columns = {}
+        for c, spans in by_col.items():
+            spans.sort()
+            self.columns[c] = ([s[0] for s in spans], [s[1] for s in spans], [s[2] for s in spans])
+        self.anchors = {}  # 行号 → 该行的左上角 [(r, c), ...]
+        for r1, c1, _, _ in ranges:
+            self.anchors.setdefault(r1, []).append((r1, c1 - 1))
+        self.last_row = max((r2 for _, _, r2, _ in ranges), default=0)
+
+    def fill(self, read_rows, col_indices, first_row):
+        """包装 read_rows(col_indices)：产出的行中合并区域的格子填上左上角的值。
+
+        read_rows 须从 first_row 起逐行产出（缺失的行也占一行）。左上角不在所选列（如跳过的序号列）时
+        一并读入再去掉；左上角在 first_row 之前的区域（从标题、表头开始的合并）不填。
+        """
+        cols = list(col_indices)
+        extra = sorted({a[1] for spans in (self.columns.get(c) for c in col_indices) if spans
+                        for a in spans[2]} - set(cols))
+        n = len(cols)
+        cols += extra
+        pos = {c: j for j, c in enumerate(cols)}
+        targets = [(j, *self.columns[c]) for j, c in enumerate(col_indices) if c in self.columns]
+        values = {}
+        anchors, last_row, find = self.anchors, self.last_row, bisect.bisect_right
+        for r, row in enumerate(read_rows(cols), first_row):
+            if r <= last_row:
+                if r in anchors:
+                    for key in anchors[r]:
+                        if key[1] in pos:
+                            values[key] = row[pos[key[1]]]
+                for j, starts, ends, keys in targets:
+                    if row[j] is None:
+                        i = find(starts, r) - 1
+                        if i >= 0 and ends[i] >= r:
+                            row[j] = values.get(keys[i])
+            if extra:
+                del row[n:]
+            yield row
+
+
+def _merged_index(session, sheet_name):
+    """Sheet 的 _MergeIndex（合并区域按工作簿指纹缓存）；没有合并区域时返回 None"""
+    key = _cache_key(_file_fingerprint(session.file_path), "merged", sheet=sheet_name)
+    ranges = _cache_load(key)
+    if ranges is None:
+        with session.timed("scout"):
+            if session.engine == "xml":
+                ranges = session.open().merged_ranges(sheet_name)
+            else:
+                reader = _XlsxReader(session.file_path)
+                try:
+                    ranges = reader.merged_ranges(sheet_name)
+                finally:
+                    reader.close()
+        _cache_store(key, ranges, {"kind": "merged", "file": os.path.abspath(session.file_path), "sheet": sheet_name})
+    return _MergeIndex(ranges) if ranges else None
+
+
+def _openpyxl_ws(session, sheet_name):
+    """openpyxl 只读工作表。首次取用时记下声明的范围 (min_row, min_col, max_row, max_col)
+    到 session.declared，然后清除：否则逐行读取会按声明的范围补齐每一行、并在最后一行之后
+    补空行到声明的末行——格式刷、整列设样式的文件声明为整张表（1048576 行 × 16384 列）。"""
+    ws = session.open()[sheet_name]
+    if sheet_name not in session.declared:
+        session.declared[sheet_name] = (ws.min_row or 1, ws.min_column or 1, ws.max_row or 0, ws.max_column or 0)
+        ws.reset_dimensions()
+    return ws
+
+
+def _pywin32_used_extent(ws):
+    """最后一个有值的行和列（Find 反向查找任意内容，不含只设了格式的单元格），返回
+    (首行, 首列, 末行, 末列)；工作表没有值时返回 None"""
+    xl_formulas, xl_part, xl_by_rows, xl_by_columns, xl_next, xl_previous = -4123, 2, 1, 2, 1, 2
+    cells = ws.Cells
+    last = cells.Find("*", cells(1, 1), xl_formulas, xl_part, xl_by_rows, xl_previous)
+    if last is None:
+        return None
+    corner = cells(ws.Rows.Count, ws.Columns.Count)
+    return (cells.Find("*", corner, xl_formulas, xl_part, xl_by_rows, xl_next).Row,
+            cells.Find("*", corner, xl_formulas, xl_part, xl_by_columns, xl_next).Column,
+            last.Row,
+            cells.Find("*", cells(1, 1), xl_formulas, xl_part, xl_by_columns, xl_previous).Column)
+
+
+def _used_extent_key(session, sheet_name):
+    return _cache_key(_file_fingerprint(session.file_path), "extent", engine=session.engine, sheet=sheet_name)
+
+
+def _used_extent(session, sheet_name):
+    """实际有值的范围 (首行, 首列, 末行, 末列)，只带格式的单元格和空行不计入；没有值时返回 ()。
+
+    需要扫描整个工作表（xlsx 用内置的流式解析，不转换单元格的值），结果按工作簿指纹缓存。
+    """
+    key = _used_extent_key(session, sheet_name)
+    extent = _cache_load(key)
+    if extent is None:
+        with session.timed("scout"):
+            if session.engine == "pywin32":
+                _, wb = session.open()
+                extent = _pywin32_used_extent(wb.Sheets(sheet_name))
+            elif session.engine == "xml":
+                extent = session.open().used_extent(sheet_name)
+            else:
+                reader = _XlsxReader(session.file_path)
+                try:
+                    extent = reader.used_extent(sheet_name)
+                finally:
+                    reader.close()
+        extent = extent or ()
+        _cache_store(key, extent, {"kind": "extent", "file": os.path.abspath(session.file_path), "sheet": sheet_name})
+    return extent
+
+
+def read_preview(session, sheet_name, sheet_cfg, n, stats_cols=()):
+    """预览前 n 行：返回 (DataFrame, 总行数, stats_cols 各列的整表统计)。
+
+    有完整解析缓存时直接取缓存；否则流式扫描一遍整表（见 _scan_rows），只保留并清洗前 n 行，
+    列类型和行数与完整读取一致。
+    """
+    df = _cache_load(_sheet_cache_key(session, sheet_name, sheet_cfg))
+    if df is not None:
+        print(f"[缓存] 命中 {sheet_name}（跳过解析）")
+        stats = _kind_stats([c for c in stats_cols if c in df.columns])
+        _add_kind_stats(stats, df)
+        return _decode_categories(df.head(n)), len(df), stats
+    return _scan_rows(session, sheet_name, sheet_cfg, n, stats_cols)
+
+
+def read_sample(session, sheet_name, sheet_cfg, n, seed=0, stats_cols=()):
+    """随机抽取 n 行（蓄水池抽样，保持原有先后）：返回 (DataFrame, 总行数, stats_cols 各列的整表统计)。
+
+    有完整解析缓存时从缓存中抽；否则流式扫描一遍整表（见 _scan_rows），只保留 n 行。
+    """
+    df = _cache_load(_sheet_cache_key(session, sheet_name, sheet_cfg))
+    if df is not None:
+        print(f"[缓存] 命中 {sheet_name}（跳过解析）")
+        stats = _kind_stats([c for c in stats_cols if c in df.columns])
+        _add_kind_stats(stats, df)
+        total = len(df)
+        if total > n:
+            df = df.sample(n, random_state=seed).sort_index().reset_index(drop=True)
+        return _decode_categories(df), total, stats
+    return _scan_rows(session, sheet_name, sheet_cfg, n, stats_cols, random.Random(seed))
+
+
+def _scan_rows(session, sheet_name, sheet_cfg, n, stats_cols=(), rng=None):
+    """流式扫描一遍整表，只保留 n 行（rng 为 None 时取前 n 行，否则蓄水池随机抽取），不构建整表 DataFrame：
+    返回 (保留的行清洗后的 DataFrame, 总行数, stats_cols 各列的整表统计)。
+
+    保留的行前面垫上各列的类型代表值一起清洗（随后去掉），列类型与完整读取一致；
+    stats_cols 各列扫描时分批清洗，累计整表统计（见 _kind_stats）。
+    """
+    with session.timed("read"):
+        headers, rows = _sheet_rows(session, sheet_name, sheet_cfg)
+        samples = [{} for _ in headers]
+        stat_cols = [c for c in dict.fromkeys(stats_cols) if c in headers]
+        stats = _kind_stats(stat_cols)
+        stat_idx = [headers.index(c) for c in stat_cols]
+        pending = []  # 待统计的 stats_cols 各列值，攒够一批清洗一次
+        kept = []  # (行号, 行)
+        total = 0
+        for row in rows:
+            for j, v in enumerate(row):
+                _sample_type(samples[j], v)
+            if stat_idx:
+                pending.append([row[j] for j in stat_idx])
+                if len(pending) >= (CHUNK_ROWS or 50000):
+                    _add_kind_stats(stats, _normalize_strings(pd.DataFrame(pending, columns=stat_cols)))
+                    pending = []
+            if total < n:
+                kept.append((total, row))
+            elif rng is not None:
+                k = rng.randrange(total + 1)
+                if k < n:
+                    kept[k] = (total, row)
+            total += 1
+    kept.sort(key=lambda item: item[0])
+    with session.timed("normalize"):
+        if pending:
+            _add_kind_stats(stats, _normalize_strings(pd.DataFrame(pending, columns=stat_cols)))
+        sample_rows = _sample_rows(samples)
+        df = _normalize_strings(pd.DataFrame(sample_rows + [row for _, row in kept], columns=headers))
+    return df.iloc[len(sample_rows):].reset_index(drop=True), total, stats
+
+
+def read_column_stats(session, sheet_name, sheet_cfg):
+    """统计每列非空数和类型：返回 (列名列表, 行数, [(非空数, 类型), ...])。
+
+    有完整解析缓存时直接取缓存；否则流式扫描一遍，不构建 DataFrame。
+    非空按清洗后的值判断（清洗后为 "None"/"nan"/"" 视为空）；类型由 _sample_frame 推断。
+    """
+    df = _cache_load(_sheet_cache_key(session, sheet_name, sheet_cfg))
+    if df is not None:
+        print(f"[缓存] 命中 {sheet_name}（跳过解析）")
+        return (df.columns.tolist(), len(df),
+                [(int(df.iloc[:, i].notna().sum()), _plain_dtype(df.iloc[:, i])) for i in range(df.shape[1])])
+
+    with session.timed("read"):
+        headers, rows = _sheet_rows(session, sheet_name, sheet_cfg)
+        width = len(headers)
+        non_null = [0] * width
+        samples = [{} for _ in range(width)]
+        total = 0
+        for row in rows:
+            total += 1
+            for j, v in enumerate(row):
+                _sample_type(samples[j], v)
+                if v is not None and (type(v) is not str or _clean_text(v) not in _NULL_TOKENS):
+                    non_null[j] += 1
+
+    with session.timed("normalize"):
+        sample = _sample_frame(headers, samples)
+    return headers, total, [(non_null[j], sample.iloc[:, j].dtype) for j in range(width)]
+
+
+_NUMERIC_OPS = {">": operator.gt, "<": operator.lt, ">=": operator.ge,
+                "<=": operator.le, "==": operator.eq, "!=": operator.ne}
+# 空值在不同列类型下 astype(str) 的结果
+_NULL_REPRS = ("nan", "None", "<NA>", "NaT")
+
+
+def _text_predicate(op, val):
+    """文本条件（与 _do_query 的文本分支一致），不筛选的运算符返回 None"""
+    if op == "==":
+        return lambda s: s == val
+    if op == "!=":
+        return lambda s: s != val
+    if op == "contains":
+        return lambda s: re.search(val, s) is not None
+    if op == "not_contains":
+        return lambda s: re.search(val, s) is None
+    if op == "startswith":
+        return lambda s: s.startswith(val)
+    if op == "endswith":
+        return lambda s: s.endswith(val)
+    return None
+
+
+def read_query(session, sheet_name, sheet_cfg, where_col=None, where_op=None, where_val=None,
+               columns=None, sort=None, **_):
+    """auto query 的下推读取：返回 (候选行 DataFrame, 条件列是否按数值比较)。
+
+    没有条件和选列时整表读取；有完整解析缓存时直接返回缓存（数值判断留给 _do_query）。
+    否则边读边筛：
+    指定 -c 时只取查询用到的列；有条件时逐行做一次宽松判断，只保留可能命中的行，
+    最后由 _do_query 在候选行上按原规则精确筛选、排序。
+
+    宽松判断保证不漏行：_do_query 按整列是否含数值决定用数值还是文本比较，
+    读完之前未知，所以在见到第一个数值之前两种比较命中的行都保留，见到之后丢掉
+    只有文本比较命中的行；日期等文本形式随列类型变化的值一律保留。
+    候选行前面垫上各列的类型代表值一起清洗（随后去掉），列类型与完整读取一致。
+    """
+    filtering = where_col and where_op and where_val is not None
+    if (not filtering and not columns) or _memory_cache is not None:
+        # 没有可下推的条件和选列，整表读取（并写入解析缓存）；
+        # 常驻进程中也整表读取，后续查询直接命中内存缓存
+        return _decode_categories(read_to_dataframe(session, sheet_name, sheet_cfg)), None
+    df = _cache_load(_sheet_cache_key(session, sheet_name, sheet_cfg))
+    if df is not None:
+        print(f"[缓存] 命中 {sheet_name}（跳过解析）")
+        return _decode_categories(df), None
+
+    needed = None
+    if columns:
+        needed = [c.strip() for c in columns.split(",")]
+        if sort:
+            needed.append(sort[5:] if sort.startswith("desc:") else sort)
+        if where_col:
+            needed.append(where_col)
+
+    with session.timed("read"):
+        headers, rows = _sheet_rows(session, sheet_name, sheet_cfg, columns=needed)
+        samples = [{} for _ in headers]
+        kept = []  # (行, 数值比较是否命中)
+        if filtering and where_col not in headers:
+            raise KeyError(where_col)
+        w = headers.index(where_col) if filtering else None
+        compare = _NUMERIC_OPS.get(where_op) if filtering else None
+        try:
+            val_n = float(where_val) if compare else None
+        except ValueError:
+            val_n = None
+        text_test = _text_predicate(where_op, where_val) if filtering else None
+        null_hit = text_test is None or any(text_test(r) for r in _NULL_REPRS)
+        known_numeric = False
+
+        def numeric_hit(v):
+            if v is None:
+                return where_op == "!="
+            t = type(v)
+            if t is str:
+                if where_op == "!=":
+                    return True
+                try:
+                    x = float(_clean_text(v))
+                except ValueError:
+                    return False
+            elif t in (int, float, bool):
+                x = v
+            else:
+                return True
+            return val_n is None or compare(x, val_n)
+
+        def text_hit(v):
+            if text_test is None or (v is not None and type(v) not in (str, int, float, bool)):
+                return True
+            if v is None:
+                return null_hit
+            if type(v) is str:
+                text = _clean_text(v)
+                return null_hit if text in _NULL_TOKENS else text_test(text)
+            # 数值列有空值时是 float，否则是 int，两种文本形式都试
+            if type(v) is int:
+                return text_test(str(v)) or text_test(str(float(v)))
+            if type(v) is float and v.is_integer():
+                return text_test(str(v)) or text_test(str(int(v)))
+            return text_test(str(v))
+
+        def is_number(v):
+            t = type(v)
+            if t is int or t is float:
+                return True
+            if t is not str:
+                return False
+            text = _clean_text(v)
+            try:
+                float(text)
+            except ValueError:
+                return False
+            return bool(pd.to_numeric(pd.Series([text], dtype=object), errors="coerce").notna().iloc[0])
+
+        for row in rows:
+            for j, v in enumerate(row):
+                _sample_type(samples[j], v)
+            if not filtering:
+                kept.append((row, False))
+                continue
+            v = row[w]
+            if compare is None:
+                if text_hit(v):
+                    kept.append((row, False))
+                continue
+            if not known_numeric and is_number(v):
+                known_numeric = True
+                kept = [k for k in kept if k[1]]
+            hit = numeric_hit(v)
+            if hit or (not known_numeric and text_hit(v)):
+                kept.append((row, hit))
+
+    with session.timed("normalize"):
+        sample_rows = _sample_rows(samples)
+        df = _normalize_strings(pd.DataFrame(sample_rows + [r for r, _ in kept], columns=headers))
+    where_numeric = None
+    if filtering:
+        # 布尔、日期、时长列 to_numeric 后也是数值
+        where_numeric = known_numeric or (df.iloc[:, w].dtype.kind in "bmM"
+                                          and any(t is not type(None) for t in samples[w]))
+    return df.iloc[len(sample_rows):].reset_index(drop=True), where_numeric
+
+
+def _sample_type(samples, v):
+    """记录一个值的类型代表值到 samples（类型 → 代表值，空值记为 None 类型）"""
+    t = type(v)
+    if t is int:
+        # 超出 int64 的整数会让整列变成 object，代表值取绝对值最大的
+        prev = samples.get(t)
+        if prev is None or abs(v) > abs(prev):
+            samples[t] = v
+    elif t not in samples:
+        samples[t] = v
+
+
+def _sample_frame(headers, samples):
+    """用每列的类型代表值构造小 DataFrame 并清洗，列类型与完整读取后一致。
+
+    pandas 按列中出现的值类型推断列类型，每种类型一个代表值就够了；
+    行数不齐的列用该列自己的代表值补齐，不会引入新的类型。
+    """
+    return _normalize_strings(pd.DataFrame(_sample_rows(samples), columns=headers))
+
+
+def _sample_rows(samples):
+    cols = [list(col.values()) or [None] for col in samples]
+    height = max((len(c) for c in cols), default=0)
+    return [[c[min(i, len(c) - 1)] for c in cols] for i in range(height)]
+
+
+def _kind_stats(cols):
+    """cols 各列的整表统计 [有数值, 全空, 转数值后为浮点]：分块 / 分批用 _add_kind_stats 累计；
+    filter 的数值比较看有无数值，add_column 用 _stats_kind 得出的类型"""
+    return {col: [False, True, False] for col in cols}
+
+
+def _add_kind_stats(stats, df):
+    for col, stat in stats.items():
+        if col not in df.columns:
+            continue
+        s = df[col]
+        num = s if s.dtype.kind in "iufbmM" else _per_value(s, lambda v: pd.to_numeric(v, errors="coerce"))
+        stat[0] |= bool(num.notna().any())
+        stat[1] &= bool(s.isna().all())
+        stat[2] |= num.dtype.kind == "f" or not isinstance(num.dtype, np.dtype)
 
 
 # ==================== auto 命令：pandas 查询 ====================
 
-def do_auto(file_path, action="preview", sheet=None, **kwargs):
-    sheets = _auto_detect_sheets(file_path)
+def do_auto(file_path, action="preview", sheet=None, jobs=None, **kwargs):
+    with WorkbookSession(file_path) as session:
+        names = session.sheet_names()
 
-    if not sheets:
-        print("[错误] 未检测到有效的 Sheet")
-        return
-
-    # 确定要操作的 sheet
-    if sheet:
-        if sheet not in sheets:
-            print(f"[错误] Sheet '{sheet}' 不存在")
-            print(f"[可用 Sheet] {', '.join(sheets.keys())}")
+        if not names:
+            print("[错误] 未检测到有效的 Sheet")
             return
-        target_sheets = {sheet: sheets[sheet]}
-    else:
-        if len(sheets) == 1:
-            name = list(sheets.keys())[0]
-            target_sheets = {name: sheets[name]}
-            print(f"[提示] 只有一个 Sheet，已自动选择 \"{name}\"。多 Sheet 时必须用 --sheet 指定\n")
-        else:
-            if action == "query":
-                print(f"[错误] 有多个 Sheet，查询时请用 --sheet 指定")
-                print(f"[可用 Sheet] {', '.join(sheets.keys())}")
-                return
-            target_sheets = sheets
-
-    print(f"[引擎] 读取={READ_ENGINE}, 处理=pandas")
 
-    # 提示已有的 steps 文件
-    steps_files = discover_steps_files(file_path)
-    if steps_files:
-        print(f"[可用规则] {', '.join(os.path.basename(f) for f in steps_files)}")
-    print()
+        # 确定要操作的 sheet（只侦察要用到的 Sheet）
+        if sheet:
+            if sheet not in names:
+                print(f"[错误] Sheet '{sheet}' 不存在")
+                print(f"[可用 Sheet] {', '.join(names)}")
+                return
+            target_sheets = _auto_detect_sheets(session, [sheet])
+        else:
+            if len(names) == 1:
+                target_sheets = _auto_detect_sheets(session, names)
+                print(f"[提示] 只有一个 Sheet，已自动选择 \"{names[0]}\"。多 Sheet 时必须用 --sheet 指定\n")
+            else:
+                if action == "query":
+                    print(f"[错误] 有多个 Sheet，查询时请用 --sheet 指定")
+                    print(f"[可用 Sheet] {', '.join(names)}")
+                    return
+                target_sheets = _auto_detect_sheets(session, names)
+
+        print(f"[引擎] 读取={session.engine}, 处理=pandas")
+
+        # 提示已有的 steps 文件
+        steps_files = discover_steps_files(file_path)
+        if steps_files:
+            print(f"[可用规则] {', '.join(os.path.basename(f) for f in steps_files)}")
+        print()
 
-    for s_name, s_cfg in target_sheets.items():
-        if len(target_sheets) > 1:
-            print(f"\n{'='*40} Sheet: {s_name} {'='*40}")
+        def announce(s_name):
+            if len(target_sheets) > 1:
+                print(f"\n{'='*40} Sheet: {s_name} {'='*40}")
 
-        df = read_to_dataframe(file_path, s_name, s_cfg)
+        if action == "query":
+            # 条件和选列下推到读取：只取用到的列、只保留可能命中的行
+            for s_name, s_cfg in target_sheets.items():
+                announce(s_name)
+                df, where_numeric = read_query(session, s_name, s_cfg, **kwargs)
+                _do_query(df, where_numeric=where_numeric, **kwargs)
+            return
 
+        # headers 流式统计、不构建 DataFrame；preview 流式扫描整表，只保留并清洗前 n 行
+        n = kwargs.get("n", 5)
         if action == "headers":
-            print(f"列名：{', '.join(df.columns.tolist())}")
-            print(f"共 {len(df)} 行数据")
-            print(f"\n列详情：")
-            for col in df.columns:
-                non_null = df[col].notna().sum()
-                print(f"  {col}: {non_null}/{len(df)} 非空, 类型={df[col].dtype}")
-            abs_file = os.path.abspath(file_path)
-            sheet_opt = f' --sheet "{s_name}"'
-            print(f"\n[下一步]")
-            print(f"  预览数据: python {TOOL_PATH} auto {abs_file} preview{sheet_opt}")
-            print(f"  条件查询: python {TOOL_PATH} auto {abs_file} query{sheet_opt} --where-col \"列名\" --where-op \">\" --where-val \"值\"")
-            print(f"  清洗导出: python {TOOL_PATH} clean {abs_file}{sheet_opt} --preview")
-
-        elif action == "preview":
-            n = kwargs.get("n", 5)
-            print(f"列名：{', '.join(df.columns.tolist())}")
-            print(f"共 {len(df)} 行，预览前 {n} 行：\n")
-            print(df.head(n).to_string(index=False))
-            abs_file = os.path.abspath(file_path)
+            reader, args = read_column_stats, ()
+        else:
+            reader, args = read_preview, (n,)
+        abs_file = os.path.abspath(file_path)
+        for s_name, result in _map_sheets(session, reader, target_sheets, *args,
+                                          jobs=jobs, announce=announce):
             sheet_opt = f' --sheet "{s_name}"'
-            print(f"\n[下一步]")
-            print(f"  条件查询: python {TOOL_PATH} auto {abs_file} query{sheet_opt} --where-col \"列名\" --where-op \">\" --where-val \"值\"")
-            print(f"  清洗导出: python {TOOL_PATH} clean {abs_file}{sheet_opt} --preview")
-
-        elif action == "query":
-            _do_query(df, **kwargs)
-
-
-def _do_query(df, **kwargs):
+            if action == "headers":
+                columns, total, stats = result
+                print(f"列名：{', '.join(columns)}")
+                print(f"共 {total} 行数据")
+                print(f"\n列详情：")
+                for col, (non_null, dtype) in zip(columns, stats):
+                    print(f"  {col}: {non_null}/{total} 非空, 类型={dtype}")
+                print(f"\n[下一步]")
+                print(f"  预览数据: python {TOOL_PATH} auto {abs_file} preview{sheet_opt}")
+                print(f"  条件查询: python {TOOL_PATH} auto {abs_file} query{sheet_opt} --where-col \"列名\" --where-op \">\" --where-val \"值\"")
+                print(f"  清洗导出: python {TOOL_PATH} clean {abs_file}{sheet_opt} --preview")
+
+            else:
+                df, total, _ = result
+                print(f"列名：{', '.join(df.columns.tolist())}")
+                print(f"共 {total} 行，预览前 {n} 行：\n")
+                print(df.to_string(index=False))
+                print(f"\n[下一步]")
+                print(f"  条件查询: python {TOOL_PATH} auto {abs_file} query{sheet_opt} --where-col \"列名\" --where-op \">\" --where-val \"值\"")
+                print(f"  清洗导出: python {TOOL_PATH} clean {abs_file}{sheet_opt} --preview")
+
+
+def _do_query(df, where_numeric=None, **kwargs):
+    """筛选、排序、选列并输出；where_numeric 为 None 时按条件列是否含数值自行判断"""
     where_col = kwargs.get("where_col")
     where_op = kwargs.get("where_op")
     where_val = kwargs.get("where_val")
@@ -429,18 +2197,19 @@ def _do_query(df, **kwargs):
     top = kwargs.get("top", 10)
 
     result = df
+    views = _ColumnViews()
 
     # 筛选
     if where_col and where_op and where_val is not None:
-        col_data = pd.to_numeric(result[where_col], errors="coerce")
-        is_numeric = col_data.notna().any()
+        col_data = views.numeric(result, where_col)
+        is_numeric = col_data.notna().any() if where_numeric is None else where_numeric
 
         if is_numeric and where_op in (">", "<", ">=", "<=", "==", "!="):
             val_num = float(where_val)
             ops = {">": "gt", "<": "lt", ">=": "ge", "<=": "le", "==": "eq", "!=": "ne"}
             result = result[getattr(col_data, ops[where_op])(val_num)]
         else:
-            str_data = result[where_col].astype(str)
+            str_data = views.text(result, where_col)
             if where_op == "==":
                 result = result[str_data == where_val]
             elif where_op == "!=":
@@ -458,8 +2227,8 @@ def _do_query(df, **kwargs):
     if sort_col:
         desc = sort_col.startswith("desc:")
         col = sort_col[5:] if desc else sort_col
-        result = result.sort_values(col, ascending=not desc,
-                                    key=lambda x: pd.to_numeric(x, errors="coerce"))
+        keys = views.numeric(result, col)
+        result = result.sort_values(col, ascending=not desc, key=lambda _: keys)
 
     # 选列
     if select_cols:
@@ -470,317 +2239,2635 @@ def _do_query(df, **kwargs):
     print(result.head(top).to_string(index=False))
 
 
+# ==================== 低基数文本列：读入时转为分类类型，逐值步骤只处理各个类别 ====================
+
+# 至少 CATEGORY_MIN_ROWS 行、且不同值不超过行数 CATEGORY_MAX_RATIO 的纯文本列，读入整表时转为分类类型
+# （EXCEL_TOOL_CATEGORY_MIN_ROWS / EXCEL_TOOL_CATEGORY_RATIO 调整，见 _load_env_settings）
+
+
+def _is_category(s):
+    return isinstance(s.dtype, pd.CategoricalDtype)
+
+
+def _normalize_categories(s, mask, vals):
+    """低基数纯文本列只清洗不同的值，返回分类列；不够低基数或含 \x00（pandas 去重会截断）时返回 None"""
+    limit = len(s) * CATEGORY_MAX_RATIO
+    # 前面一小段已经超过上限的（高基数列）不必整列去重
+    if len(s) < CATEGORY_MIN_ROWS or len(pd.unique(vals[:int(limit) * 2 + 1])) > limit:
+        return None
+    if "\x00".join(vals).count("\x00") != len(vals) - 1:
+        return None
+    codes, uniques = pd.factorize(vals)
+    if len(uniques) > limit:
+        return None
+    cleaned = _clean_strings(uniques)
+    # 末尾补一个空值给原本为空的行；与 _normalize_series 一样重新装箱推断类型，再把空值文本置空
+    values = pd.Series(np.append(uniques if cleaned is None else cleaned, np.nan))
+    if values.dtype == object:
+        return None
+    values = values.mask(values.isin(_NULL_TOKENS), pd.NA)
+    rows = np.full(len(s), len(uniques), dtype=np.intp)
+    rows[mask] = codes
+    return _categorical(values, rows, s.index, s.name)
+
+
+def _categorical(values, rows, index, name):
+    """第 i 行取 values 的第 rows[i] 个值，编码为分类列。
+
+    类别按值排好序，groupby / pivot_table 按类别顺序输出的分组与按原值排序一致。
+    """
+    codes, uniques = pd.factorize(values, sort=True)
+    return pd.Series(pd.Categorical.from_codes(codes[rows], categories=uniques), index=index, name=name)
+
+
+def _category_parts(s):
+    """分类列 → (列中出现的不同值, 各行在其中的位置)。
+
+    不同值不含已经不出现的类别，有空行时末尾加一个空值，类型与还原后的列相同：
+    逐值函数在其上的结果（含结果类型）与在整列上执行一致。
+    """
+    cats = s.cat.categories
+    codes = s.cat.codes.to_numpy()
+    counts = np.bincount(codes + 1, minlength=len(cats) + 1)
+    used = np.flatnonzero(counts[1:])
+    pos = np.empty(len(cats) + 1, dtype=np.intp)
+    pos[0] = len(used)
+    pos[used + 1] = np.arange(len(used))
+    values = cats.take(used).to_numpy(dtype=object)
+    if counts[0]:
+        values = np.append(values, np.nan)
+    return pd.Series(values, dtype=cats.dtype), pos[codes + 1]
+
+
+def _per_value(s, func):
+    """执行逐值的 func（Series → 等长 Series）；分类列只在各个不同值上执行，再按编码展开到各行，
+    结果仍是文本时重新编码为分类列"""
+    if not _is_category(s):
+        return func(s)
+    values, rows = _category_parts(s)
+    out = func(values)
+    if out.dtype == values.dtype:
+        return _categorical(out, rows, s.index, s.name)
+    return pd.Series(out.to_numpy()[rows], index=s.index, name=s.name, dtype=out.dtype)
+
+
+def _plain_dtype(s):
+    """列还原为普通文本列后的类型（分类列报告其文本类型）"""
+    return s.cat.categories.dtype if _is_category(s) else s.dtype
+
+
+def _plain_series(s):
+    """分类列还原为普通文本列（与不编码时读到的列完全一致），其他列原样返回"""
+    return s.astype(s.cat.categories.dtype) if _is_category(s) else s
+
+
+def _decode_categories(df, cols=None):
+    """把表中的分类列（cols 给出时只限这些列）还原为普通文本列；没有时原样返回"""
+    pos = [i for i, dtype in enumerate(df.dtypes)
+           if isinstance(dtype, pd.CategoricalDtype) and (cols is None or df.columns[i] in cols)]
+    if not pos:
+        return df
+    df = df.copy(deep=False)
+    for i in pos:
+        df.isetitem(i, _plain_series(df.iloc[:, i]))
+    return df
+
+
 # ==================== clean 命令：pandas 清洗 ====================
 
-def do_clean(file_path, rules_path=None, output_path=None, preview_only=False, sheet=None):
-    sheets = _auto_detect_sheets(file_path)
+def _select_sheet(names, sheet):
+    """clean/export 只处理单个 Sheet：返回要处理的 Sheet 名，无法确定时打印原因并返回 None"""
+    if sheet:
+        if sheet not in names:
+            print(f"[错误] Sheet '{sheet}' 不存在")
+            print(f"[可用 Sheet] {', '.join(names)}")
+            return None
+        return sheet
+    if len(names) == 1:
+        return names[0]
+    print(f"[错误] 有多个 Sheet，请用 --sheet 指定")
+    print(f"[可用 Sheet] {', '.join(names)}")
+    return None
+
+
+def _step_cache_keys(session, sheet_name, sheet_cfg, steps):
+    """steps 各前缀（前 1 步、前 2 步……）执行结果的缓存键。
+
+    从 Sheet 解析缓存键开始，依次与每个步骤的规范 JSON（紧凑分隔符，字典保持原顺序：
+    聚合指标等的顺序影响结果）串联取哈希，改动某一步只影响它和之后的键。
+    """
+    key = _sheet_cache_key(session, sheet_name, sheet_cfg)
+    keys = []
+    for step in steps:
+        canonical = json.dumps(step, ensure_ascii=False, separators=(",", ":"), default=str)
+        key = hashlib.sha1(f"{key}\n{canonical}".encode("utf-8")).hexdigest()
+        keys.append(key)
+    return keys
+
+
+def _step_cache_resume(keys):
+    """找缓存中最长的已执行前缀，返回 (步骤数, 该前缀执行后的 DataFrame)；没有时返回 (0, None)"""
+    for done in range(len(keys), 0, -1):
+        df = _cache_load(keys[done - 1])
+        if df is not None:
+            return done, df
+    return 0, None
+
+
+# clean 预览默认只用这么多行的样本执行（--exact 按整表执行）
+PREVIEW_SAMPLE_ROWS = 10000
+# 结果依赖整表的步骤：在样本上执行时只是近似
+_SAMPLE_APPROX_STEPS = ("dedup", "sort", "aggregate", "pivot")
+
+
+def _sample_type_cols(step):
+    """filter / add_column 中按整列是否含数值决定处理方式的列（比较值不是数值的条件只能按文本比较）"""
+    action = step.get("action")
+    if action == "filter":
+        return {c["column"] for c in step.get("conditions", [])
+                if c["op"] in _NUMERIC_OPS and _is_float(c["value"])}
+    if action == "add_column":
+        formula = _compile_formula(step["formula"])
+        return set(formula.refs) if formula.fallback is None else set()
+    return set()
+
+
+def _is_float(val):
+    try:
+        float(val)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _sample_numeric(step, df, stats):
+    """样本上执行 filter / add_column 时传给 _apply_step 的 numeric：返回 (numeric, 是否与整表一致)。
+
+    有整表统计 stats 的列按统计处理；没有时，样本中有值能转数值的列整表也一定含数值
+    （样本的行都在整表中），按样本判断即可（整表转数值后可能是浮点，只影响显示），
+    否则与整表的处理可能不同。
+    """
+    numeric, exact = {}, True
+    cols = _sample_type_cols(step)
+    df = _from_backend(df) if cols else df
+    for col in cols:
+        if col not in df.columns:
+            continue
+        if col in stats:
+            numeric[col] = stats[col][0] if step["action"] == "filter" else _stats_kind(stats[col])
+            continue
+        s = df[col]
+        num = s if s.dtype.kind in "iufbmM" else _per_value(s, lambda v: pd.to_numeric(v, errors="coerce"))
+        exact = exact and bool(num.notna().any())
+    return numeric, exact
+
+
+def _stats_after(stats, step):
+    """执行 step 后仍然成立的整表统计：改写了的列作废；增删行、改列名或改类型的步骤全部作废"""
+    action = step.get("action")
+    if action in ("dedup", "sort", "drop_columns"):
+        return stats  # 去重后每个不同的值都还在，统计不变
+    if action in ("replace", "fill_empty", "regex_replace", "add_column") or (action == "trim" and "columns" in step):
+        return {col: stat for col, stat in stats.items() if col not in _step_writes(step)}
+    return {}
+
+
+def _clean_sample(session, sheet_name, sheet_cfg, steps, n, random_sample=False):
+    """clean 预览按样本执行：取前 n 行（或随机抽 n 行）跑全部步骤，内存和步骤耗时与表的大小基本无关。
+
+    逐行独立的步骤在样本上的结果就是整表结果的一部分；dedup / sort / aggregate / pivot
+    只看到样本，标注为近似。filter 的数值比较、add_column 引用的文本列按整列是否含数值处理：
+    取样时扫描整表一并统计这些列（见 _kind_stats），与整表结果一致；之前的步骤筛掉了行、
+    改写了该列时，样本中没有数值的列无从判断，标注为近似。
+    整表不超过 n 行、或整套步骤的结果已在步骤缓存中时不抽样，返回 False 由调用方按整表执行。
+    """
+    if CACHE_ENABLED and steps and _cache_has(_step_cache_keys(session, sheet_name, sheet_cfg, steps)[-1]):
+        return False
+    stats_cols = set().union(*map(_sample_type_cols, steps))
+    if random_sample:
+        df, total, stats = read_sample(session, sheet_name, sheet_cfg, n, stats_cols=stats_cols)
+    else:
+        df, total, stats = read_preview(session, sheet_name, sheet_cfg, n, stats_cols=stats_cols)
+    if total == len(df):
+        return False
+    print(f"[引擎] 读取={session.engine}, 处理={PROCESS_BACKEND}")
+    print(f"[Sheet] {sheet_name}")
+    print(f"[样本预览] 按{'随机抽取的' if random_sample else '前'} {len(df)} 行执行（整表共 {total} 行），"
+          f"加 --exact 按整表执行（样本预览不写步骤缓存，--exact 才缓存每一步的结果供之后续跑）")
+    print(f"[清洗前] {len(df)} 行 × {len(df.columns)} 列（样本）")
+
+    views = _ColumnViews()
+    approx, typed = [], []
+    df = _to_backend(df)
+    for no, step in enumerate(steps, 1):
+        before, df_before = len(df), df
+        numeric, exact = _sample_numeric(step, df, stats)
+        with _profiled(f"步骤{no} {_step_label(step)}（样本）", "step", rows_in=before) as record:
+            if numeric:
+                # polars 后端不接收整表统计，这一步按 pandas 执行
+                df = _to_backend(_apply_step(_from_backend(df), step, numeric=numeric, views=views))
+            else:
+                df = _apply_step(df, step, views=views)
+            record["rows_out"] = len(df)
+        stats = _stats_after(stats, step)
+        note = ""
+        if step.get("action") in _SAMPLE_APPROX_STEPS:
+            approx.append(no)
+            note = "（样本近似）"
+        elif not exact:
+            typed.append(no)
+            note = "（样本近似）"
+        print(f"  步骤{no} {_step_message(step, before, len(df), df_before)}{note}")
+    df = _decode_categories(_from_backend(df))
+    df = _round_floats(df)
+
+    print(f"\n[清洗后] {len(df)} 行 × {len(df.columns)} 列（样本结果）")
+    if approx:
+        print(f"[提示] 步骤{'、'.join(map(str, approx))} 只在样本内去重 / 排序 / 聚合 / 透视，整表结果会不同")
+    if typed:
+        print(f"[提示] 步骤{'、'.join(map(str, typed))} 的列在样本中没有数值，无法确定整表按数值还是文本处理，"
+              f"结果可能不同（加 --exact 按整表执行）")
+    print(f"\n预览前 10 行：")
+    print(df.head(10).to_string(index=False))
+    return True
+
+
+def do_clean(file_path, rules_path=None, output_path=None, preview_only=False, sheet=None,
+             chunk_size=None, optimize=True, explain=False, exact=False, sample_rows=None,
+             sample_random=False):
+    with WorkbookSession(file_path) as session:
+        names = session.sheet_names()
+
+        if not names:
+            print("[错误] 未检测到有效的 Sheet")
+            return
 
-    if not sheets:
-        print("[错误] 未检测到有效的 Sheet")
-        return
+        # 确定清洗规则路径
+        if rules_path is None:
+            steps_files = discover_steps_files(file_path)
+            if len(steps_files) == 0:
+                prefix = get_steps_prefix(file_path)
+                abs_file = os.path.abspath(file_path)
+                sheet_opt = f' --sheet "{sheet}"' if sheet else ""
+                print(f"[状态] 未找到清洗规则文件")
+                print(f"\n{'='*60}")
+                print(f"[命名规则] {{Excel文件名}}-{{操作描述}}.excel-steps.json")
+                print(f"[示例文件名]")
+                print(f"  {os.path.basename(prefix)}-按区域汇总.excel-steps.json")
+                print(f"  {os.path.basename(prefix)}-数据清洗.excel-steps.json")
+                print(f"\n[操作步骤]")
+                print(f"  1. 根据数据特征，编写清洗规则 JSON（格式见下方）")
+                print(f"  2. 用 Write 工具保存到 Excel 同目录")
+                print(f"  3. 保存后执行：")
+                print(f"     python {TOOL_PATH} clean {abs_file}{sheet_opt} --preview")
+                print(f"\n[规则格式] steps 数组，按顺序执行：")
+                print(f'{{"steps": [')
+                print(f'  {{"action": "trim"}},')
+                print(f'  {{"action": "replace", "column": "区域", "mapping": {{"旧值": "新值"}}}},')
+                print(f'  {{"action": "fill_empty", "column": "销量", "value": 0}},')
+                print(f'  {{"action": "dedup", "columns": ["区域", "型号"]}},')
+                print(f'  {{"action": "filter", "conditions": [{{"column": "销量", "op": ">", "value": "0"}}], "logic": "and"}},')
+                print(f'  {{"action": "sort", "column": "销量", "desc": true}},')
+                print(f'  {{"action": "aggregate", "group_by": ["区域"], "metrics": {{"销量": "sum"}}}}')
+                print(f"]}}")
+                print(f"\n[更多操作] regex_replace, add_column, drop_columns, rename, type_convert, pivot")
+                print(f"  查看详情: python {TOOL_PATH} help <操作名>")
+                return
+            elif len(steps_files) == 1:
+                rules_path = steps_files[0]
+                print(f"[自动发现] {os.path.basename(rules_path)}")
+            else:
+                abs_file = os.path.abspath(file_path)
+                sheet_opt = f' --sheet "{sheet}"' if sheet else ""
+                print(f"[发现多个规则文件] 请指定要使用的规则：")
+                for f in steps_files:
+                    print(f"  python {TOOL_PATH} clean {abs_file} {f}{sheet_opt} --preview")
+                return
 
-    # 确定清洗规则路径
-    if rules_path is None:
-        steps_files = discover_steps_files(file_path)
-        if len(steps_files) == 0:
-            prefix = get_steps_prefix(file_path)
-            abs_file = os.path.abspath(file_path)
-            sheet_opt = f' --sheet "{sheet}"' if sheet else ""
-            print(f"[状态] 未找到清洗规则文件")
-            print(f"\n{'='*60}")
-            print(f"[命名规则] {{Excel文件名}}-{{操作描述}}.excel-steps.json")
-            print(f"[示例文件名]")
-            print(f"  {os.path.basename(prefix)}-按区域汇总.excel-steps.json")
-            print(f"  {os.path.basename(prefix)}-数据清洗.excel-steps.json")
-            print(f"\n[操作步骤]")
-            print(f"  1. 根据数据特征，编写清洗规则 JSON（格式见下方）")
-            print(f"  2. 用 Write 工具保存到 Excel 同目录")
-            print(f"  3. 保存后执行：")
-            print(f"     python {TOOL_PATH} clean {abs_file}{sheet_opt} --preview")
-            print(f"\n[规则格式] steps 数组，按顺序执行：")
-            print(f'{{"steps": [')
-            print(f'  {{"action": "trim"}},')
-            print(f'  {{"action": "replace", "column": "区域", "mapping": {{"旧值": "新值"}}}},')
-            print(f'  {{"action": "fill_empty", "column": "销量", "value": 0}},')
-            print(f'  {{"action": "dedup", "columns": ["区域", "型号"]}},')
-            print(f'  {{"action": "filter", "conditions": [{{"column": "销量", "op": ">", "value": "0"}}], "logic": "and"}},')
-            print(f'  {{"action": "sort", "column": "销量", "desc": true}},')
-            print(f'  {{"action": "aggregate", "group_by": ["区域"], "metrics": {{"销量": "sum"}}}}')
-            print(f"]}}")
-            print(f"\n[更多操作] regex_replace, add_column, drop_columns, rename, type_convert, pivot")
-            print(f"  查看详情: python {TOOL_PATH} help <操作名>")
+        # 确定 sheet
+        sheet_name = _select_sheet(names, sheet)
+        if sheet_name is None:
             return
-        elif len(steps_files) == 1:
-            rules_path = steps_files[0]
-            print(f"[自动发现] {os.path.basename(rules_path)}")
-        else:
-            abs_file = os.path.abspath(file_path)
-            sheet_opt = f' --sheet "{sheet}"' if sheet else ""
-            print(f"[发现多个规则文件] 请指定要使用的规则：")
-            for f in steps_files:
-                print(f"  python {TOOL_PATH} clean {abs_file} {f}{sheet_opt} --preview")
+        if output_path and not preview_only and _output_format(output_path) is None:
             return
 
-    # 确定 sheet
-    if sheet:
-        if sheet not in sheets:
-            print(f"[错误] Sheet '{sheet}' 不存在")
-            print(f"[可用 Sheet] {', '.join(sheets.keys())}")
+        rules = _load_rules(rules_path)
+        if rules is None:
             return
-        sheet_name = sheet
-        sheet_cfg = sheets[sheet]
-    else:
-        if len(sheets) == 1:
-            sheet_name = list(sheets.keys())[0]
-            sheet_cfg = sheets[sheet_name]
+
+        sheet_cfg = _auto_detect_sheets(session, [sheet_name])[sheet_name]
+        steps = rules.get("steps", [])
+        # 预览默认按样本执行，耗时不随表的大小增长
+        if (preview_only or not output_path) and not exact and not explain:
+            if _clean_sample(session, sheet_name, sheet_cfg, steps, sample_rows or PREVIEW_SAMPLE_ROWS, sample_random):
+                if not output_path:
+                    print(f"\n[提示] 未指定输出路径，仅预览。用 -o 指定输出文件。")
+                return
+
+        chunk_rows = chunk_size or CHUNK_ROWS
+        if chunk_rows:
+            if PROCESS_BACKEND != "pandas":
+                print(f"[提示] 分块执行只支持 pandas 处理后端，本次不使用 {PROCESS_BACKEND}")
+            _clean_chunked(session, sheet_name, sheet_cfg, steps,
+                           output_path, preview_only, chunk_rows)
+            return
+
+        # 步骤缓存：从前面未改动的最长一段步骤的结果续跑；预览时逐步执行并缓存每一步的结果
+        keys = _step_cache_keys(session, sheet_name, sheet_cfg, steps) if CACHE_ENABLED and not explain else []
+        done, df = _step_cache_resume(keys)
+        checkpoint = bool(keys) and (preview_only or not output_path) and PROCESS_BACKEND == "pandas"
+        rest = steps[done:]
+        # 优化会重排、合并步骤，中间结果对不上步骤序号，逐步缓存时按原顺序执行
+        plan = _CleanPlan(rest, first=done + 1) if optimize and not checkpoint else None
+        if df is None:
+            # --explain 要按原顺序再跑一遍对比，需要整表
+            wanted = plan.wanted if plan and not explain else None
+            df = read_to_dataframe(session, sheet_name, sheet_cfg, wanted=wanted)
+        print(f"[引擎] 读取={session.engine}, 处理={PROCESS_BACKEND}")
+        print(f"[Sheet] {sheet_name}")
+        if done:
+            print(f"[步骤缓存] 步骤1-{done} 未改动，跳过读取和这些步骤，从步骤{done + 1}继续"
+                  if rest else f"[步骤缓存] 全部 {done} 个步骤未改动，直接使用缓存的结果")
+            print(f"[步骤{done}后] {len(df)} 行 × {len(df.columns)} 列")
         else:
-            print(f"[错误] 有多个 Sheet，请用 --sheet 指定")
-            print(f"[可用 Sheet] {', '.join(sheets.keys())}")
+            print(f"[清洗前] {len(df)} 行 × {len(df.columns)} 列")
+        if optimize and checkpoint and rest:
+            print(f"[提示] 逐步缓存每一步的结果，按原顺序执行（不做自动优化）；-o 导出时续跑并按优化后的计划执行")
+
+        if plan is None:
+            views = _ColumnViews()
+            df = _to_backend(df)
+            for no, step in enumerate(rest, done + 1):
+                before, df_before = len(df), df
+                with _profiled(f"步骤{no} {_step_label(step)}", "step", rows_in=before) as record:
+                    df = _apply_step(df, step, views=views)
+                    record["rows_out"] = len(df)
+                print(f"  步骤{no} {_step_message(step, before, len(df), df_before)}")
+                if checkpoint:
+                    _cache_store(keys[no - 1], df, {"kind": "step", "file": os.path.abspath(file_path),
+                                                    "sheet": sheet_name, "step": no})
+            df = _decode_categories(_from_backend(df))
+        else:
+            plan.compile(df)
+            if explain:
+                plan.explain()
+                print(f"  （--preview --exact、不超过样本行数的表预览等逐步缓存每一步结果时按原顺序执行，不做以上优化）")
+                literal, t_literal = df.copy(), time.perf_counter()
+                with redirect_stdout(io.StringIO()):
+                    views = _ColumnViews()
+                    for step in steps:
+                        literal = _apply_step(literal, step, views=views)
+                    literal = _decode_categories(literal)
+                t_literal = time.perf_counter() - t_literal
+            t_plan = time.perf_counter()
+            df = plan.run(df)
+            t_plan = time.perf_counter() - t_plan
+            note = plan.summary()
+            if note:
+                print(f"[优化] {note}" + ("" if explain else "（--explain 查看执行计划）"))
+            if explain:
+                same = literal.reset_index(drop=True).equals(df.reset_index(drop=True))
+                print(f"[计划对比] 按原顺序 {t_literal:.3f}s → 优化后 {t_plan:.3f}s，"
+                      f"结果一致: {'是' if same else '否'}")
+
+        # 四舍五入浮点显示
+        float_cols = df.select_dtypes(include="float").columns
+        df[float_cols] = df[float_cols].round(2)
+
+        print(f"\n[清洗后] {len(df)} 行 × {len(df.columns)} 列")
+
+        # 预览
+        if preview_only or not output_path:
+            print(f"\n预览前 10 行：")
+            print(df.head(10).to_string(index=False))
+            if not output_path:
+                print(f"\n[提示] 未指定输出路径，仅预览。用 -o 指定输出文件。")
             return
 
-    with open(rules_path, encoding="utf-8") as f:
-        rules = json.load(f)
+        # 导出：逐块写出，避免整表序列化成一个大字符串
+        _write_chunks(_slices(df, EXPORT_CHUNK_ROWS), output_path)
+        print(f"[导出] {output_path} ({len(df)}行)")
 
-    # 校验 steps 格式
-    errors = _validate_steps(rules)
-    if errors:
-        print(f"[规则校验失败] {rules_path}")
-        for e in errors:
-            print(f"  {e}")
-        print(f"\n[提示] 用 help 查看正确格式：")
-        # 提取出错的 action 名称用于提示
-        actions_mentioned = set()
-        for step in rules.get("steps", []):
-            a = step.get("action")
-            if a and a in _ACTION_REQUIRED:
-                actions_mentioned.add(a)
-        if actions_mentioned:
-            for a in sorted(actions_mentioned):
-                print(f"  python {TOOL_PATH} help {a}")
-        else:
-            print(f"  python {TOOL_PATH} help")
-        return
 
-    df = read_to_dataframe(file_path, sheet_name, sheet_cfg)
-    print(f"[引擎] 读取={READ_ENGINE}, 处理=pandas")
-    print(f"[Sheet] {sheet_name}")
-    print(f"[清洗前] {len(df)} 行 × {len(df.columns)} 列")
+def _str_columns(df):
+    if isinstance(df, _PolarsFrame):
+        return pd.Index(df.text_columns(), dtype=object)
+    return df.select_dtypes(include=["object", "str", "category"]).columns
 
-    for i, step in enumerate(rules.get("steps", [])):
-        action = step.get("action")
-        before = len(df)
-
-        if action == "trim":
-            cols = step.get("columns", df.select_dtypes(include=["object", "str"]).columns.tolist())
-            for c in cols:
-                if c in df.columns and c in df.select_dtypes(include=["object", "str"]).columns:
-                    df[c] = df[c].astype(str).str.strip()
-            print(f"  步骤{i+1} [去空格] {cols}")
-
-        elif action == "replace":
-            col = step["column"]
-            mapping = step["mapping"]
-            df[col] = df[col].astype(str).replace(mapping)
-            print(f"  步骤{i+1} [替换] {col}: {len(mapping)}个映射规则")
-
-        elif action == "fill_empty":
-            col = step["column"]
-            fill_val = step["value"]
-            df[col] = df[col].replace(["", "None", "nan"], pd.NA)
-            df[col] = df[col].fillna(fill_val)
-            print(f"  步骤{i+1} [填充空值] {col}: 填充为 {fill_val}")
-
-        elif action == "dedup":
-            dedup_cols = step.get("columns")
-            before_len = len(df)
-            df = df.drop_duplicates(subset=dedup_cols, keep="first")
-            print(f"  步骤{i+1} [去重] 按{dedup_cols or '全列'}: 移除{before_len - len(df)}条")
-
-        elif action == "filter":
-            conditions = step.get("conditions", [])
-            logic = step.get("logic", "and")
-            masks = []
-            for cond in conditions:
-                col, op, val = cond["column"], cond["op"], cond["value"]
-                col_num = pd.to_numeric(df[col], errors="coerce")
+
+class _ColumnViews:
+    """一次清洗 / 查询内共享的列类型视图：同一列的 to_numeric 和 astype(str) 只算一次。
+
+    视图带着算出时的行索引；之后的步骤只筛选、去重、排序行时按当前行索引取出对应部分，
+    不重新解析。步骤改写了某列后由 invalidate 丢弃该列的视图。
+
+    to_numeric 的结果类型取决于有哪些行（整列是整数文本时为 int，夹着非数值时为 float），
+    取出的部分值相同但类型可能不同：比较和排序可以直接用，要写回列时传 exact=True。
+    """
+
+    def __init__(self):
+        self._views = {}  # (类型, 列名) → Series
+
+    def numeric(self, df, col, exact=False):
+        """exact 时视图来自更多的行就按当前行重新转换，类型与直接 to_numeric 一致"""
+        return self._get(df, col, "numeric",
+                         lambda s: _per_value(s, lambda v: pd.to_numeric(v, errors="coerce")), exact)
+
+    def text(self, df, col):
+        return self._get(df, col, "text", lambda s: _per_value(s, lambda v: v.astype(str)))
+
+    def invalidate(self, cols=None):
+        """丢弃这些列的视图；cols 为 None 时全部丢弃"""
+        if cols is None:
+            self._views.clear()
+            return
+        for key in [k for k in self._views if k[1] in cols]:
+            del self._views[key]
+
+    def _get(self, df, col, kind, convert, exact=False):
+        view, direct = self._views.get((kind, col), (None, False))  # direct: 按这些行直接转换所得
+        if view is not None and not view.index.equals(df.index):
+            # 中间只有筛选、去重、排序：行索引唯一时当前各行都能在视图中找到；行数相同只是重排
+            same_rows = len(view) == len(df)
+            if df.index.is_unique and view.index.is_unique and (same_rows or not exact):
+                view, direct = view.reindex(df.index), direct and same_rows
+            else:
+                view = None
+        if view is None or (exact and not direct):
+            view, direct = convert(df[col]), True
+        self._views[(kind, col)] = (view, direct)
+        return view
+
+
+def _step_mutates(step):
+    """步骤会改写的列；None 表示可能改写任何列或整表重建（聚合、透视、重命名等）"""
+    action = step.get("action")
+    if action in ("dedup", "filter", "sort"):
+        return set()
+    if action in ("replace", "regex_replace", "fill_empty"):
+        return {step["column"]}
+    if action == "add_column":
+        return {step["name"]}
+    if action in ("drop_columns", "type_convert") or (action == "trim" and "columns" in step):
+        return set(step["columns"])
+    return None
+
+
+def _apply_step(df, step, numeric=None, views=None):
+    """执行一个清洗步骤，返回新的 DataFrame。
+
+    numeric: {列名: 是否按数值处理}，按整表统计（分块执行时各块只有部分行）；未给出的列按当前各行自行判断。
+             filter 只看真假；add_column 还区分整表转数值后是整数 "i" 还是浮点 "f"（见 _formula_column）。
+    views: 流程内共享的 _ColumnViews；不给时只在本步骤内复用。
+    df 是 polars 后端的 _PolarsFrame 时交给它执行。
+    """
+    if isinstance(df, _PolarsFrame):
+        return df.apply_step(step)
+    action = step.get("action")
+    if views is None:
+        views = _ColumnViews()
+
+    if action == "trim":
+        cols = step.get("columns", _str_columns(df).tolist())
+        for c in cols:
+            if c in df.columns and c in _str_columns(df):
+                df[c] = _per_value(df[c], lambda s: s.astype(str).str.strip())
+
+    elif action == "replace":
+        col = step["column"]
+        df[col] = _per_value(df[col], lambda s: s.astype(str).replace(step["mapping"]))
+
+    elif action == "fill_empty":
+        col = step["column"]
+        df[col] = _per_value(df[col], lambda s: s.replace(["", "None", "nan"], pd.NA).fillna(step["value"]))
+
+    elif action == "dedup":
+        df, checked, collisions = _dedup_frame(df, step.get("columns"), step.get("keep", "first"))
+        _print_dedup_check(checked, collisions)
+
+    elif action == "filter":
+        logic = step.get("logic", "and")
+        masks = []
+        for cond in step.get("conditions", []):
+            col, op, val = cond["column"], cond["op"], cond["value"]
+            col_num = views.numeric(df, col)
+            is_numeric = (numeric or {}).get(col)
+            if is_numeric is None:
                 is_numeric = col_num.notna().any()
 
-                if is_numeric and op in (">", "<", ">=", "<=", "==", "!="):
-                    val_n = float(val)
-                    op_map = {">": "gt", "<": "lt", ">=": "ge", "<=": "le", "==": "eq", "!=": "ne"}
-                    masks.append(getattr(col_num, op_map[op])(val_n))
+            if is_numeric and op in (">", "<", ">=", "<=", "==", "!="):
+                val_n = float(val)
+                op_map = {">": "gt", "<": "lt", ">=": "ge", "<=": "le", "==": "eq", "!=": "ne"}
+                masks.append(getattr(col_num, op_map[op])(val_n))
+            elif op in _TEXT_MASKS:
+                if _is_category(df[col]):
+                    # 分类列只比较各个不同值，再按编码展开
+                    masks.append(_per_value(df[col], lambda v: _TEXT_MASKS[op](v.astype(str), val)))
                 else:
-                    s = df[col].astype(str)
-                    if op == "==":           masks.append(s == val)
-                    elif op == "!=":         masks.append(s != val)
-                    elif op == "contains":   masks.append(s.str.contains(val, na=False))
-                    elif op == "not_contains": masks.append(~s.str.contains(val, na=False))
-                    elif op == "startswith": masks.append(s.str.startswith(val, na=False))
-                    elif op == "endswith":   masks.append(s.str.endswith(val, na=False))
-
-            if masks:
-                combined = masks[0]
-                for m in masks[1:]:
-                    combined = (combined & m) if logic == "and" else (combined | m)
-                df = df[combined]
-            print(f"  步骤{i+1} [筛选] {logic.upper()} {len(conditions)}条件: {before}→{len(df)}行")
-
-        elif action == "regex_replace":
-            col = step["column"]
-            df[col] = df[col].astype(str).str.replace(
-                step["pattern"], step["replacement"], regex=True
-            )
-            print(f"  步骤{i+1} [正则替换] {col}")
-
-        elif action == "add_column":
-            col_name = step["name"]
-            formula = step["formula"]
-            rnd = step.get("round")
-            # 构建 pandas eval 表达式：{列名} → `列名`
-            expr = formula
-            for h in df.columns:
-                expr = expr.replace("{" + h + "}", f"`{h}`")
+                    masks.append(_TEXT_MASKS[op](views.text(df, col), val))
+
+        if masks:
+            combined = masks[0]
+            for m in masks[1:]:
+                combined = (combined & m) if logic == "and" else (combined | m)
+            df = df[combined]
+
+    elif action == "regex_replace":
+        col = step["column"]
+        df[col] = _per_value(df[col], lambda s: s.astype(str).str.replace(
+            step["pattern"], step["replacement"], regex=True
+        ))
+
+    elif action == "add_column":
+        col_name = step["name"]
+        rnd = step.get("round")
+        try:
+            # 公式按文本编译一次（batch 中各文件共用），引用列自动转数值后向量化计算
+            df[col_name] = _compile_formula(step["formula"]).evaluate(df, views, numeric)
+            if rnd is not None:
+                df[col_name] = df[col_name].round(rnd)
+        except Exception as e:
+            df[col_name] = pd.NA
+            print(f"    警告: 公式计算失败 - {e}")
+
+    elif action == "drop_columns":
+        df = df.drop(columns=[c for c in step["columns"] if c in df.columns])
+
+    elif action == "sort":
+        # 稳定排序：相同键保持原顺序（与分块执行的归并排序结果一致）
+        keys = views.numeric(df, step["column"])
+        df = df.sort_values(step["column"], ascending=not step.get("desc", False),
+                            key=lambda _: keys, kind="stable")
+
+    elif action == "aggregate":
+        # 先转数值列
+        for col in step["metrics"]:
+            df[col] = views.numeric(df, col, exact=True)
+        # 分类列按编码分组，只输出出现过的组合；分组结果很小，还原为普通文本列
+        df = _decode_categories(df.groupby(step["group_by"], as_index=False, observed=True)
+                                .agg(_agg_map(step["metrics"])))
+
+    elif action == "rename":
+        df = df.rename(columns=step["mapping"])
+
+    elif action == "type_convert":
+        for col, dtype in step["columns"].items():
+            if dtype in ("int", "float"):
+                df[col] = views.numeric(df, col, exact=True)
+                if dtype == "int":
+                    df[col] = df[col].fillna(0).astype(int)
+            elif dtype == "datetime":
+                df[col] = pd.to_datetime(_plain_series(df[col]), errors="coerce")
+            elif dtype == "str":
+                df[col] = views.text(df, col)
+
+    elif action == "pivot":
+        # 行列键可以是分类列（按编码分组），值列还原后再聚合
+        keys = set(_as_list(step["index"])) | set(_as_list(step["columns"]))
+        df = _decode_categories(df, [c for c in df.columns if c not in keys])
+        df = _decode_categories(_flatten_columns(pd.pivot_table(df,
+                                                                index=step["index"],
+                                                                columns=step["columns"],
+                                                                values=step["values"],
+                                                                aggfunc=step.get("aggfunc", "sum"),
+                                                                observed=True).reset_index()))
+
+    views.invalidate(_step_mutates(step))
+    return df
+
+
+# filter 的文本比较（分类列在各个不同值上比较）
+_TEXT_MASKS = {
+    "==": lambda s, val: s == val,
+    "!=": lambda s, val: s != val,
+    "contains": lambda s, val: s.str.contains(val, na=False),
+    "not_contains": lambda s, val: ~s.str.contains(val, na=False),
+    "startswith": lambda s, val: s.str.startswith(val, na=False),
+    "endswith": lambda s, val: s.str.endswith(val, na=False),
+}
+
+
+def _agg_map(metrics):
+    return {col: "mean" if func == "avg" else func for col, func in metrics.items()}
+
+
+def _flatten_columns(df):
+    df.columns = [str(c) if not isinstance(c, tuple) else "_".join(str(x) for x in c)
+                  for c in df.columns]
+    return df
+
+
+def _step_message(step, before, after, df):
+    """步骤执行结果说明（不含"步骤N"前缀）；df 为执行该步骤的 DataFrame，trim 未指定列时用"""
+    action = step.get("action")
+    if action == "trim":
+        return f"[去空格] {step.get('columns', _str_columns(df).tolist())}"
+    if action == "replace":
+        return f"[替换] {step['column']}: {len(step['mapping'])}个映射规则"
+    if action == "fill_empty":
+        return f"[填充空值] {step['column']}: 填充为 {step['value']}"
+    if action == "dedup":
+        kept = "，保留最后一条" if step.get("keep") == "last" else ""
+        return f"[去重] 按{step.get('columns') or '全列'}: 移除{before - after}条{kept}"
+    if action == "filter":
+        logic = step.get("logic", "and")
+        return f"[筛选] {logic.upper()} {len(step.get('conditions', []))}条件: {before}→{after}行"
+    if action == "regex_replace":
+        return f"[正则替换] {step['column']}"
+    if action == "add_column":
+        return f"[新增列] {step['name']}"
+    if action == "drop_columns":
+        return f"[删列] {step['columns']}"
+    if action == "sort":
+        return f"[排序] {step['column']} {'降序' if step.get('desc', False) else '升序'}"
+    if action == "aggregate":
+        return f"[聚合] 按{step['group_by']}: {after}组"
+    if action == "rename":
+        return f"[重命名] {step['mapping']}"
+    if action == "type_convert":
+        return f"[类型转换] {step['columns']}"
+    if action == "pivot":
+        return f"[透视] {step['index']} × {step['columns']}"
+    valid = "trim replace fill_empty dedup filter regex_replace add_column drop_columns sort aggregate rename type_convert pivot"
+    return f"[错误] 未知操作 '{action}'，跳过\n         [可用操作] {valid}"
+
+
+# ==================== add_column 公式：编译一次，向量化计算 ====================
+
+_RE_FORMULA_REF = re.compile(r"\{([^{}]+)\}")
+
+# 编译好的公式，按公式文本缓存（batch 中多个文件共用）
+_formula_cache = {}
+
+# numexpr 可选：未安装时用 NumPy 计算；行数太少时 numexpr 的调度开销不划算
+_numexpr_module = None
+_NUMEXPR_MIN_ROWS = 10000
+
+_FORMULA_BINOPS = {"Add": ("+", operator.add), "Sub": ("-", operator.sub), "Mult": ("*", operator.mul),
+                   "Div": ("/", operator.truediv),
+                   # 这几个只走 NumPy：numexpr 的 % 按 C fmod 取符号、没有 //、** 与 NumPy 末位可能不同
+                   "Mod": (None, operator.mod), "FloorDiv": (None, operator.floordiv),
+                   "Pow": (None, operator.pow)}
+_FORMULA_COMPARE = {"Eq": ("==", operator.eq), "NotEq": ("!=", operator.ne), "Lt": ("<", operator.lt),
+                    "LtE": ("<=", operator.le), "Gt": (">", operator.gt), "GtE": (">=", operator.ge)}
+
+
+class _FormulaUnsupported(ValueError):
+    """公式用了编译器不支持的写法（退回 pandas eval）"""
+
+
+def _numexpr():
+    global _numexpr_module
+    if _numexpr_module is None:
+        try:
+            import numexpr
+            _numexpr_module = numexpr
+        except ImportError:
+            _numexpr_module = False
+    return _numexpr_module or None
+
+
+def _formula_bool(x):
+    """条件值 → 布尔数组：数值非 0 为真，空值为假"""
+    a = np.asarray(x)
+    if a.dtype == bool:
+        return a
+    if a.dtype.kind in "iu":
+        return a != 0
+    if a.dtype.kind == "f":
+        return (a != 0) & ~np.isnan(a)
+    out = np.zeros(a.shape, dtype=bool)
+    mask = pd.notna(a)
+    out[mask] = [bool(v) for v in a[mask]]
+    return out
+
+
+def _formula_where(cond, a, b):
+    """按条件逐行取值；一边是文本时两边都按 object 处理，避免数值被转成字符串"""
+    a, b = np.asarray(a), np.asarray(b)
+    if a.dtype.kind in "OUS" or b.dtype.kind in "OUS":
+        a, b = a.astype(object), b.astype(object)
+    return np.where(cond, a, b)
+
+
+def _formula_coalesce(*args):
+    result = args[0]
+    for value in args[1:]:
+        result = _formula_where(pd.isna(np.asarray(result)), value, result)
+    return result
+
+
+def _formula_round(x, digits=0):
+    return np.round(x, int(digits))
+
+
+_FORMULA_FUNCS = {
+    "round": _formula_round,
+    "abs": lambda x: np.abs(x),  # 用到时再取 np.abs，导入本模块时不加载 numpy
+    "min": lambda *args: functools.reduce(np.fmin, args),
+    "max": lambda *args: functools.reduce(np.fmax, args),
+    "coalesce": _formula_coalesce,
+    "if": lambda cond, a, b: _formula_where(_formula_bool(cond), a, b),
+}
+_FORMULA_FUNCS["iif"] = _FORMULA_FUNCS["if"]
+
+
+class _Formula:
+    """add_column 的公式：{列名} 换成变量后解析一次，编译成逐列向量计算的函数。
+
+    支持 + - * / // % **、比较、and/or/not（及 & | ~）、in [...]、a if 条件 else b，
+    以及 IF(条件, 真值, 假值)、round、abs、min、max、coalesce（函数名不区分大小写）。
+    引用的文本列只要有值能转成数值就按数值计算（转不了的为空）；全是文本的列保持文本，
+    可以和字符串比较。只含数值运算时有 numexpr 就交给 numexpr。
+    其他写法（如 pandas eval 的方法调用）退回 df.eval，与旧规则兼容。
+    """
+
+    def __init__(self, formula):
+        self.formula = formula
+        self.refs = list(dict.fromkeys(_RE_FORMULA_REF.findall(formula)))
+        names = {ref: f"_c{i}" for i, ref in enumerate(self.refs)}
+        expr = _RE_FORMULA_REF.sub(lambda m: names[m.group(1)], formula)
+        self.fallback = None
+        self.ne_expr = None
+        try:
+            import ast
+            tree = ast.parse(expr.strip(), mode="eval").body
+            self._fn, self.ne_expr, _ = self._compile(ast, tree)
+        except (SyntaxError, _FormulaUnsupported):
+            self.fallback = _RE_FORMULA_REF.sub(lambda m: f"`{m.group(1)}`", formula)
+
+    def _compile(self, ast, node):
+        """返回 (求值函数 env→值, numexpr 表达式或 None, 结果是否为布尔)"""
+        kind = type(node).__name__
+        if isinstance(node, ast.Constant):
+            value = np.nan if node.value is None else node.value
+            if not isinstance(value, (int, float, str)):
+                raise _FormulaUnsupported(kind)
+            ne = None if isinstance(value, str) else repr(value)
+            return (lambda env: value), ne, isinstance(value, bool)
+        if isinstance(node, ast.Name):
+            name = node.id
+            if not name.startswith("_c"):
+                raise _FormulaUnsupported(name)
+            return (lambda env: env[name]), name, False
+        if isinstance(node, ast.BinOp):
+            op = type(node.op).__name__
+            left, l_ne, l_bool = self._compile(ast, node.left)
+            right, r_ne, r_bool = self._compile(ast, node.right)
+            if op in ("BitAnd", "BitOr"):
+                func = np.logical_and if op == "BitAnd" else np.logical_or
+                ne = f"({l_ne} {'&' if op == 'BitAnd' else '|'} {r_ne})" if l_ne and r_ne and l_bool and r_bool else None
+                return (lambda env: func(_formula_bool(left(env)), _formula_bool(right(env)))), ne, True
+            if op not in _FORMULA_BINOPS:
+                raise _FormulaUnsupported(op)
+            symbol, func = _FORMULA_BINOPS[op]
+            ne = f"({l_ne} {symbol} {r_ne})" if symbol and l_ne and r_ne and not (l_bool or r_bool) else None
+            return (lambda env: func(left(env), right(env))), ne, False
+        if isinstance(node, ast.UnaryOp):
+            op = type(node.op).__name__
+            operand, o_ne, o_bool = self._compile(ast, node.operand)
+            if op in ("Not", "Invert"):
+                return (lambda env: np.logical_not(_formula_bool(operand(env)))), (
+                    f"(~{o_ne})" if o_ne and o_bool else None), True
+            func = {"USub": operator.neg, "UAdd": operator.pos}.get(op)
+            if func is None:
+                raise _FormulaUnsupported(op)
+            return (lambda env: func(operand(env))), (
+                f"({'-' if op == 'USub' else '+'}{o_ne})" if o_ne and not o_bool else None), False
+        if isinstance(node, ast.BoolOp):
+            parts = [self._compile(ast, v) for v in node.values]
+            func = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            joiner = " & " if isinstance(node.op, ast.And) else " | "
+            ne = "(" + joiner.join(p[1] for p in parts) + ")" if all(p[1] and p[2] for p in parts) else None
+            fns = [p[0] for p in parts]
+            return (lambda env: functools.reduce(func, (_formula_bool(f(env)) for f in fns))), ne, True
+        if isinstance(node, ast.Compare):
+            operands = [self._compile(ast, node.left)] + [
+                (None, None, False) if isinstance(c, (ast.List, ast.Tuple)) else self._compile(ast, c)
+                for c in node.comparators]
+            checks, ne_parts = [], []
+            for op, (left, l_ne, _), (right, r_ne, _), comp in zip(
+                    node.ops, operands, operands[1:], node.comparators):
+                name = type(op).__name__
+                if left is None or (right is None) != (name in ("In", "NotIn")):
+                    raise _FormulaUnsupported(name)  # in / not in 只接常量列表
+                if name in ("In", "NotIn"):
+                    if not all(isinstance(e, ast.Constant) for e in comp.elts):
+                        raise _FormulaUnsupported(name)
+                    values = [e.value for e in comp.elts]
+                    negate = name == "NotIn"
+                    checks.append(lambda env, left=left, values=values, negate=negate:
+                                  np.isin(np.asarray(left(env), dtype=object), values) != negate)
+                    ne_parts.append(None)
+                    continue
+                if name not in _FORMULA_COMPARE:
+                    raise _FormulaUnsupported(name)
+                symbol, func = _FORMULA_COMPARE[name]
+                checks.append(lambda env, left=left, right=right, func=func: func(left(env), right(env)))
+                ne_parts.append(f"({l_ne} {symbol} {r_ne})" if l_ne and r_ne else None)
+            ne = " & ".join(ne_parts) if all(ne_parts) else None
+            ne = f"({ne})" if ne and len(ne_parts) > 1 else ne
+            return (lambda env: functools.reduce(np.logical_and, (check(env) for check in checks))), ne, True
+        if isinstance(node, ast.IfExp):
+            test, t_ne, t_bool = self._compile(ast, node.test)
+            body, b_ne, b_bool = self._compile(ast, node.body)
+            orelse, o_ne, o_bool = self._compile(ast, node.orelse)
+            ne = (f"where({t_ne}, {b_ne}, {o_ne})"
+                  if t_ne and b_ne and o_ne and t_bool and not (b_bool or o_bool) else None)
+            return (lambda env: _formula_where(_formula_bool(test(env)), body(env), orelse(env))), ne, False
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.keywords:
+                raise _FormulaUnsupported(kind)
+            name = node.func.id.lower()
+            func = _FORMULA_FUNCS.get(name)
+            if func is None:
+                raise _FormulaUnsupported(node.func.id)
+            args = [self._compile(ast, a) for a in node.args]
+            fns = [a[0] for a in args]
+            ne = None
+            if name in ("if", "iif") and len(args) == 3 and all(a[1] for a in args) \
+                    and args[0][2] and not (args[1][2] or args[2][2]):
+                ne = f"where({args[0][1]}, {args[1][1]}, {args[2][1]})"
+            elif name == "abs" and len(args) == 1 and args[0][1] and not args[0][2]:
+                ne = f"abs({args[0][1]})"
+            return (lambda env: func(*(f(env) for f in fns))), ne, False
+        raise _FormulaUnsupported(kind)
+
+    def evaluate(self, df, views=None, numeric=None):
+        """在 df 上计算，返回与 df 行对齐的 Series（公式不引用列时为单个值）。
+
+        numeric: {列名: False / "i" / "f"}，按整表统计的引用列类型（见 _formula_column）。
+        """
+        if self.fallback is not None:
+            return df.eval(self.fallback)
+        for ref in self.refs:
+            if ref not in df.columns:
+                raise KeyError(f"列名不存在: {ref}")
+        views = _ColumnViews() if views is None else views
+        numeric = numeric or {}
+        env = {f"_c{i}": _formula_column(df, ref, views, numeric.get(ref)) for i, ref in enumerate(self.refs)}
+        result = None
+        ne = _numexpr()
+        if (ne and self.ne_expr and len(df) >= _NUMEXPR_MIN_ROWS
+                and all(a.dtype in (np.float64, np.int64) for a in env.values())):
             try:
-                df[col_name] = df.eval(expr)
-                if rnd is not None:
-                    df[col_name] = df[col_name].round(rnd)
-            except Exception as e:
-                df[col_name] = pd.NA
-                print(f"    警告: 公式计算失败 - {e}")
-            print(f"  步骤{i+1} [新增列] {col_name}")
-
-        elif action == "drop_columns":
-            drop = step["columns"]
-            df = df.drop(columns=[c for c in drop if c in df.columns])
-            print(f"  步骤{i+1} [删列] {drop}")
-
-        elif action == "sort":
-            col = step["column"]
-            desc = step.get("desc", False)
-            df = df.sort_values(col, ascending=not desc,
-                                key=lambda x: pd.to_numeric(x, errors="coerce"))
-            print(f"  步骤{i+1} [排序] {col} {'降序' if desc else '升序'}")
-
-        elif action == "aggregate":
-            group_by = step["group_by"]
-            metrics = step["metrics"]
-            # 先转数值列
-            for col in metrics:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-            agg_map = {}
-            for col, func in metrics.items():
-                if func == "avg":
-                    agg_map[col] = "mean"
-                else:
-                    agg_map[col] = func
-            df = df.groupby(group_by, as_index=False).agg(agg_map)
-            print(f"  步骤{i+1} [聚合] 按{group_by}: {len(df)}组")
-
-        elif action == "rename":
-            df = df.rename(columns=step["mapping"])
-            print(f"  步骤{i+1} [重命名] {step['mapping']}")
-
-        elif action == "type_convert":
-            for col, dtype in step["columns"].items():
-                if dtype in ("int", "float"):
-                    df[col] = pd.to_numeric(df[col], errors="coerce")
-                    if dtype == "int":
-                        df[col] = df[col].fillna(0).astype(int)
-                elif dtype == "datetime":
-                    df[col] = pd.to_datetime(df[col], errors="coerce")
-                elif dtype == "str":
-                    df[col] = df[col].astype(str)
-            print(f"  步骤{i+1} [类型转换] {step['columns']}")
-
-        elif action == "pivot":
-            df = pd.pivot_table(df,
-                                index=step["index"],
-                                columns=step["columns"],
-                                values=step["values"],
-                                aggfunc=step.get("aggfunc", "sum")).reset_index()
-            df.columns = [str(c) if not isinstance(c, tuple) else "_".join(str(x) for x in c)
-                          for c in df.columns]
-            print(f"  步骤{i+1} [透视] {step['index']} × {step['columns']}")
+                result = ne.evaluate(self.ne_expr, local_dict=env)
+            except Exception:
+                result = None  # numexpr 不支持的组合（如整数负数次幂）交给 NumPy
+        if result is None:
+            with np.errstate(all="ignore"):
+                result = self._fn(env)
+        if np.ndim(result) == 0:
+            return result.item() if isinstance(result, np.generic) else result
+        return pd.Series(result, index=df.index)
+
+
+def _compile_formula(formula):
+    compiled = _formula_cache.get(formula)
+    if compiled is None:
+        compiled = _formula_cache[formula] = _Formula(formula)
+    return compiled
+
+
+def _formula_column(df, name, views, kind=None):
+    """公式引用的列 → NumPy 数组：数值 / 布尔 / 日期列原样；文本列能转数值就转（转不了的为空）。
+
+    kind 为整表统计的结果（False：全是文本，保持文本；"i" / "f"：转成整数 / 浮点），分块执行和
+    样本预览时传入，结果与整表计算一致；不给时按当前各行判断。
+    """
+    s = df[name]
+    if s.dtype.kind in "iufbmM":
+        if isinstance(s.dtype, np.dtype):
+            return s.to_numpy()
+        return s.to_numpy(dtype="float64", na_value=np.nan)  # 可空整数等扩展类型
+    num = views.numeric(df, name, exact=True)
+    if kind is None:
+        kind = _numeric_kind(num, s)
+    if not kind:
+        return s.to_numpy(dtype=object)
+    arr = num.to_numpy(dtype="float64", na_value=np.nan) if not isinstance(num.dtype, np.dtype) \
+        else num.to_numpy()
+    return arr.astype("float64") if kind == "f" and arr.dtype.kind != "f" else arr
+
+
+def _numeric_kind(num, s):
+    """文本列 s 在公式中的类型（num 为其转数值的结果）：有值能转数值或全空时按数值（"i" / "f"），否则 False"""
+    if num.notna().any() or s.isna().all():
+        return "f" if num.dtype.kind == "f" or not isinstance(num.dtype, np.dtype) else "i"
+    return False
+
+
+def _stats_kind(stat):
+    """整表统计（见 _kind_stats）→ 该列在公式中的类型，与对整列调用 _numeric_kind 的结果相同"""
+    has_num, all_null, has_float = stat
+    if not (has_num or all_null):
+        return False
+    return "f" if has_float or not has_num else "i"
+
+
+# ==================== dedup：按去重键的 64 位摘要判重，重复行逐值核对 ====================
+
+# 分块 dedup 时摘要数组的内存上限 DEDUP_MEMORY（EXCEL_TOOL_DEDUP_MB）见 _load_env_settings
+
+_DIGEST_MULT = 0x100000001B3
+
+
+def _key_columns(df, cols):
+    """去重键各列 → [(值数组, 空值掩码)]：数值 / 日期列保留 NumPy 类型，其余转为 object"""
+    columns = []
+    for col in cols:
+        s = df[col]
+        kind = s.dtype.kind if isinstance(s.dtype, np.dtype) else "O"
+        if _is_category(s):
+            # 同一列中相同的值编码相同，按编码判重；空值编码为 -1，与文本列的 NaN 一样按 float 空值处理
+            values = s.cat.codes.to_numpy()
+            null = values < 0
+        elif kind in "biufmM":
+            values = s.to_numpy()
+            null = np.isnan(values) if kind == "f" else np.isnat(values) if kind in "mM" \
+                else np.zeros(len(s), dtype=bool)
+        else:
+            values = s.to_numpy(dtype=object)
+            null = pd.isna(values)
+        columns.append((values, null))
+    return columns
+
+
+def _column_digests(values, null, null_kinds=False):
+    """一列 → 每个值的 64 位摘要（Python 内置 hash，字符串的 hash 已缓存在对象上，不必重算）。
+
+    相等的值 hash 一定相同（含 1、1.0 与 True，-0.0 与 0.0），所以整数列与对象列中的同一数值
+    摘要相同，分块间列类型不同也不影响；摘要只在本进程内有效。空值统一按类型取摘要：
+    null_kinds 为 True 时不同类空值（None、NaN、pd.NA、NaT）摘要不同。
+    """
+    if values.dtype.kind in "mM":
+        digests = pd.util.hash_array(values.view("i8"))
+        kinds = ["NaTType"] * int(null.sum())
+    else:
+        items = values if values.dtype == object else values.tolist()
+        digests = np.fromiter(map(hash, items), dtype=np.int64, count=len(values)).view(np.uint64)
+        kinds = [type(v).__name__ for v in values[null]] if values.dtype == object else ["float"] * int(null.sum())
+    if null.any():
+        digests[null] = pd.util.hash_array(np.array(kinds if null_kinds else [""], dtype=object))
+    return digests
+
+
+def _key_digests(columns):
+    """每行去重键（_key_columns 的结果）→ 64 位摘要：相等的键摘要一定相同，摘要相同的键仍需逐值核对。
+
+    与 drop_duplicates 一致：只按一列去重时 None、NaN、pd.NA、NaT 互不相等，多列时空值都相等。
+    """
+    digests = np.zeros(len(columns[0][0]) if columns else 0, dtype=np.uint64)
+    for values, null in columns:
+        digests = digests * np.uint64(_DIGEST_MULT) ^ _column_digests(values, null, len(columns) == 1)
+    return digests
+
+
+def _keys_equal(columns, left, other, right):
+    """逐值比较 columns 的 left 行与 other 的 right 行上的去重键（与 drop_duplicates 的相等规则一致）；
+    两边都是 _key_columns 的结果（可以是同一个）"""
+    same = np.ones(len(left), dtype=bool)
+    for (values, null), (other_values, other_null) in zip(columns, other):
+        a, b = values[left], other_values[right]
+        null_a, null_b = null[left], other_null[right]
+        equal = np.zeros(len(left), dtype=bool)
+        both = ~null_a & ~null_b
+        equal[both] = (a[both] == b[both]).astype(bool)
+        nulls = null_a & null_b
+        if a.dtype == object and b.dtype == object and len(columns) == 1:
+            equal[nulls] = [type(x) is type(y) for x, y in zip(a[nulls], b[nulls])]
+        else:
+            equal[nulls] = True
+        same &= equal
+    return same
+
+
+def _row_keys(df, cols):
+    """各行去重键 → 元组列表；空值换成 (空值标记, 类型)，多列时类型统一为 None（空值都相等）"""
+    columns = []
+    for col in cols:
+        values = df[col].to_numpy(dtype=object)  # str 列可能直接返回底层数组，只改 tolist 的副本
+        keys = values.tolist()
+        for i in np.flatnonzero(pd.isna(values)):
+            keys[i] = (_row_keys, type(keys[i]) if len(cols) == 1 else None)
+        columns.append(keys)
+    return list(zip(*columns))
+
+
+def _dedup_frame(df, cols, keep="first"):
+    """整表去重，结果与 drop_duplicates(subset=cols, keep=keep) 一致。
+
+    先按摘要判重，每个重复行再与保留行逐值核对；摘要相同但键不同（哈希冲突）的组交给
+    drop_duplicates 精确处理。返回 (去重后的 DataFrame, 核对的重复行数, 冲突行数)。
+    """
+    cols = cols or list(df.columns)
+    columns = _key_columns(df, cols)
+    codes = pd.factorize(_key_digests(columns))[0]
+    positions = np.arange(len(df))
+    kept_at = np.empty(codes.max() + 1 if len(codes) else 0, dtype=np.int64)
+    if keep == "last":
+        kept_at[codes] = positions
+    else:
+        kept_at[codes[::-1]] = positions[::-1]
+    rep = kept_at[codes]
+    dup = np.flatnonzero(rep != positions)
+    mask = np.ones(len(df), dtype=bool)
+    mask[dup] = False
+    bad = dup[~_keys_equal(columns, dup, columns, rep[dup])]
+    if len(bad):
+        rows = np.flatnonzero(np.isin(codes, codes[bad]))
+        mask[rows] = ~df.iloc[rows].duplicated(subset=cols, keep=keep).to_numpy()
+    return df[mask], len(dup) - len(bad), len(bad)
+
+
+def _print_dedup_check(checked, collisions):
+    if checked or collisions:
+        print(f"    [去重校验] 摘要相同的 {checked + collisions} 行已逐值核对：重复 {checked} 行，哈希冲突 {collisions} 行")
+
+
+# ==================== clean 执行计划：筛选提前、同列文本步骤合并、无用列裁剪 ====================
+
+# 各步骤之后会被用到的列：(only, without)，only 为 None 表示除 without 外的所有列
+_ALL_LIVE = (None, frozenset())
+
+
+def _as_list(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+def _live_has(live, name):
+    only, without = live
+    return (only is None or name in only) and name not in without
+
+
+def _live_add(live, names):
+    only, without = live
+    if only is None:
+        return None, without - set(names)
+    return only | set(names), without
+
+
+def _live_remove(live, names):
+    only, without = live
+    if only is None:
+        return None, without | set(names)
+    return only - set(names), without
+
+
+def _live_before(step, live):
+    """step 之后会用到 live 中的列，返回 (step 之前会用到的列, 裁剪后的 step)。
+
+    step 只改写之后用不到的列时裁剪结果为 None（整步省略）；trim / type_convert 只去掉用不到的列。
+    """
+    action = step.get("action")
+    if action in ("trim", "type_convert") and "columns" in step:
+        cols = step["columns"]
+        kept = [c for c in cols if _live_has(live, c)]
+        if not kept:
+            return live, None
+        if len(kept) < len(cols):
+            step = {**step, "columns": kept if action == "trim" else {c: cols[c] for c in kept}}
+        return live, step
+    if action in ("replace", "regex_replace", "fill_empty"):
+        return live, (step if _live_has(live, step["column"]) else None)
+    if action == "add_column":
+        if not _live_has(live, step["name"]):
+            return live, None
+        # 覆盖已有列时列位置不变，所以之前仍保留该列
+        return _live_add(live, _RE_FORMULA_REF.findall(step["formula"])), step
+    if action == "drop_columns":
+        return _live_remove(live, step["columns"]), step
+    if action == "dedup":
+        cols = step.get("columns")
+        return (_ALL_LIVE if cols is None else _live_add(live, _as_list(cols))), step
+    if action == "filter":
+        return _live_add(live, [c["column"] for c in step.get("conditions", [])]), step
+    if action == "sort":
+        return _live_add(live, [step["column"]]), step
+    if action == "aggregate":
+        return (set(_as_list(step["group_by"])) | set(step["metrics"]), frozenset()), step
+    if action == "pivot":
+        cols = _as_list(step["index"]) + _as_list(step["columns"]) + _as_list(step["values"])
+        return (set(cols), frozenset()), step
+    if action == "trim":
+        return live, step  # 全部字符串列：只改写已有列，不增加要用的列
+    # rename 等：改名前后的列对应关系不参与推导，之前保留全部列
+    return _ALL_LIVE, step
+
+
+def _schema_after(schema, step):
+    """按 step 推导执行后的列信息 (列名, 字符串列, 数值列, 列名与字符串列是否确定)。
+
+    数值列只收确定是 int/float 的列（宁少勿多），无法推导时标记为不确定。
+    """
+    cols, text, numeric, known = list(schema[0]), set(schema[1]), set(schema[2]), schema[3]
+    action = step.get("action")
+    if action in ("replace", "regex_replace"):
+        text.add(step["column"])
+        numeric.discard(step["column"])
+    elif action == "fill_empty":
+        numeric.discard(step["column"])
+        known = known and step["column"] in text
+    elif action == "add_column":
+        if step["name"] not in cols:
+            cols.append(step["name"])
+        numeric.discard(step["name"])
+        known = False
+    elif action == "drop_columns":
+        cols = [c for c in cols if c not in step["columns"]]
+        text -= set(step["columns"])
+        numeric -= set(step["columns"])
+    elif action == "type_convert":
+        for col, dtype in step["columns"].items():
+            text.discard(col)
+            numeric.discard(col)
+            if dtype == "str":
+                text.add(col)
+            elif dtype in ("int", "float"):
+                numeric.add(col)
+            elif dtype != "datetime":
+                known = False
+    elif action == "aggregate":
+        group = _as_list(step["group_by"])
+        cols = group + list(step["metrics"])
+        text &= set(group)
+        numeric = (numeric & set(group)) | set(step["metrics"])
+    elif action == "rename":
+        mapping = step["mapping"]
+        cols = [mapping.get(c, c) for c in cols]
+        text = {mapping.get(c, c) for c in text}
+        numeric = {mapping.get(c, c) for c in numeric}
+        known = known and len(set(cols)) == len(cols)
+    elif action not in ("trim", "dedup", "filter", "sort"):
+        cols, text, numeric, known = [], set(), set(), False
+    return cols, text, numeric, known
+
+
+def _text_step(step):
+    """可合并进同列文本链的步骤：指定列的 trim、映射值全是字符串的 replace、regex_replace。
+
+    这些步骤的结果都是字符串列，再 astype(str) 不变，所以同一列连续几步只需转换一次。
+    """
+    action = step.get("action")
+    if action == "trim":
+        return "columns" in step
+    if action == "replace":
+        return all(isinstance(v, str) for v in step["mapping"].values())
+    return action == "regex_replace"
+
+
+def _step_writes(step):
+    if step["action"] in ("trim", "drop_columns"):
+        return set(step["columns"])
+    if step["action"] == "add_column":
+        return {step["name"]}
+    return {step["column"]}
+
+
+def _filter_can_pass(step, schema, reads):
+    """filter（读 reads 列）能否提前到 step 之前：step 不增删行、不改写这些列，
+    且结果列类型与行数无关（add_column 要求公式只引用数值列，计算不会因行不同而报错）"""
+    action = step.get("action")
+    if action == "sort":
+        return True
+    if action == "add_column":
+        refs = set(_RE_FORMULA_REF.findall(step["formula"]))
+        return step["name"] not in reads and refs <= schema[2]
+    if action == "drop_columns" or _text_step(step):
+        return not (_step_writes(step) & reads)
+    return False
+
+
+def _apply_text_chain(df, col, steps):
+    """按顺序执行同一列上的 trim / replace / regex_replace，字符串转换只做一次"""
+    if isinstance(df, _PolarsFrame):
+        return df.text_chain(col, steps)
+    if col not in _str_columns(df):
+        # trim 只处理字符串列：转换成字符串之前的 trim 跳过
+        steps = list(itertools.dropwhile(lambda step: step["action"] == "trim", steps))
+    if not steps:
+        return df
+
+    def run(s):
+        s = s.astype(str)
+        for step in steps:
+            action = step["action"]
+            if action == "trim":
+                s = s.str.strip()
+            elif action == "replace":
+                s = s.replace(step["mapping"])
+            else:
+                s = s.str.replace(step["pattern"], step["replacement"], regex=True)
+        return s
+
+    df[col] = _per_value(df[col], run)
+    return df
 
+
+def _step_label(step):
+    """计划中的步骤简述：操作名 + 涉及的列"""
+    action = step.get("action")
+    if action == "filter":
+        cols = [c["column"] for c in step.get("conditions", [])]
+    elif action in ("trim", "drop_columns", "dedup"):
+        cols = _as_list(step.get("columns") or ["全部"])
+    elif action == "add_column":
+        cols = [step["name"]]
+    elif action in ("replace", "regex_replace", "fill_empty", "sort"):
+        cols = [step["column"]]
+    elif action == "type_convert":
+        cols = list(step["columns"])
+    elif action == "aggregate":
+        cols = _as_list(step["group_by"])
+    else:
+        cols = []
+    return f"{action} {','.join(map(str, cols))}".rstrip()
+
+
+class _CleanPlan:
+    """clean 的执行计划：把 steps 编译成等价但更省的执行顺序。
+
+    构造时（读表之前）按列的使用情况从后往前推导：只改写之后用不到的列的步骤省略，
+    读表时就跳过整个流程都用不到的列。compile(df) 拿到列类型后再做：
+    - 全部字符串列的 trim 展开成具体列；
+    - filter 提前到不增删行、不改写条件列的步骤之前（筛选各自的数值判断基于同样的行）；
+    - 相邻的文本步骤按列合并，同一列只做一次字符串转换；
+    - 执行中某列之后不再用到时立即删除，后续步骤少处理一列。
+    任何改写都保证结果与按原顺序执行一致（--explain 会同时跑两种顺序对比）。
+    """
+
+    def __init__(self, steps, first=1):
+        """first: steps[0] 的步骤序号（从步骤缓存续跑时不是 1）"""
+        self.steps = steps
+        self.first = first
+        self.skipped = []  # 省略的步骤序号（从 first 开始）
+        self.pruned = []  # [(序号, 裁剪后的 step)]
+        live = _ALL_LIVE
+        for no in range(first + len(steps) - 1, first - 1, -1):
+            live, step = _live_before(steps[no - first], live)
+            if step is None:
+                self.skipped.append(no)
+            else:
+                self.pruned.append((no, step))
+        self.skipped.reverse()
+        self.pruned.reverse()
+        self.read_live = live
+        self.nodes = None
+        self.moved = []  # [(筛选序号, 提前到的步骤序号)]
+        self.dropped_at_read = []
+
+    def wanted(self, name):
+        """读表时是否需要这一列"""
+        return _live_has(self.read_live, name)
+
+    def compile(self, df):
+        """按读到的列类型完成改写，生成执行节点。
+
+        节点 {"kind": "step" 或 "text", "ids": 原步骤序号, "steps": [...], "chains": {列: [step]},
+        "drops": 执行后即可删除的列}。
+        """
+        self.moved = []
+        self.dropped_at_read = [c for c in df.columns if not self.wanted(c)]
+        cols = [c for c in df.columns if self.wanted(c)]
+        numeric = set(df[cols].select_dtypes(include=["integer", "floating"]).columns)
+        schema = (cols, set(_str_columns(df[cols])), numeric, len(set(cols)) == len(cols))
+
+        # 展开全部字符串列的 trim，同时记下每步之前的列信息（filter 不改变列信息，提前后仍然有效）。
+        # 多列 trim 按列拆开（各列互不影响），筛选条件用到的列排在前面，其余列的 trim 可以放到筛选之后
+        filter_reads = {c["column"] for _, step in self.pruned if step.get("action") == "filter"
+                        for c in step.get("conditions", [])}
+        order, self.display = [], {}
+        for no, step in self.pruned:
+            if step.get("action") == "trim" and "columns" not in step and schema[3]:
+                step = {**step, "columns": [c for c in schema[0] if c in schema[1]]}
+            if step.get("action") == "trim" and len(step.get("columns", [])) > 1:
+                self.display[no] = step
+                for col in sorted(step["columns"], key=lambda c: c not in filter_reads):
+                    order.append((no, {"action": "trim", "columns": [col]}, schema))
+            else:
+                order.append((no, step, schema))
+            schema = _schema_after(schema, step)
+
+        # filter 提前；筛选之间保持原有先后
+        for i in range(len(order)):
+            no, step, _ = order[i]
+            if step.get("action") != "filter":
+                continue
+            reads = {c["column"] for c in step.get("conditions", [])}
+            j = i
+            while j > 0 and _filter_can_pass(order[j - 1][1], order[j - 1][2], reads):
+                j -= 1
+            if j < i:
+                self.moved.append((no, order[j][0]))
+                order.insert(j, order.pop(i))
+
+        # 相邻文本步骤按列合并
+        nodes, run = [], []
+        for item in order + [None]:
+            if item is not None and _text_step(item[1]):
+                run.append(item)
+                continue
+            if run:
+                chains = {}
+                for _, step, _ in run:
+                    for col in _text_columns(step):
+                        chains.setdefault(col, []).append(step)
+                if any(len(chain) > 1 for chain in chains.values()):
+                    nodes.append({"kind": "text", "items": run, "chains": chains})
+                else:
+                    nodes.extend({"kind": "step", "items": [it]} for it in run)
+                run = []
+            if item is not None:
+                nodes.append({"kind": "step", "items": [item]})
+
+        # 每个节点之后还会用到的列；之后用不到的列执行完就删掉
+        live = _ALL_LIVE
+        for node in reversed(nodes):
+            node["live"] = live
+            _, last, before = node["items"][-1]
+            node["drops"] = [c for c in _schema_after(before, last)[0] if not _live_has(live, c)]
+            for _, step, _ in reversed(node["items"]):
+                live = _live_before(step, live)[0]
+        gone = set()
+        for node in nodes:
+            node["drops"] = [c for c in node["drops"] if c not in gone]
+            gone.update(node["drops"])
+        self.nodes = nodes
+        return self
+
+    def run(self, df, report=True):
+        """按计划执行；report 时逐步打印结果说明（按原步骤序号）。
+
+        处理后端为 polars 时转成 _PolarsFrame 执行，返回前转回 pandas；分类列返回前还原为普通文本列。
+        不打印时不取行数，polars 后端的列步骤可以一直合并到下一个必须 collect 的步骤。
+        """
+        df = _to_backend(_drop_dead(df, self.read_live))
+        views = _ColumnViews()
+        printed = set()
+        for node in self.nodes:
+            before, df_before = len(df) if report else None, df
+            with _profiled(self._node_label(node), "step",
+                           rows_in=before if report else _frame_rows(df)) as record:
+                if node["kind"] == "text":
+                    for col, chain in node["chains"].items():
+                        df = _apply_text_chain(df, col, chain)
+                    views.invalidate(set(node["chains"]))
+                else:
+                    df = _apply_step(df, node["items"][0][1], views=views)
+                record["rows_out"] = _frame_rows(df)
+            if report:
+                for no, step, _ in node["items"]:
+                    if no not in printed:  # 拆开的多列 trim 只在第一部分执行后说明一次
+                        printed.add(no)
+                        step = self.display.get(no, step)
+                        print(f"  步骤{no} {_step_message(step, before, len(df), df_before)}")
+            df = _drop_dead(df, node["live"])
+        df = _decode_categories(_from_backend(df))
+        if report:
+            for no in self.skipped:
+                print(f"  步骤{no} {_step_message(self.steps[no - self.first], 0, 0, df)}（已省略：只改写之后删除的列）")
+        return df
+
+    def summary(self):
+        """改写摘要，没有改写时返回 None"""
+        parts = []
+        if self.dropped_at_read:
+            parts.append(f"跳过用不到的 {len(self.dropped_at_read)} 列")
+        if self.moved:
+            parts.append(f"筛选提前 {len(self.moved)} 处")
+        fused = sum(1 for node in self.nodes if node["kind"] == "text")
+        if fused:
+            parts.append(f"合并文本步骤 {fused} 组")
+        if self.skipped:
+            parts.append(f"省略 {len(self.skipped)} 步")
+        return "，".join(parts) or None
+
+    @staticmethod
+    def _node_label(node):
+        ids = "+".join(dict.fromkeys(str(no) for no, _, _ in node["items"]))
+        if node["kind"] == "text":
+            actions = "/".join(dict.fromkeys(s["action"] for chain in node["chains"].values() for s in chain))
+            return f"步骤{ids} [合并] {actions}"
+        return f"步骤{ids} {_step_label(node['items'][0][1])}"
+
+    def explain(self):
+        print("[执行计划]")
+        if self.dropped_at_read:
+            print(f"  用不到的列（不读取）: {', '.join(map(str, self.dropped_at_read))}")
+        moved = dict(self.moved)
+        for i, node in enumerate(self.nodes, 1):
+            ids = "+".join(dict.fromkeys(str(no) for no, _, _ in node["items"]))
+            if node["kind"] == "text":
+                desc = "；".join(f"{col}: {' → '.join(s['action'] for s in chain)}"
+                                for col, chain in node["chains"].items())
+                print(f"  {i}. 步骤{ids} [合并] {desc}")
+            else:
+                no, step, _ = node["items"][0]
+                note = f"  ← 提前到步骤{moved[no]}之前" if no in moved else ""
+                print(f"  {i}. 步骤{ids} {_step_label(step)}{note}")
+            if node["drops"]:
+                print(f"     之后删除: {', '.join(map(str, node['drops']))}")
+        for no in self.skipped:
+            print(f"  -  步骤{no} {_step_label(self.steps[no - self.first])}  ← 省略（只改写之后删除的列）")
+
+
+def _text_columns(step):
+    return step["columns"] if step["action"] == "trim" else [step["column"]]
+
+
+def _drop_dead(df, live):
+    dead = [c for c in df.columns if not _live_has(live, c)]
+    return df.drop(columns=dead) if dead else df
+
+
+# ==================== polars 处理后端：列步骤惰性合并执行，语义与 pandas 逐步执行一致 ====================
+
+# --backend / EXCEL_TOOL_BACKEND；polars 后端只用于 clean / batch 的整表执行（分块执行与 auto 查询仍用 pandas）
+PROCESS_BACKEND = "pandas"
+
+PROCESS_BACKENDS = ("pandas", "polars")
+
+# Python str.strip() 去掉的空白字符（polars 默认按 Rust 的定义，不含 \x1c-\x1f）
+_PY_WHITESPACE = ("\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680" + "".join(map(chr, range(0x2000, 0x200b)))
+                  + "\u2028\u2029\u202f\u205f\u3000")
+
+_RE_REGEX_META = re.compile(r"[.^$*+?{}\[\]\\|()]")
+
+_POLARS_AGGS = {"count", "min", "max", "sum", "mean", "median"}
+
+
+def _set_process_backend(name):
+    """切换处理后端（--backend / EXCEL_TOOL_BACKEND），立即检查依赖是否可用"""
+    global PROCESS_BACKEND
+    if name not in PROCESS_BACKENDS:
+        print(f"错误：未知处理后端 '{name}'，可用: {', '.join(PROCESS_BACKENDS)}")
+        sys.exit(1)
+    if name == "polars" and importlib.util.find_spec("polars") is None:
+        print("错误：处理后端 polars 需要安装 polars（pip install polars）")
+        sys.exit(1)
+    PROCESS_BACKEND = name
+
+
+def _pl_series(s):
+    """pandas 列 → polars 列（空值统一为 null）；不能原样转回的类型返回 None"""
+    dtype = s.dtype
+    if dtype == object:
+        return pl.Series(s.name, s.tolist(), dtype=pl.Object)
+    if isinstance(dtype, pd.StringDtype):
+        if dtype.na_value is not np.nan:
+            return None
+        return pl.Series(s.name, s.to_numpy(dtype=object, na_value=None).tolist(), dtype=pl.String)
+    if dtype.kind in "iub":
+        return pl.Series(s.name, s.to_numpy())
+    if dtype.kind == "f":
+        return pl.Series(s.name, s.to_numpy(), nan_to_null=True)
+    if dtype.kind == "M" and np.datetime_data(dtype)[0] in ("ms", "us", "ns"):
+        return pl.Series(s.name, s.to_numpy())
+    return None
+
+
+def _pd_series(s):
+    """polars 列 → pandas 列：文本为 str 类型，数值列的 null 为 NaN（与 pandas 各步骤的结果类型一致）"""
+    if s.dtype == pl.String:
+        return pd.Series(s.to_numpy(), name=s.name, dtype="str")
+    if s.dtype in (pl.Object, pl.Null):
+        return pd.Series(s.to_list(), name=s.name, dtype=object)
+    if s.dtype.is_integer() and s.null_count():
+        return pd.Series(s.to_numpy().astype("float64"), name=s.name)
+    return pd.Series(s.to_numpy(), name=s.name)
+
+
+def _pl_text(expr):
+    """按 pandas astype(str) 把列转成文本（非文本列用，空值仍为空值）"""
+    return expr.map_batches(lambda s: _pl_series(_pd_series(s).astype(str)), return_dtype=pl.String)
+
+
+# polars（Rust regex）与 Python re 含义相同的正则写法；\w \b $ 环视、反向引用等含义不同或不支持
+_RE_PORTABLE_TOKEN = re.compile(r"""
+    \\[dDsSnt]                                # 数字、空白类，换行、制表符
+  | \\[.^$*+?{}\[\]\\|()-]                      # 转义的元字符
+  | \[\^?\]?(?:\\[dsnt.\\\[\]^-]|[^\\\[\]])*\]    # 字符类（不嵌套）
+  | \{\d+(?:,\d*)?\}\?? | [*+?]\??              # 量词
+  | \(\?: | [()|.^]
+  | [^\\\[\]{}()|.^$*+?]                        # 普通字符
+""", re.X)
+
+
+def _portable_regex(compiled, replacement):
+    """Python 正则 → 含义相同的 polars 正则与替换文本；不能保证一致时返回 None。
+
+    Python 的 \\s 还包括 \\x1c-\\x1f，换成显式字符类；能匹配空串的正则两边对空匹配的处理不同，
+    替换文本含反斜杠或 $（组引用、转义）时也交给 Python。
+    """
+    if (not isinstance(replacement, str) or "\\" in replacement or "$" in replacement
+            or compiled.search("") is not None):
+        return None
+    pattern = compiled.pattern
+    out, pos, prev = [], 0, None
+    for m in _RE_PORTABLE_TOKEN.finditer(pattern):
+        token = m.group()
+        if m.start() != pos:
+            return None
+        # 量词要跟在字符、字符类或组后面（Python 的 ?+ *+ 是占有量词，连续量词两边含义不同）
+        if token[0] in "{*+?" and (prev in (None, "(", "(?:", "|", "^") or prev[0] in "{*+?"):
+            return None
+        if token.startswith("[") and len(token) > 2:
+            if any(op in token for op in ("&&", "--", "~~")):
+                return None
+            token = re.sub(r"\\.", lambda e: "\\s\\x1c-\\x1f" if e.group() == "\\s" else e.group(), token)
+        elif token == "\\s":
+            token = "[\\s\\x1c-\\x1f]"
+        elif token == "\\S":
+            token = "[^\\s\\x1c-\\x1f]"
+        out.append(token)
+        pos, prev = m.end(), m.group()
+    if pos != len(pattern):
+        return None
+    return "".join(out), replacement
+
+
+def _pl_regex_replace(expr, step):
+    """正则替换：polars 能按相同含义执行的正则直接执行，其余按 Python re 执行（与 pandas 相同）。
+    先编译一次，写错的正则立即报错"""
+    compiled, replacement = re.compile(step["pattern"]), step["replacement"]
+    portable = _portable_regex(compiled, replacement)
+    if portable:
+        return expr.str.replace_all(*portable)
+    return expr.map_batches(
+        lambda s: _pl_series(_pd_series(s).str.replace(compiled, replacement, regex=True)),
+        return_dtype=pl.String)
+
+
+def _to_backend(df):
+    """pandas 表 → 当前处理后端执行用的表"""
+    return _polars_frame(_decode_categories(df)) if PROCESS_BACKEND == "polars" else df
+
+
+def _from_backend(df):
+    return df.to_pandas() if isinstance(df, _PolarsFrame) else df
+
+
+def _polars_frame(df):
+    """pandas 表 → polars 后端的表；列名重复、非文本或有不支持的列类型时打印原因并原样返回"""
+    names = list(df.columns)
+    if len(set(names)) != len(names) or not all(isinstance(c, str) for c in names):
+        print("[提示] 列名重复或不是文本，polars 后端无法处理，本次按 pandas 执行")
+        return df
+    series = []
+    for col in names:
+        s = _pl_series(df[col])
+        if s is None:
+            print(f"[提示] 列 {col} 的类型 {df[col].dtype} 不受 polars 后端支持，本次按 pandas 执行")
+            return df
+        series.append(s)
+    return _PolarsFrame(pl.DataFrame(series, height=len(df)).lazy(), len(df))
+
+
+class _PolarsFrame:
+    """polars 后端执行中的表：包着 LazyFrame，_apply_step / _apply_text_chain 遇到它时转到这里。
+
+    不增删行的列步骤（trim、replace、drop_columns、rename 等）只往查询里追加表达式，
+    直到需要行数（打印步骤结果）或下一个步骤必须看到具体数据时才一次 collect，由 polars 多线程执行。
+    语义上对不齐的情况都交给 pandas：文本转换、数值解析、正则按 pandas 的做法在列上执行；
+    add_column、type_convert 只把涉及的列转成 pandas 执行；pivot、浮点列求和/均值等聚合
+    （pandas 用补偿求和，末位可能不同）整表转回 pandas 执行，结果能表示时再转回 polars 继续。
+    """
+
+    def __init__(self, lazy, rows=None):
+        self.lazy = lazy
+        self._rows = rows  # None：查询里有增删行的步骤，要 collect 才知道
+        self._schema = None
+
+    @property
+    def schema(self):
+        if self._schema is None:
+            self._schema = self.lazy.collect_schema()
+        return self._schema
+
+    @property
+    def columns(self):
+        return list(self.schema.names())
+
+    def __len__(self):
+        if self._rows is None:
+            self.collect()
+        return self._rows
+
+    def collect(self):
+        frame = self.lazy.collect()
+        self.lazy, self._rows = frame.lazy(), frame.height
+        return frame
+
+    def to_pandas(self):
+        frame = self.collect()
+        return pd.DataFrame({s.name: _pd_series(s) for s in frame.iter_columns()},
+                            index=pd.RangeIndex(frame.height))
+
+    def text_columns(self):
+        return [c for c, t in self.schema.items() if t in (pl.String, pl.Object)]
+
+    def drop(self, columns):
+        return self._with(self.lazy.drop(columns))
+
+    def _with(self, lazy, same_rows=True):
+        return _PolarsFrame(lazy, self._rows if same_rows else None)
+
+    def _text(self, col):
+        return pl.col(col) if self.schema[col] == pl.String else _pl_text(pl.col(col))
+
+    def _has(self, cols):
+        return all(c in self.schema for c in cols)
+
+    def _pandas_step(self, step):
+        """整表转回 pandas 执行该步骤"""
+        return _polars_frame(_apply_step(self.to_pandas(), step))
+
+    def _pandas_columns(self, step, cols):
+        """只把 cols 列转成 pandas 执行不增删行的步骤，改写和新增的列再转回"""
+        frame = self.collect()
+        part = pd.DataFrame({c: _pd_series(frame[c]) for c in cols}, index=pd.RangeIndex(frame.height))
+        part = _apply_step(part, step)
+        series = [_pl_series(part[c]) for c in part.columns]
+        if any(s is None for s in series):
+            return self._pandas_step(step)
+        return self._with(frame.lazy().with_columns(series))
+
+    def apply_step(self, step):
+        """执行一个清洗步骤，返回 _PolarsFrame（结果无法用 polars 表示时返回 pandas DataFrame）"""
+        action = step.get("action")
+        handler = getattr(self, f"_step_{action}", None)
+        return handler(step) if handler else self
+
+    def text_chain(self, col, steps):
+        """同 _apply_text_chain：同一列上的 trim / replace / regex_replace 合成一个表达式"""
+        if col not in self.schema:
+            raise KeyError(col)
+        is_text = self.schema[col] in (pl.String, pl.Object)
+        expr = None
+        for step in steps:
+            action = step["action"]
+            if action == "trim" and not is_text:
+                continue
+            if expr is None:
+                expr, is_text = self._text(col), True
+            if action == "trim":
+                expr = expr.str.strip_chars(_PY_WHITESPACE)
+            elif action == "replace":
+                expr = expr.replace(step["mapping"])
+            else:
+                expr = _pl_regex_replace(expr, step)
+        return self if expr is None else self._with(self.lazy.with_columns(expr.alias(col)))
+
+    def _step_trim(self, step):
+        text = self.text_columns()
+        exprs = [self._text(c).str.strip_chars(_PY_WHITESPACE).alias(c)
+                 for c in step.get("columns", text) if c in text]
+        return self._with(self.lazy.with_columns(exprs)) if exprs else self
+
+    def _step_replace(self, step):
+        col, mapping = step["column"], step["mapping"]
+        if col not in self.schema or not all(isinstance(v, str) for v in mapping.values()):
+            return self._pandas_columns(step, [col]) if col in self.schema else self._pandas_step(step)
+        return self._with(self.lazy.with_columns(self._text(col).replace(mapping).alias(col)))
+
+    def _step_regex_replace(self, step):
+        col = step["column"]
+        if col not in self.schema:
+            return self._pandas_step(step)
+        return self._with(self.lazy.with_columns(_pl_regex_replace(self._text(col), step).alias(col)))
+
+    def _step_fill_empty(self, step):
+        col, value = step["column"], step["value"]
+        if col not in self.schema:
+            return self._pandas_step(step)
+        if self.schema[col] != pl.String or not isinstance(value, str):
+            return self._pandas_columns(step, [col])
+        c = pl.col(col)
+        expr = pl.when(c.is_null() | c.is_in(["", "None", "nan"])).then(pl.lit(value)).otherwise(c)
+        return self._with(self.lazy.with_columns(expr.alias(col)))
+
+    def _step_dedup(self, step):
+        cols = _as_list(step.get("columns") or self.columns)
+        if not self._has(cols) or any(self.schema[c] == pl.Object for c in cols):
+            return self._pandas_step(step)
+        keep = step.get("keep", "first")
+        return self._with(self.lazy.unique(subset=cols, keep=keep, maintain_order=True), same_rows=False)
+
+    def _step_filter(self, step):
+        conditions = step.get("conditions", [])
+        if not self._has(c["column"] for c in conditions):
+            return self._pandas_step(step)
+        # 列是否按数值比较取决于整列的值，先 collect 再逐条件算出布尔列
+        frame = self.collect()
+        masks = []
+        for cond in conditions:
+            mask = self._condition(frame, cond)
+            if mask is False:
+                return self._pandas_step(step)
+            if mask is not None:
+                masks.append(mask)
+        if not masks:
+            return self
+        combined = masks[0]
+        for m in masks[1:]:
+            combined = (combined & m) if step.get("logic", "and") == "and" else (combined | m)
+        frame = frame.filter(combined)
+        return _PolarsFrame(frame.lazy(), frame.height)
+
+    def _condition(self, frame, cond):
+        """一个筛选条件的布尔列（空值按 pandas 的结果填好）；pandas 不生成条件的 op 返回 None，
+        对不齐 pandas 的情况（日期、布尔等列，非文本的比较值）返回 False"""
+        col, op, val = cond["column"], cond["op"], cond["value"]
+        s = frame[col]
+        if s.dtype == pl.String:
+            num = _pl_series(pd.to_numeric(_pd_series(s), errors="coerce").astype("float64"))
+        elif s.dtype.is_numeric():
+            num = s
+        else:
+            return False
+        ops = {">": "gt", "<": "lt", ">=": "ge", "<=": "le", "==": "eq", "!=": "ne"}
+        if op in ops and num.is_not_null().any():
+            return getattr(num, ops[op])(float(val)).fill_null(op == "!=")
+        text = s if s.dtype == pl.String else _pl_series(_pd_series(s).astype(str))
+        if op in ("contains", "not_contains"):
+            if isinstance(val, str) and not _RE_REGEX_META.search(val):
+                found = text.str.contains(val, literal=True).fill_null(False)
+            else:  # 正则按 Python re 的语法
+                found = pl.Series(_pd_series(text).str.contains(val, na=False).to_numpy())
+            return found if op == "contains" else ~found
+        if op not in ("==", "!=", "startswith", "endswith"):
+            return None
+        if not isinstance(val, str):
+            return False
+        if op == "==":
+            return (text == val).fill_null(False)
+        if op == "!=":
+            return (text != val).fill_null(True)
+        if op == "startswith":
+            return text.str.starts_with(val).fill_null(False)
+        return text.str.ends_with(val).fill_null(False)
+
+    def _step_sort(self, step):
+        col = step["column"]
+        if col not in self.schema:
+            return self._pandas_step(step)
+        dtype, desc = self.schema[col], step.get("desc", False)
+        if dtype == pl.String:
+            frame = self.collect()
+            key = _pl_series(pd.to_numeric(_pd_series(frame[col]), errors="coerce")).alias(_SORT_KEY)
+            lazy = frame.lazy().with_columns(key)
+        elif dtype.is_numeric():
+            key = pl.col(col) + 0.0 if dtype.is_float() else pl.col(col)
+            lazy = self.lazy.with_columns(key.alias(_SORT_KEY))
         else:
-            valid = "trim replace fill_empty dedup filter regex_replace add_column drop_columns sort aggregate rename type_convert pivot"
-            print(f"  步骤{i+1} [错误] 未知操作 '{action}'，跳过")
-            print(f"         [可用操作] {valid}")
+            return self._pandas_step(step)
+        # 与 pandas 稳定排序一致：相同键保持原顺序，空值在最后；-0.0 与 0.0 视为相等
+        lazy = lazy.sort(_SORT_KEY, descending=desc, nulls_last=True, maintain_order=True).drop(_SORT_KEY)
+        return self._with(lazy)
+
+    def _step_aggregate(self, step):
+        group, metrics = _as_list(step["group_by"]), _agg_map(step["metrics"])
+        if (not self._has(group + list(metrics)) or set(group) & set(metrics)
+                or any(self.schema[c] == pl.Object for c in group)
+                or not set(metrics.values()) <= _POLARS_AGGS):
+            return self._pandas_step(step)
+        frame = self.collect()
+        if not frame.height:
+            return self._pandas_step(step)
+        values, exprs = [], []
+        for col, func in metrics.items():
+            s = frame[col]
+            if s.dtype == pl.String:
+                s = _pl_series(pd.to_numeric(_pd_series(s), errors="coerce"))
+            elif not s.dtype.is_numeric():
+                return self._pandas_step(step)
+            # 浮点列的求和、均值、中位数 pandas 与 polars 的计算顺序不同，末位可能不一致
+            if func in ("sum", "mean", "median") and not s.dtype.is_integer():
+                return self._pandas_step(step)
+            values.append(s)
+            expr = getattr(pl.col(col), func)()
+            exprs.append(expr.cast(pl.Int64) if func == "count" else expr)
+        # 与 pandas groupby 一致：分组键有空值的行不参与，结果按分组键排序
+        lazy = (frame.lazy().with_columns(values).drop_nulls(group)
+                .group_by(group).agg(exprs).sort(group))
+        return self._with(lazy, same_rows=False)
+
+    def _step_add_column(self, step):
+        formula = _compile_formula(step["formula"])
+        if formula.fallback is not None:
+            return self._pandas_step(step)  # pandas eval 可以直接按列名引用，需要整表
+        return self._pandas_columns(step, [c for c in formula.refs if c in self.schema])
+
+    def _step_type_convert(self, step):
+        cols = list(step["columns"])
+        if not self._has(cols):
+            return self._pandas_step(step)
+        return self._pandas_columns(step, cols)
+
+    def _step_drop_columns(self, step):
+        return self._with(self.lazy.drop([c for c in step["columns"] if c in self.schema]))
+
+    def _step_rename(self, step):
+        mapping = {k: v for k, v in step["mapping"].items() if k in self.schema}
+        names = [mapping.get(c, c) for c in self.columns]
+        if len(set(names)) != len(names) or not all(isinstance(c, str) for c in names):
+            return self._pandas_step(step)
+        return self._with(self.lazy.rename(mapping))
+
+    def _step_pivot(self, step):
+        return self._pandas_step(step)
+
+
+# ==================== clean 分块执行：超出内存的大表（中间结果落盘）====================
+
+# 每块行数 CHUNK_ROWS（EXCEL_TOOL_CHUNK_ROWS，--chunk-size 优先）、落盘目录 SPILL_DIR 见 _load_env_settings
+# 有序段每片行数：归并时每段同时只有一片在内存中
+_SPILL_PIECE_ROWS = 4096
+# 分区数 / 归并路数上限，避免同时打开过多文件
+_MAX_FANOUT = 256
+# 分块执行时附加的辅助列：全局行号、排序键
+_SEQ = "\x00seq"
+_SORT_KEY = "\x00key"
+
+
+class _Spill:
+    """落盘的块序列：按顺序追加 pickle，读取时按写入顺序（reversed() 为倒序）逐块产出"""
+
+    def __init__(self, directory):
+        import tempfile
+        fd, self.path = tempfile.mkstemp(suffix=".pkl", dir=directory)
+        self._file = os.fdopen(fd, "wb")
+        self._offsets = []
+        self.rows = 0
+
+    def write(self, obj):
+        self._offsets.append(self._file.tell())
+        pickle.dump(obj, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.rows += len(obj)
+
+    def __iter__(self):
+        if not self._file.closed:
+            self._file.close()
+        with open(self.path, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def __reversed__(self):
+        if not self._file.closed:
+            self._file.close()
+        with open(self.path, "rb") as f:
+            for offset in reversed(self._offsets):
+                f.seek(offset)
+                yield pickle.load(f)
+
+
+class _SpillArea:
+    """一次分块执行的落盘区：临时目录 + 块大小 + 分区数"""
+
+    def __init__(self, chunk_rows):
+        import tempfile
+        if SPILL_DIR:
+            os.makedirs(SPILL_DIR, exist_ok=True)
+        self._dir = tempfile.TemporaryDirectory(prefix="excel-tool-", dir=SPILL_DIR)
+        self.chunk_rows = chunk_rows
+        self.partitions = 1
+        self.spilled_bytes = 0
+
+    def spill(self):
+        return _Spill(self._dir.name)
+
+    def spill_frame(self, df):
+        """把一个有序 DataFrame 切片落盘，返回 _Spill"""
+        spill = self.spill()
+        for i in range(0, len(df), _SPILL_PIECE_ROWS):
+            spill.write(df.iloc[i:i + _SPILL_PIECE_ROWS])
+        return spill
+
+    def spill_chunks(self, chunks):
+        spill = self.spill()
+        for df in chunks:
+            spill.write(df)
+        return spill
+
+    def close(self):
+        for entry in os.scandir(self._dir.name):
+            self.spilled_bytes += entry.stat().st_size
+        self._dir.cleanup()
+
+
+def _sheet_chunks(session, sheet_name, sheet_cfg, area):
+    """分块读取 Sheet：返回 (列名列表, 行数, 清洗后的 DataFrame 块迭代器)。
+
+    原始行先分块落盘并记录各列类型代表值，再把代表值拼在每块前面一起清洗后切掉，
+    各块列类型与整表读取一致。有完整解析缓存时直接切分缓存。
+    """
+    chunk_rows = area.chunk_rows
+    df = _cache_load(_sheet_cache_key(session, sheet_name, sheet_cfg))
+    if df is not None:
+        print(f"[缓存] 命中 {sheet_name}（跳过解析）")
+        return (df.columns.tolist(), len(df),
+                (_decode_categories(chunk) for chunk in _slices(df, chunk_rows)))
+
+    raw = area.spill()
+    with session.timed("read"):
+        headers, rows = _sheet_rows(session, sheet_name, sheet_cfg)
+        samples = [{} for _ in headers]
+        for batch in iter(lambda: list(itertools.islice(rows, chunk_rows)), []):
+            for row in batch:
+                for j, v in enumerate(row):
+                    _sample_type(samples[j], v)
+            raw.write(batch)
+    sample_rows = _sample_rows(samples)
+
+    def chunks():
+        offset = 0
+        for batch in itertools.chain(raw, [[]] if not raw.rows else []):
+            with session.timed("normalize"):
+                df = _normalize_strings(pd.DataFrame(sample_rows + batch, columns=headers))
+                df = df.iloc[len(sample_rows):].copy()
+                df.index = pd.RangeIndex(offset, offset + len(df))
+            offset += len(df)
+            yield df
+    return headers, raw.rows, chunks()
+
+
+def _slices(df, rows):
+    """按 rows 行切块，空表也产出一块（保留列结构）"""
+    yield df.iloc[:rows].copy()
+    for i in range(rows, len(df), rows):
+        yield df.iloc[i:i + rows].copy()
+
+
+def _partition_ids(df, cols, n):
+    """按 cols 的取值给每行分区号：相等的键（含 1 与 1.0、同类空值）一定落在同一分区"""
+    return (_key_digests(_key_columns(df, cols)) % np.uint64(n)).astype(np.int64)
+
+
+def _partition(chunks, cols, area, seq=False):
+    """按 cols（None 为全部列）把块哈希分区落盘，返回 (非空分区列表, 首块的空结构)。
+
+    seq 为 True 时附加全局行号列，分区内保持原顺序。
+    """
+    parts = [None] * area.partitions
+    schema = None
+    offset = 0
+    for df in chunks:
+        if schema is None:
+            schema = df.iloc[:0]
+        key_cols = cols or list(df.columns)
+        if seq:
+            df = df.assign(**{_SEQ: np.arange(offset, offset + len(df))})
+            offset += len(df)
+        ids = _partition_ids(df, key_cols, area.partitions)
+        for pid in np.unique(ids):
+            if parts[pid] is None:
+                parts[pid] = area.spill()
+            parts[pid].write(df[ids == pid])
+    return [p for p in parts if p is not None], schema
+
+
+def _merge_runs(runs, key_fn, rows):
+    """k 路归并各自有序的段，每 rows 行产出一块（保留辅助列）。
+
+    每段同时只有一片在内存中；key_fn(片) 返回每行的排序键，各行的键互不相同。
+    """
+    def entries(run):
+        for piece in run:
+            for pos, key in enumerate(key_fn(piece)):
+                yield key, pos, piece
+
+    batch = []
+    for _, pos, piece in heapq.merge(*(entries(r) for r in runs)):
+        batch.append((piece, pos))
+        if len(batch) == rows:
+            yield _gather_rows(batch)
+            batch = []
+    if batch:
+        yield _gather_rows(batch)
+
+
+def _gather_rows(batch):
+    """按 [(片, 行位置), ...] 的顺序取出各行拼成 DataFrame"""
+    groups = {}
+    for i, (piece, pos) in enumerate(batch):
+        group = groups.setdefault(id(piece), (piece, [], []))
+        group[1].append(pos)
+        group[2].append(i)
+    df = pd.concat([piece.iloc[positions] for piece, positions, _ in groups.values()])
+    order = np.concatenate([out for _, _, out in groups.values()])
+    return df.iloc[np.argsort(order, kind="stable")]
+
+
+def _seq_key(piece):
+    return piece[_SEQ].tolist()
+
+
+def _sort_key(piece):
+    # 空值排在最后：(是否为空, 键, 行号)
+    keys = piece[_SORT_KEY].to_numpy()
+    missing = np.isnan(keys)
+    return list(zip(missing.tolist(), np.where(missing, 0, keys).tolist(), piece[_SEQ].tolist()))
+
+
+def _finish_merge(runs, key_fn, area, schema, step):
+    """归并有序段并去掉辅助列；没有任何行时对空结构执行该步骤，保证输出列一致"""
+    if not any(run.rows for run in runs):
+        yield _apply_step(schema, step)
+        return
+    while len(runs) > _MAX_FANOUT:
+        runs = [area.spill_chunks(_merge_runs(runs[i:i + _MAX_FANOUT], key_fn, _SPILL_PIECE_ROWS))
+                for i in range(0, len(runs), _MAX_FANOUT)]
+    for df in _merge_runs(runs, key_fn, area.chunk_rows):
+        yield df.drop(columns=[c for c in (_SEQ, _SORT_KEY) if c in df.columns])
+
+
+def _chunked_local(chunks, step, area):
+    """逐块独立执行的步骤（trim、replace 等只看本行的操作）"""
+    for df in chunks:
+        yield _apply_step(df, step)
+
+
+def _chunked_filter(chunks, step, area):
+    """filter：数值比较取决于整列是否含数值，先落盘一遍统计，再逐块筛选"""
+    cols = {c["column"] for c in step.get("conditions", []) if c["op"] in _NUMERIC_OPS}
+    if not cols:
+        yield from _chunked_local(chunks, step, area)
+        return
+    numeric = dict.fromkeys(cols, False)
+    spill = area.spill()
+    for df in chunks:
+        for col in cols:
+            if not numeric[col]:
+                numeric[col] = bool(pd.to_numeric(df[col], errors="coerce").notna().any())
+        spill.write(df)
+    for df in spill:
+        yield _apply_step(df, step, numeric=numeric)
+
+
+def _chunked_add_column(chunks, step, area):
+    """add_column：引用的文本列是否转数值、转成整数还是浮点取决于整列（见 _formula_column），
+    先落盘一遍统计，再逐块计算"""
+    formula = _compile_formula(step["formula"])
+    if formula.fallback is not None or not formula.refs:
+        yield from _chunked_local(chunks, step, area)
+        return
+    stats = _kind_stats(formula.refs)
+    spill = area.spill()
+    for df in chunks:
+        _add_kind_stats(stats, df)
+        spill.write(df)
+    numeric = {col: _stats_kind(stat) for col, stat in stats.items()}
+    for df in spill:
+        yield _apply_step(df, step, numeric=numeric)
+
+
+def _chunked_dedup(chunks, step, area):
+    """dedup：第一遍块落盘，内存里只留每行去重键的摘要并据此判重；第二遍重读各块，
+    摘要重复的行与同组先出现的键逐值核对后输出（keep=last 时倒序核对，第三遍输出）。
+    摘要超过 DEDUP_MEMORY 时改为按摘要分区落盘、逐分区去重。"""
+    cols, keep = step.get("columns"), step.get("keep", "first")
+    spill = area.spill()
+    digests, sizes = [], []
+    chunks = iter(chunks)
+    for df in chunks:
+        digests.append(_key_digests(_key_columns(df, cols or list(df.columns))))
+        sizes.append(len(df))
+        spill.write(df)
+        if sum(d.nbytes for d in digests) > DEDUP_MEMORY:
+            print(f"    [去重] 摘要超过 {DEDUP_MEMORY // 2 ** 20}MB，改为按摘要分区落盘")
+            del digests
+            yield from _dedup_partitioned(itertools.chain(spill, chunks), step, area)
+            return
+    codes = pd.factorize(np.concatenate(digests))[0]
+    del digests
+    counts = np.bincount(codes)
+    starts = np.cumsum([0] + sizes[:-1])
+    kept = np.ones(len(codes), dtype=bool)
+    pieces = zip(starts, spill) if keep != "last" else zip(starts[::-1], reversed(spill))
+    stat = {"checked": 0, "collisions": 0}
+    for start, df in _verify_digests(pieces, codes, counts, kept, cols, keep == "last", stat):
+        if keep != "last":
+            yield df[kept[start:start + len(df)]]
+    _print_dedup_check(stat["checked"], stat["collisions"])
+    if keep == "last":
+        for start, df in zip(starts, spill):
+            yield df[kept[start:start + len(df)]]
+
+
+def _verify_digests(pieces, codes, counts, kept, cols, reverse, stat):
+    """按扫描顺序逐块核对摘要重复的行，透传 (起始行号, 块)。
+
+    每组第一次出现的键作为代表按块存放，组内各行扫描完即释放；同组其余行与代表逐值比较，
+    相等为重复（kept 置 False）。不相等的是哈希冲突，与该组已见过的其他键逐个比较。
+    """
+    remaining = counts.copy()
+    rep_block = np.full(len(counts), -1, dtype=np.int64)
+    rep_pos = np.zeros(len(counts), dtype=np.int64)
+    blocks, alive, others = [], [], {}
+    for start, df in pieces:
+        chunk_codes = codes[start:start + len(df)]
+        rows = np.flatnonzero(counts[chunk_codes] > 1)
+        if reverse:
+            rows = rows[::-1]
+        if not len(rows):
+            yield start, df
+            continue
+        key_cols = _key_columns(df, cols or list(df.columns))
+        row_codes = chunk_codes[rows]
+        new = np.flatnonzero(rep_block[row_codes] < 0)
+        new_codes, first = np.unique(row_codes[new], return_index=True)
+        if len(new_codes):
+            reps = rows[new[first]]
+            rep_block[new_codes] = len(blocks)
+            rep_pos[new_codes] = np.arange(len(reps))
+            blocks.append([(values[reps], null[reps]) for values, null in key_cols])
+            alive.append(len(reps))
+        check = np.ones(len(rows), dtype=bool)
+        check[new[first]] = False
+        check_rows, check_codes = rows[check], row_codes[check]
+        equal = np.zeros(len(check_rows), dtype=bool)
+        check_blocks = rep_block[check_codes]
+        for block in np.unique(check_blocks):
+            sel = np.flatnonzero(check_blocks == block)
+            equal[sel] = _keys_equal(key_cols, check_rows[sel], blocks[block], rep_pos[check_codes[sel]])
+        kept[start + check_rows[equal]] = False
+        stat["checked"] += int(equal.sum())
+        if not equal.all():
+            clash = check_rows[~equal]
+            keys = _row_keys(df.iloc[clash], cols or list(df.columns))
+            for row, code, key in zip(clash.tolist(), check_codes[~equal].tolist(), keys):
+                seen = others.setdefault(code, [])
+                if key in seen:
+                    kept[start + row] = False
+                    stat["checked"] += 1
+                else:
+                    seen.append(key)
+                    stat["collisions"] += 1
+        np.subtract.at(remaining, row_codes, 1)
+        done = np.unique(row_codes[remaining[row_codes] == 0])
+        for block, n in zip(*np.unique(rep_block[done], return_counts=True)):
+            alive[block] -= n
+            if not alive[block]:
+                blocks[block] = None
+        for code in done.tolist() if others else ():
+            others.pop(code, None)
+        yield start, df
+
+
+def _dedup_partitioned(chunks, step, area):
+    """按去重键摘要分区落盘，分区内去重后按原行号归并"""
+    cols, keep = step.get("columns"), step.get("keep", "first")
+    parts, schema = _partition(chunks, cols, area, seq=True)
+    runs, checked, collisions = [], 0, 0
+    for part in parts:
+        df = pd.concat(list(part))
+        df, n_checked, n_collisions = _dedup_frame(df, cols or [c for c in df.columns if c != _SEQ], keep)
+        checked, collisions = checked + n_checked, collisions + n_collisions
+        runs.append(area.spill_frame(df))
+    _print_dedup_check(checked, collisions)
+    yield from _finish_merge(runs, _seq_key, area, schema, step)
+
+
+def _chunked_sort(chunks, step, area):
+    """sort：外部归并排序，每块排好序落盘为一段，再多路归并（稳定，空值在后）"""
+    col, desc = step["column"], step.get("desc", False)
+    runs = []
+    schema = None
+    offset = 0
+    for df in chunks:
+        if schema is None:
+            schema = df.iloc[:0]
+        keys = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        if desc:
+            keys = -keys
+        seq = np.arange(offset, offset + len(df))
+        offset += len(df)
+        missing = np.isnan(keys)
+        order = np.lexsort((seq, np.where(missing, 0, keys), missing))
+        runs.append(area.spill_frame(df.assign(**{_SORT_KEY: keys, _SEQ: seq}).iloc[order]))
+    yield from _finish_merge(runs, _sort_key, area, schema, step)
+
+
+def _chunked_aggregate(chunks, step, area):
+    """aggregate：只保留分组列和指标列，按分组列哈希分区，逐分区聚合后按分组列排序"""
+    group_by = _as_list(step["group_by"])
+    needed = list(dict.fromkeys(group_by + list(step["metrics"])))
+    parts, schema = _partition((df[needed] for df in chunks), group_by, area)
+    if not parts:
+        yield _apply_step(schema, step)
+        return
+    df = pd.concat([_apply_step(pd.concat(list(p)), step) for p in parts], ignore_index=True)
+    yield from _slices(df.sort_values(group_by, kind="stable", ignore_index=True), area.chunk_rows)
+
 
-    # 四舍五入浮点显示
+def _chunked_pivot(chunks, step, area):
+    """pivot：按行索引列哈希分区，逐分区透视后合并（行、列均按标签排序，与整表透视一致）"""
+    index = step["index"] if isinstance(step["index"], list) else [step["index"]]
+    parts, schema = _partition(chunks, index, area)
+    if not parts:
+        yield _apply_step(schema, step)
+        return
+    df = pd.concat([pd.pivot_table(pd.concat(list(p)), index=step["index"], columns=step["columns"],
+                                   values=step["values"], aggfunc=step.get("aggfunc", "sum"))
+                    for p in parts])
+    df = _flatten_columns(df.sort_index().sort_index(axis=1).reset_index())
+    yield from _slices(df, area.chunk_rows)
+
+
+# 需要看到整表的步骤；其余步骤逐块独立执行
+_CHUNKED_STEPS = {"filter": _chunked_filter, "add_column": _chunked_add_column, "dedup": _chunked_dedup,
+                  "sort": _chunked_sort, "aggregate": _chunked_aggregate, "pivot": _chunked_pivot}
+
+
+def _counted(chunks, stat, key):
+    """透传块并累计行数到 stat[key]；before 同时记下首块的空结构（trim 说明要用）"""
+    for df in chunks:
+        if key == "before" and stat["df"] is None:
+            stat["df"] = df.iloc[:0]
+        stat[key] += len(df)
+        yield df
+
+
+def _round_floats(df):
     float_cols = df.select_dtypes(include="float").columns
     df[float_cols] = df[float_cols].round(2)
+    return df
 
-    print(f"\n[清洗后] {len(df)} 行 × {len(df.columns)} 列")
 
-    # 预览
-    if preview_only or not output_path:
-        print(f"\n预览前 10 行：")
-        print(df.head(10).to_string(index=False))
-        if not output_path:
-            print(f"\n[提示] 未指定输出路径，仅预览。用 -o 指定输出文件。")
-        return
+def _peak_memory_mb():
+    """进程内存峰值（MB）；平台不支持时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
 
-    # 导出
-    ext = os.path.splitext(output_path)[1].lower()
-    if ext == ".csv":
-        df.to_csv(output_path, index=False, encoding="utf-8-sig")
-    elif ext == ".json":
-        df.to_json(output_path, orient="records", force_ascii=False, indent=2)
-    elif ext in (".xlsx", ".xls"):
-        df.to_excel(output_path, index=False, engine="openpyxl")
-    else:
-        print(f"[错误] 不支持的格式: {ext}，支持 .csv .json .xlsx")
+
+def _clean_chunked(session, sheet_name, sheet_cfg, steps, output_path, preview_only, chunk_rows):
+    """分块执行清洗：内存中每次只保留约 chunk_rows 行，需要整表的步骤借助落盘完成"""
+    export = output_path and not preview_only
+    area = _SpillArea(chunk_rows)
+    try:
+        headers, total, chunks = _sheet_chunks(session, sheet_name, sheet_cfg, area)
+        area.partitions = max(1, min(_MAX_FANOUT, -(-total // chunk_rows)))
+        print(f"[引擎] 读取={session.engine}, 处理=pandas（分块，每块 {chunk_rows} 行）")
+        print(f"[Sheet] {sheet_name}")
+        print(f"[清洗前] {total} 行 × {len(headers)} 列")
+
+        stats = []
+        for step in steps:
+            stat = {"before": 0, "after": 0, "df": None}
+            stats.append(stat)
+            chunks = _counted(chunks, stat, "before")
+            run = _CHUNKED_STEPS.get(step.get("action"), _chunked_local)
+            chunks = run(chunks, step, area)
+            chunks = _counted(chunks, stat, "after")
+
+        writer = _ChunkWriter(output_path) if export else None
+        head = []
+        rows = 0
+        columns = headers
+        try:
+            for df in chunks:
+                df = _round_floats(df)
+                columns = df.columns
+                rows += len(df)
+                if sum(len(h) for h in head) < 10:
+                    head.append(df.head(10))
+                if writer:
+                    writer.write(df)
+        finally:
+            if writer:
+                writer.close()
+
+        for i, (step, stat) in enumerate(zip(steps, stats)):
+            print(f"  步骤{i+1} {_step_message(step, stat['before'], stat['after'], stat['df'])}")
+        print(f"\n[清洗后] {rows} 行 × {len(columns)} 列")
+
+        if not export:
+            print(f"\n预览前 10 行：")
+            print(pd.concat(head).head(10).to_string(index=False))
+            if not output_path:
+                print(f"\n[提示] 未指定输出路径，仅预览。用 -o 指定输出文件。")
+        else:
+            print(f"[导出] {output_path} ({rows}行)")
+    finally:
+        area.close()
+
+    peak = _peak_memory_mb()
+    memory = f"，内存峰值 {peak:.0f} MB" if peak is not None else ""
+    print(f"[分块] 落盘 {area.spilled_bytes / (1024 * 1024):.1f} MB{memory}")
+
+
+# ==================== 输出：逐块写出 csv / json / jsonl / xlsx（可 .gz/.zst 压缩）====================
+
+# 导出时每块行数 EXPORT_CHUNK_ROWS（EXCEL_TOOL_CHUNK_ROWS 可调）见 _load_env_settings
+_OUTPUT_FORMATS = (".csv", ".json", ".jsonl", ".xlsx", ".xls")
+_COMPRESSIONS = {".gz": "gzip", ".zst": "zstd"}
+
+
+def _output_format(path):
+    """输出路径 → (格式扩展名, 压缩方式或 None)；不支持时打印原因并返回 None"""
+    root, ext = os.path.splitext(path.lower())
+    compression = _COMPRESSIONS.get(ext)
+    if compression:
+        ext = os.path.splitext(root)[1]
+    if ext not in _OUTPUT_FORMATS or (compression and ext in (".xlsx", ".xls")):
+        print(f"[错误] 不支持的格式: {os.path.basename(path)}，支持 .csv .json .jsonl .xlsx"
+              f"（csv/json/jsonl 可加 .gz 或 .zst 压缩）")
+        return None
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            print("[错误] .zst 输出需要 zstandard：pip install zstandard（或改用 .gz）")
+            return None
+    return ext, compression
+
+
+def _open_output(path, compression, encoding):
+    """按压缩方式打开文本输出流（不转换换行符，与 pandas 直接写文件一致）"""
+    if compression == "gzip":
+        return gzip.open(path, "wt", compresslevel=6, encoding=encoding, newline="")
+    if compression == "zstd":
+        import zstandard
+        raw = zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+        return io.TextIOWrapper(raw, encoding=encoding, newline="")
+    return open(path, "w", encoding=encoding, newline="")
+
+
+class _ChunkWriter:
+    """逐块写出，结果与整表一次写出相同（xlsx 不带表头样式）。
+
+    .json 为缩进的记录数组，.jsonl 每行一条记录；路径须先经 _output_format 校验。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.ext, self.compression = _output_format(path)
+        self._file = None
+        self._wb = None
+        self._parts = 0
+
+    def write(self, df):
+        if self.ext == ".csv":
+            first = self._file is None
+            if first:
+                self._file = _open_output(self.path, self.compression, "utf-8-sig")
+            df.to_csv(self._file, index=False, header=first)
+        elif self.ext == ".json":
+            if self._file is None:
+                self._file = _open_output(self.path, self.compression, "utf-8")
+                self._file.write("[\n")
+            body = df.to_json(orient="records", force_ascii=False, indent=2)[2:-2]
+            if body:
+                self._file.write((",\n" if self._parts else "") + body)
+                self._parts += 1
+        elif self.ext == ".jsonl":
+            if self._file is None:
+                self._file = _open_output(self.path, self.compression, "utf-8")
+            if len(df):
+                self._file.write(df.to_json(orient="records", force_ascii=False, lines=True))
+        else:
+            if self._wb is None:
+                from openpyxl import Workbook  # xml/pywin32 引擎下未导入 openpyxl
+                self._wb = Workbook(write_only=True)
+                self._ws = self._wb.create_sheet("Sheet1")
+                self._ws.append([str(c) for c in df.columns])
+            for row in df.astype(object).where(df.notna(), None).itertuples(index=False):
+                self._ws.append(list(row))
+
+    def close(self):
+        if self._file is not None:
+            if self.ext == ".json":
+                self._file.write("\n]")
+            self._file.close()
+        if self._wb is not None:
+            self._wb.save(self.path)
+
+
+def _write_chunks(chunks, output_path):
+    """逐块写出到 output_path，返回总行数。
+
+    chunks 为生成器时（export、分块 clean）边读边写，"写出"阶段的耗时包含生成各块的读取和清洗。
+    """
+    writer = _ChunkWriter(output_path)
+    rows = 0
+    with _profiled("写出") as record:
+        try:
+            for df in chunks:
+                writer.write(df)
+                rows += len(df)
+        finally:
+            writer.close()
+        record["rows_in"] = record["rows_out"] = rows
+    return rows
+
+
+# ==================== batch 命令：同一规则批量清洗多个工作簿 ====================
+
+_BATCH_PATTERNS = ("*.xlsx", "*.xlsm")
+# 合并输出时标记每行来自哪个工作簿
+SOURCE_COLUMN = "来源文件"
+
+
+def _batch_inputs(inputs):
+    """目录 / 通配符 / 文件 → 去重排序后的工作簿列表（跳过 Excel 打开时的 ~$ 锁文件）"""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for pattern in _BATCH_PATTERNS:
+                files.extend(glob.glob(os.path.join(item, pattern)))
+        elif glob.has_magic(item):
+            files.extend(glob.glob(item, recursive=True))
+        else:
+            files.append(item)
+    return sorted({os.path.abspath(f) for f in files if not os.path.basename(f).startswith("~$")})
+
+
+def do_batch(inputs, rules_path, output_path=None, output_dir=None, fmt="csv", sheet=None, jobs=None):
+    """用同一规则清洗多个工作簿：逐文件输出到 output_dir，或合并为一个 output_path（带来源文件列）"""
+    files = _batch_inputs(inputs)
+    if not files:
+        print(f"[错误] 未找到工作簿: {' '.join(inputs)}")
+        return
+    rules = _load_rules(rules_path)
+    if rules is None:
         return
-    print(f"[导出] {output_path} ({len(df)}行)")
+    if output_path:
+        if _output_format(output_path) is None:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    if output_dir:
+        if _output_format("x." + fmt) is None:
+            return
+        os.makedirs(output_dir, exist_ok=True)
+
+    jobs = max(1, min(jobs or JOBS or os.cpu_count() or 1, len(files)))
+    print(f"[批量] {len(files)} 个工作簿，规则 {os.path.basename(rules_path)}，{jobs} 进程，处理={PROCESS_BACKEND}")
+    steps = rules.get("steps", [])
+    tasks = [(f, steps, sheet, os.path.join(output_dir, _batch_output_name(f, fmt)) if output_dir else None,
+              bool(output_path)) for f in files]
+
+    start = time.perf_counter()
+    writer = _ChunkWriter(output_path) if output_path else None
+    columns = None
+    ok = failed = rows_in = rows_out = 0
+    try:
+        if jobs == 1:
+            results = (_batch_job(None, *task) for task in tasks)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=jobs)
+            settings = _worker_settings()
+            results = (f.result() for f in [pool.submit(_batch_job, settings, *task) for task in tasks])
+        for file_path, result in zip(files, results):
+            name = os.path.basename(file_path)
+            if result["profile"] and _profiler is not None:
+                _profiler.merge(result["profile"], depth=1)
+            if result["error"]:
+                failed += 1
+                print(f"  [失败] {name}: {result['error']}")
+                continue
+            ok += 1
+            rows_in += result["rows_in"]
+            rows_out += result["rows_out"]
+            print(f"  [完成] {name}: {result['rows_in']}→{result['rows_out']} 行 ({result['seconds']:.2f}s)")
+            df = result["df"]
+            if writer and df is not None:
+                # 合并输出按第一个文件的列对齐，多出的列不写入
+                if columns is None:
+                    columns = df.columns
+                extra = [c for c in df.columns if c not in columns]
+                if extra:
+                    print(f"    [提示] 多出的列未写入合并结果: {extra}")
+                for chunk in _slices(df.reindex(columns=columns), EXPORT_CHUNK_ROWS):
+                    writer.write(chunk)
+    finally:
+        if writer:
+            writer.close()
+        if jobs > 1:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - start
+    print(f"\n[汇总] 成功 {ok} 个，失败 {failed} 个；{rows_in} 行 → {rows_out} 行")
+    print(f"[吞吐] {elapsed:.2f}s，{len(files) / elapsed:.1f} 文件/s，{rows_in / elapsed:.0f} 行/s")
+    if output_path:
+        print(f"[导出] {output_path} ({rows_out}行，含 {SOURCE_COLUMN} 列)")
+    elif output_dir:
+        print(f"[导出] {output_dir}（每个工作簿一个 .{fmt}）")
+
+
+def _batch_output_name(file_path, fmt):
+    return os.path.splitext(os.path.basename(file_path))[0] + "." + fmt
+
+
+def _batch_job(settings, file_path, steps, sheet, output_path, keep):
+    """清洗一个工作簿：output_path 给出时写出该文件，keep 时返回带来源文件列的 DataFrame。
+
+    返回 {"rows_in", "rows_out", "df", "seconds", "error", "profile"}；工具的过程输出不转印，出错时只报原因。
+    """
+    if settings:
+        _apply_worker_settings(settings)
+    result = {"rows_in": 0, "rows_out": 0, "df": None, "seconds": 0.0, "error": None, "profile": None}
+    start = time.perf_counter()
+    session = WorkbookSession(file_path)
+    out = io.StringIO()
+    try:
+        with redirect_stdout(out), _profiled(os.path.basename(file_path), "file") as record:
+            names = session.sheet_names()
+            if sheet and sheet not in names:
+                raise LookupError(f"Sheet '{sheet}' 不存在")
+            if not sheet and len(names) != 1:
+                raise LookupError("有多个 Sheet，请用 --sheet 指定")
+            sheet_name = sheet or names[0]
+            sheet_cfg = _auto_detect_sheets(session, [sheet_name])[sheet_name]
+            plan = _CleanPlan(steps)
+            df = read_to_dataframe(session, sheet_name, sheet_cfg, wanted=plan.wanted)
+            result["rows_in"] = len(df)
+            df = plan.compile(df).run(df, report=False)
+            df = _round_floats(df)
+            if output_path:
+                _write_chunks(_slices(df, EXPORT_CHUNK_ROWS), output_path)
+            record["rows_in"], record["rows_out"] = result["rows_in"], len(df)
+        result["rows_out"] = len(df)
+        if keep:
+            df.insert(0, SOURCE_COLUMN, os.path.basename(file_path))
+            result["df"] = df
+    except KeyError as e:
+        result["error"] = f"列名不存在: {e}"
+    except LookupError as e:
+        result["error"] = str(e)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        session.close()
+    result["seconds"] = time.perf_counter() - start
+    result["profile"] = _worker_profile(settings)
+    return result
 
 
 # ==================== export 命令：直接导出干净数据（供自定义脚本使用）====================
 
-def do_export(file_path, output_path, sheet=None):
-    sheets = _auto_detect_sheets(file_path)
+def do_export(file_path, output_path, sheet=None, all_sheets=False, jobs=None):
+    """流式导出：逐块读取、清洗、写出，内存中同时只有一块（命中解析缓存时按块切分缓存）。
 
-    if not sheets:
-        print("[错误] 未检测到有效的 Sheet")
-        return
+    all_sheets 时每个 Sheet 导出一个文件（路径中插入 -Sheet名），多个 Sheet 可并行。
+    """
+    with WorkbookSession(file_path) as session:
+        names = session.sheet_names()
 
-    if sheet:
-        if sheet not in sheets:
-            print(f"[错误] Sheet '{sheet}' 不存在")
-            print(f"[可用 Sheet] {', '.join(sheets.keys())}")
+        if not names:
+            print("[错误] 未检测到有效的 Sheet")
             return
-        sheet_name = sheet
-        sheet_cfg = sheets[sheet]
-    else:
-        if len(sheets) == 1:
-            sheet_name = list(sheets.keys())[0]
-            sheet_cfg = sheets[sheet_name]
-        else:
-            print(f"[错误] 有多个 Sheet，请用 --sheet 指定")
-            print(f"[可用 Sheet] {', '.join(sheets.keys())}")
+
+        if _output_format(output_path) is None:
             return
+        if all_sheets:
+            targets = names
+        else:
+            sheet_name = _select_sheet(names, sheet)
+            if sheet_name is None:
+                if len(names) > 1 and not sheet:
+                    print(f"[提示] 全部导出用 --all-sheets（每个 Sheet 一个文件）")
+                return
+            targets = [sheet_name]
 
-    df = read_to_dataframe(file_path, sheet_name, sheet_cfg)
+        sheets = _auto_detect_sheets(session, targets)
+        print(f"[引擎] 读取={session.engine}, 处理=pandas")
+        for _ in _map_sheets(session, _export_sheet, sheets, output_path, all_sheets, jobs=jobs):
+            pass
 
-    # 四舍五入浮点显示
-    float_cols = df.select_dtypes(include="float").columns
-    df[float_cols] = df[float_cols].round(2)
 
-    print(f"[引擎] 读取={READ_ENGINE}, 处理=pandas")
-    print(f"[Sheet] {sheet_name}")
-    print(f"[数据] {len(df)} 行 × {len(df.columns)} 列")
-
-    ext = os.path.splitext(output_path)[1].lower()
-    if ext == ".csv":
-        df.to_csv(output_path, index=False, encoding="utf-8-sig")
-    elif ext == ".json":
-        df.to_json(output_path, orient="records", force_ascii=False, indent=2)
-    elif ext in (".xlsx", ".xls"):
-        df.to_excel(output_path, index=False, engine="openpyxl")
-    else:
-        print(f"[错误] 不支持的格式: {ext}，支持 .csv .json .xlsx")
-        return
-    print(f"[导出] {output_path} ({len(df)}行)")
+def _export_sheet(session, sheet_name, sheet_cfg, output_path, per_sheet=False):
+    """导出一个 Sheet，返回导出行数；per_sheet 时输出路径中插入 -Sheet名"""
+    if per_sheet:
+        output_path = _sheet_output_path(output_path, sheet_name)
+    area = _SpillArea(EXPORT_CHUNK_ROWS)
+    try:
+        headers, total, chunks = _sheet_chunks(session, sheet_name, sheet_cfg, area)
+        print(f"[Sheet] {sheet_name}")
+        print(f"[数据] {total} 行 × {len(headers)} 列")
+        rows = _write_chunks((_round_floats(df) for df in chunks), output_path)
+    finally:
+        area.close()
+    print(f"[导出] {output_path} ({rows}行)")
+    return rows
+
+
+def _sheet_output_path(output_path, sheet_name):
+    """在格式扩展名前插入 -Sheet名：data.csv.gz → data-销售.csv.gz（文件名非法字符替换为 _）"""
+    root, ext = os.path.splitext(output_path)
+    if ext.lower() in _COMPRESSIONS:
+        root, inner = os.path.splitext(root)
+        ext = inner + ext
+    safe = re.sub(r'[\\/:*?"<>|]', "_", sheet_name)
+    return f"{root}-{safe}{ext}"
 
 
 # ==================== steps 校验 ====================
@@ -827,10 +4914,39 @@ def _validate_steps(rules):
         for param in _ACTION_REQUIRED[action]:
             if param not in step:
                 errors.append(f"步骤{i} [{action}]: 缺少必填参数 '{param}'")
+        if action == "dedup" and step.get("keep", "first") not in ("first", "last"):
+            errors.append(f"步骤{i} [dedup]: keep 只能是 first 或 last")
 
     return errors
 
 
+def _load_rules(rules_path):
+    """读取并校验规则文件；校验失败时打印错误和 help 提示并返回 None"""
+    with open(rules_path, encoding="utf-8") as f:
+        rules = json.load(f)
+
+    # 校验 steps 格式
+    errors = _validate_steps(rules)
+    if errors:
+        print(f"[规则校验失败] {rules_path}")
+        for e in errors:
+            print(f"  {e}")
+        print(f"\n[提示] 用 help 查看正确格式：")
+        # 提取出错的 action 名称用于提示
+        actions_mentioned = set()
+        for step in rules.get("steps", []):
+            a = step.get("action")
+            if a and a in _ACTION_REQUIRED:
+                actions_mentioned.add(a)
+        if actions_mentioned:
+            for a in sorted(actions_mentioned):
+                print(f"  python {TOOL_PATH} help {a}")
+        else:
+            print(f"  python {TOOL_PATH} help")
+        return None
+    return rules
+
+
 # ==================== help 命令 ====================
 
 _HELP_ACTIONS = {
@@ -866,8 +4982,15 @@ _HELP_ACTIONS = {
 格式:
   {"action": "dedup"}
   {"action": "dedup", "columns": ["区域", "型号"]}
+  {"action": "dedup", "columns": ["订单号"], "keep": "last"}
 
-不指定 columns 则按全列去重，保留第一条。""",
+参数:
+  columns: (可选) 按哪些列判断重复，不指定则按全列
+  keep:    (可选) first 保留第一条（默认），last 保留最后一条
+
+按去重键的 64 位摘要判重，摘要相同的行再逐值核对，结果与逐值比较一致。
+分块执行（--chunk-size）时内存中只保留摘要；摘要超过 EXCEL_TOOL_DEDUP_MB（默认 512）
+时按摘要分区落盘。""",
 
     "filter": """[filter - 多条件筛选]
 
@@ -904,8 +5027,19 @@ logic:  and（全部满足）或 or（任一满足）
 
 参数:
   name:    新列名
-  formula: 计算公式，用 {列名} 引用已有列，支持 + - * / **
-  round:   (可选) 小数位数""",
+  formula: 计算公式，用 {列名} 引用已有列，支持 + - * / // % **
+           比较 > >= < <= == !=，and / or / not，{列} in [值1, 值2]
+           条件: IF(条件, 真值, 假值) 或 真值 if 条件 else 假值
+           函数: round(x, 位数)、abs、min、max、coalesce(a, b, ...)（取第一个非空值）
+  round:   (可选) 小数位数
+
+说明:
+  文本列中的数字自动转为数值参与计算（转不了的按空值）；全是文本的列可与字符串比较
+  公式只编译一次，同一 batch 的多个文件共用；安装 numexpr 时大表数值运算交给 numexpr
+
+示例:
+  {"action": "add_column", "name": "等级", "formula": "IF({销量} >= 100, 'A', 'B')"}
+  {"action": "add_column", "name": "实收", "formula": "coalesce({实付}, {应付}, 0)"}""",
 
     "drop_columns": """[drop_columns - 删除列]
 
@@ -1007,9 +5141,175 @@ def do_help(topic=None):
         print(f"\n用法: python {TOOL_PATH} help <操作名>")
 
 
+# ==================== daemon 命令：常驻进程（库只导入一次，最近读取的 Sheet 留在内存）====================
+
+# 空闲多少秒后自动退出
+DAEMON_IDLE_SECONDS = float(os.environ.get("EXCEL_TOOL_DAEMON_IDLE", "600"))
+
+
+class _FrameWriter(io.TextIOBase):
+    """把命令输出按帧实时发回客户端（帧格式见 _daemon_request）"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        data = text.encode("utf-8", errors="replace")
+        if data:
+            self._conn.sendall(b"O" + len(data).to_bytes(4, "big", signed=True) + data)
+        return len(text)
+
+    def end(self, code):
+        self._conn.sendall(b"X" + int(code).to_bytes(4, "big", signed=True))
+
+
+def do_daemon(action="status", foreground=False, idle=None):
+    """daemon 命令：start 后台启动（--foreground 在当前进程运行）/ status / stop"""
+    if not hasattr(socket, "AF_UNIX"):
+        print("[错误] 当前平台不支持常驻进程（需要 Unix domain socket）")
+        return
+    try:
+        conn = _daemon_connect()
+    except OSError:
+        conn = None
+
+    if action == "start":
+        if conn is not None:
+            conn.close()
+            print(f"[daemon] 已在运行: {_daemon_socket_path()}")
+            return
+        if foreground:
+            _daemon_serve(idle or DAEMON_IDLE_SECONDS)
+            return
+        _daemon_launch()
+        try:
+            _daemon_connect(wait=15).close()
+        except OSError:
+            print("[错误] 常驻进程启动失败，可用 daemon start --foreground 查看原因")
+            return
+        print(f"[daemon] 已启动: {_daemon_socket_path()}")
+        print(f"[用法] 命令加 --daemon（或设置 EXCEL_TOOL_DAEMON=1）即转发给常驻进程执行：")
+        print(f"  python {TOOL_PATH} auto <文件> query --sheet \"Sheet名\" ... --daemon")
+        return
+
+    if conn is None:
+        print("[daemon] 未运行")
+        return
+    with conn:
+        _daemon_request(conn, {"cmd": action}, sys.stdout.buffer)
+
+
+def _daemon_serve(idle):
+    """在当前进程监听 socket，逐个执行转发来的命令，空闲 idle 秒或收到 stop 后退出"""
+    global _memory_cache
+    path = _daemon_socket_path()
+    os.makedirs(DAEMON_DIR, exist_ok=True)
+    if os.path.exists(path):
+        os.unlink(path)  # 连不上的残留 socket
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(16)
+    server.settimeout(1.0)
+
+    _memory_cache = OrderedDict()
+    engine = _read_engine()
+    _import_engine(engine)
+    _import_now(np, pd)
+    state = {"started": time.time(), "last": time.time(), "idle": idle, "requests": 0, "stop": False,
+             "defaults": (engine, PROCESS_BACKEND, FILL_MERGED)}
+    try:
+        while not state["stop"] and time.time() - state["last"] < idle:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            with conn:
+                conn.settimeout(None)
+                try:
+                    _daemon_handle(conn, state)
+                except (OSError, ValueError):
+                    pass  # 客户端中途断开或请求格式错误，不影响后续请求
+            state["last"] = time.time()
+    finally:
+        server.close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def _daemon_handle(conn, state):
+    request = json.loads(conn.makefile("rb").readline())
+    out = _FrameWriter(conn)
+    cmd = request.get("cmd")
+    code = 0
+    if cmd == "run":
+        state["requests"] += 1
+        code = _daemon_run(request, out, state["defaults"])
+    elif cmd == "status":
+        _daemon_status(state, out)
+    elif cmd == "stop":
+        out.write("[daemon] 已停止\n")
+        state["stop"] = True
+    else:
+        out.write(f"[错误] 未知请求: {cmd}\n")
+        code = 1
+    out.end(code)
+
+
+def _daemon_run(request, out, defaults):
+    """在客户端的工作目录和 EXCEL_TOOL_* 环境变量下执行一条命令，输出实时发回；返回退出码"""
+    global READ_ENGINE, PROCESS_BACKEND, FILL_MERGED
+    # 上一条命令的 --engine / --backend 等设置不能带到下一条（默认引擎启动时已导入）
+    READ_ENGINE, PROCESS_BACKEND, FILL_MERGED = defaults
+    saved_env = {k: v for k, v in os.environ.items() if k.startswith("EXCEL_TOOL_")}
+    saved_cwd = os.getcwd()
+    for k in saved_env:
+        del os.environ[k]
+    os.environ.update(request.get("env") or {})
+    # 缓存目录、--no-cache 对应的开关、分块行数等按客户端的环境重新读取（也清掉上一条命令的参数）
+    _load_env_settings()
+    try:
+        os.chdir(request.get("cwd") or saved_cwd)
+        with redirect_stdout(out), redirect_stderr(out):
+            try:
+                return run_cli(request["argv"])
+            except SystemExit as e:  # argparse 参数错误
+                return e.code if isinstance(e.code, int) else int(e.code is not None)
+    finally:
+        os.chdir(saved_cwd)
+        for k in [k for k in os.environ if k.startswith("EXCEL_TOOL_")]:
+            del os.environ[k]
+        os.environ.update(saved_env)
+        _load_env_settings()
+
+
+def _daemon_status(state, out):
+    now = time.time()
+    hits = _cache_stats["memory"] + _cache_stats["disk"]
+    lookups = hits + _cache_stats["miss"]
+    size = sum(size for _, size in _memory_cache.values())
+    print(f"[daemon] 运行中 pid {os.getpid()}，已运行 {(now - state['started']) / 60:.1f} 分钟，"
+          f"执行 {state['requests']} 条命令，空闲 {state['idle'] - (now - state['last']):.0f}s 后退出",
+          file=out)
+    print(f"[内存缓存] {len(_memory_cache)} 条，{size / 1024 / 1024:.1f} MB / "
+          f"上限 {MEMORY_CACHE_MAX_BYTES / 1024 / 1024:.0f} MB", file=out)
+    if lookups:
+        print(f"[命中率] 内存 {_cache_stats['memory']} 次，磁盘 {_cache_stats['disk']} 次，"
+              f"未命中 {_cache_stats['miss']} 次（内存 {_cache_stats['memory'] / lookups:.0%}，"
+              f"合计 {hits / lookups:.0%}）", file=out)
+    else:
+        print("[命中率] 暂无缓存查询", file=out)
+    print(f"[socket] {_daemon_socket_path()}", file=out)
+
+
 # ==================== CLI ====================
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Excel 报表工具")
     sub = parser.add_subparsers(dest="command")
 
@@ -1017,6 +5317,8 @@ def main():
     p_scout.add_argument("file")
     p_scout.add_argument("-n", type=int, default=8)
     p_scout.add_argument("--sheet", help="指定 Sheet 名称")
+    p_scout.add_argument("--engine", choices=READ_ENGINES, help="读取引擎（默认自动检测）")
+    p_scout.add_argument("--daemon", action="store_true", help="由常驻进程执行（未运行时自动启动）")
 
     p_auto = sub.add_parser("auto", help="自动模式")
     p_auto.add_argument("file")
@@ -1024,12 +5326,21 @@ def main():
                         choices=["headers", "preview", "query"])
     p_auto.add_argument("-n", type=int, default=5)
     p_auto.add_argument("--sheet", help="指定 Sheet 名称")
+    p_auto.add_argument("--engine", choices=READ_ENGINES, help="读取引擎（默认自动检测）")
+    p_auto.add_argument("--daemon", action="store_true", help="由常驻进程执行（未运行时自动启动）")
+    p_auto.add_argument("--no-cache", action="store_true", help="不读写解析缓存")
+    p_auto.add_argument("--fill-merged", action="store_true",
+                        help="合并单元格的每个格子都填左上角的值（如纵向合并的区域名），默认只有左上角有值")
+    p_auto.add_argument("--profile", nargs="?", const="", metavar="PATH",
+                        help="按阶段 / 步骤打印耗时、CPU、行数和内存；给出路径时写出 JSON（.trace.json 为 Chrome trace）")
+    p_auto.add_argument("--cache-hash", action="store_true", help="按文件内容哈希识别缓存（touch、复制、改名后仍命中）")
     p_auto.add_argument("--where-col")
     p_auto.add_argument("--where-op")
     p_auto.add_argument("--where-val")
     p_auto.add_argument("-c", "--columns")
     p_auto.add_argument("-s", "--sort", help="排序，降序用 desc:列名")
     p_auto.add_argument("-t", "--top", type=int, default=10)
+    p_auto.add_argument("--jobs", type=int, help="多 Sheet 并行读取的进程数（默认大文件自动并行）")
 
     p_clean = sub.add_parser("clean", help="按规则清洗数据")
     p_clean.add_argument("file")
@@ -1037,34 +5348,131 @@ def main():
                          help="规则文件路径（可选，省略时自动查找 .excel-steps.json）")
     p_clean.add_argument("-o", "--output")
     p_clean.add_argument("--preview", action="store_true")
+    p_clean.add_argument("--exact", action="store_true", help="预览时按整表执行并缓存每一步的结果，只改了后面的步骤时从缓存续跑"
+                         "（默认只用样本执行，不写步骤缓存）")
+    p_clean.add_argument("--sample", type=int, help=f"预览样本行数（默认 {PREVIEW_SAMPLE_ROWS}）")
+    p_clean.add_argument("--sample-random", action="store_true",
+                         help="预览样本随机抽取（扫描整表，只保留样本行），默认取前 N 行")
     p_clean.add_argument("--sheet", help="指定 Sheet 名称")
+    p_clean.add_argument("--engine", choices=READ_ENGINES, help="读取引擎（默认自动检测）")
+    p_clean.add_argument("--daemon", action="store_true", help="由常驻进程执行（未运行时自动启动）")
+    p_clean.add_argument("--no-cache", action="store_true", help="不读写解析缓存")
+    p_clean.add_argument("--fill-merged", action="store_true",
+                        help="合并单元格的每个格子都填左上角的值（如纵向合并的区域名），默认只有左上角有值")
+    p_clean.add_argument("--profile", nargs="?", const="", metavar="PATH",
+                        help="按阶段 / 步骤打印耗时、CPU、行数和内存；给出路径时写出 JSON（.trace.json 为 Chrome trace）")
+    p_clean.add_argument("--cache-hash", action="store_true", help="按文件内容哈希识别缓存（touch、复制、改名后仍命中）")
+    p_clean.add_argument("--chunk-size", type=int,
+                         help="分块执行，每块行数（超出内存的大表用，中间结果落盘）")
+    p_clean.add_argument("--explain", action="store_true",
+                         help="打印优化后的执行计划，并与按原顺序执行对比耗时和结果")
+    p_clean.add_argument("--no-optimize", action="store_true", help="按 steps 原顺序逐步执行")
+    p_clean.add_argument("--backend", choices=PROCESS_BACKENDS, help="处理后端（默认 pandas）")
 
     p_export = sub.add_parser("export", help="导出干净数据（供自定义脚本使用）")
     p_export.add_argument("file")
-    p_export.add_argument("-o", "--output", required=True, help="输出路径（.csv/.json/.xlsx）")
+    p_export.add_argument("-o", "--output", required=True, help="输出路径（.csv/.json/.jsonl/.xlsx，csv/json/jsonl 可加 .gz/.zst）")
     p_export.add_argument("--sheet", help="指定 Sheet 名称")
+    p_export.add_argument("--all-sheets", action="store_true", help="导出全部 Sheet，每个 Sheet 一个文件")
+    p_export.add_argument("--jobs", type=int, help="--all-sheets 时并行导出的进程数（默认大文件自动并行）")
+    p_export.add_argument("--engine", choices=READ_ENGINES, help="读取引擎（默认自动检测）")
+    p_export.add_argument("--daemon", action="store_true", help="由常驻进程执行（未运行时自动启动）")
+    p_export.add_argument("--no-cache", action="store_true", help="不读写解析缓存")
+    p_export.add_argument("--fill-merged", action="store_true",
+                        help="合并单元格的每个格子都填左上角的值（如纵向合并的区域名），默认只有左上角有值")
+    p_export.add_argument("--profile", nargs="?", const="", metavar="PATH",
+                        help="按阶段 / 步骤打印耗时、CPU、行数和内存；给出路径时写出 JSON（.trace.json 为 Chrome trace）")
+    p_export.add_argument("--cache-hash", action="store_true", help="按文件内容哈希识别缓存（touch、复制、改名后仍命中）")
+
+    p_batch = sub.add_parser("batch", help="同一规则批量清洗多个工作簿")
+    p_batch.add_argument("inputs", nargs="+", help="目录、通配符（如 \"报表/*.xlsx\"）或文件")
+    p_batch.add_argument("-r", "--rules", required=True, help="规则文件路径")
+    p_batch.add_argument("-o", "--output", help="合并输出到一个文件（带来源文件列）")
+    p_batch.add_argument("--output-dir", help="每个工作簿输出一个文件到该目录")
+    p_batch.add_argument("--format", default="csv", help="--output-dir 的输出格式（默认 csv，可用 csv.gz 等）")
+    p_batch.add_argument("--sheet", help="指定 Sheet 名称（多 Sheet 的工作簿必须指定）")
+    p_batch.add_argument("--jobs", type=int, help="并行进程数（默认 CPU 核数）")
+    p_batch.add_argument("--engine", choices=READ_ENGINES, help="读取引擎（默认自动检测）")
+    p_batch.add_argument("--no-cache", action="store_true", help="不读写解析缓存")
+    p_batch.add_argument("--fill-merged", action="store_true",
+                        help="合并单元格的每个格子都填左上角的值（如纵向合并的区域名），默认只有左上角有值")
+    p_batch.add_argument("--profile", nargs="?", const="", metavar="PATH",
+                        help="按阶段 / 步骤打印耗时、CPU、行数和内存；给出路径时写出 JSON（.trace.json 为 Chrome trace）")
+    p_batch.add_argument("--backend", choices=PROCESS_BACKENDS, help="处理后端（默认 pandas）")
+
+    p_cache = sub.add_parser("cache", help="查看/清理解析缓存")
+    p_cache.add_argument("action", nargs="?", default="list", choices=["list", "clear"])
+    p_cache.add_argument("file", nargs="?", default=None, help="只处理该 Excel 的缓存（可选）")
 
     p_steps = sub.add_parser("steps-path", help="查看清洗规则文件的命名模式和已有文件")
     p_steps.add_argument("file")
 
+    p_daemon = sub.add_parser("daemon", help="常驻进程：重复命令免启动开销（命令加 --daemon 使用）")
+    p_daemon.add_argument("action", nargs="?", default="status", choices=["start", "status", "stop"])
+    p_daemon.add_argument("--foreground", action="store_true", help="在当前进程运行（不转入后台）")
+    p_daemon.add_argument("--idle", type=float, help="空闲多少秒后自动退出（默认 600）")
+
     p_help = sub.add_parser("help", help="查看操作格式")
     p_help.add_argument("topic", nargs="?", default=None,
                         help="操作名（如 filter）或 custom-scripts")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+
+    # 命令带 --daemon 或 EXCEL_TOOL_DAEMON=1 时原样转发给常驻进程（pandas 等重依赖是按需导入的，
+    # 到这里还没有加载）；常驻进程内执行转发来的命令时不再转发
+    if args.command in DAEMON_COMMANDS and _memory_cache is None and (
+            args.daemon or os.environ.get("EXCEL_TOOL_DAEMON") == "1"):
+        code = _daemon_forward(sys.argv[1:] if argv is None else list(argv))
+        if code is not None:
+            return code
+
+    engine = getattr(args, "engine", None) or os.environ.get("EXCEL_TOOL_ENGINE")
+    if engine:
+        _set_read_engine(engine)
+    if hasattr(args, "backend"):
+        backend = args.backend or os.environ.get("EXCEL_TOOL_BACKEND")
+        if backend:
+            _set_process_backend(backend)
+
+    global CACHE_ENABLED, CACHE_USE_HASH, FILL_MERGED
+    if getattr(args, "no_cache", False):
+        CACHE_ENABLED = False
+    if getattr(args, "fill_merged", False) or os.environ.get("EXCEL_TOOL_FILL_MERGED") == "1":
+        FILL_MERGED = True
+    if getattr(args, "cache_hash", False):
+        CACHE_USE_HASH = True
+
+    if hasattr(args, "profile"):
+        _profile_start(args.profile if args.profile is not None else os.environ.get("EXCEL_TOOL_PROFILE"))
+        try:
+            with _profiled(f"命令 {args.command}", "command"):
+                _run_command(parser, args)
+        finally:
+            _profile_finish()
+    else:
+        _run_command(parser, args)
+
 
+def _run_command(parser, args):
     if args.command == "scout":
-        print(f"[引擎] {READ_ENGINE}")
+        print(f"[引擎] {_read_engine()}")
         do_scout(args.file, args.n, sheet=args.sheet)
     elif args.command == "auto":
         do_auto(args.file, args.action, sheet=args.sheet, n=args.n,
                 where_col=args.where_col, where_op=args.where_op,
                 where_val=args.where_val, columns=args.columns,
-                sort=args.sort, top=args.top)
+                sort=args.sort, top=args.top, jobs=args.jobs)
     elif args.command == "clean":
-        do_clean(args.file, args.rules, args.output, args.preview, sheet=args.sheet)
+        do_clean(args.file, args.rules, args.output, args.preview, sheet=args.sheet,
+                 chunk_size=args.chunk_size, optimize=not args.no_optimize, explain=args.explain,
+                 exact=args.exact, sample_rows=args.sample, sample_random=args.sample_random)
+    elif args.command == "batch":
+        do_batch(args.inputs, args.rules, args.output, args.output_dir, args.format,
+                 sheet=args.sheet, jobs=args.jobs)
     elif args.command == "export":
-        do_export(args.file, args.output, sheet=args.sheet)
+        do_export(args.file, args.output, sheet=args.sheet, all_sheets=args.all_sheets, jobs=args.jobs)
+    elif args.command == "cache":
+        do_cache(args.action, args.file)
     elif args.command == "steps-path":
         prefix = get_steps_prefix(args.file)
         print(f"[命名规则] {os.path.basename(prefix)}-<操作描述>.excel-steps.json")
@@ -1075,26 +5483,34 @@ def main():
                 print(f"  - {os.path.basename(f)}")
         else:
             print(f"[已有文件] 无")
+    elif args.command == "daemon":
+        do_daemon(args.action, args.foreground, args.idle)
     elif args.command == "help":
         do_help(args.topic)
     else:
         parser.print_help()
 
 
-if __name__ == "__main__":
+def run_cli(argv=None):
+    """执行一条命令并返回退出码（常驻进程也通过它执行转发来的命令）"""
     try:
-        main()
+        code = main(argv)
     except FileNotFoundError as e:
         print(f"[错误] 文件不存在: {e.filename}")
-        sys.exit(1)
+        return 1
     except json.JSONDecodeError as e:
         print(f"[错误] JSON 解析失败: {e.msg}（行{e.lineno} 列{e.colno}）")
         print(f"[提示] 检查 JSON 文件语法，常见问题：多余逗号、缺少引号、中文引号")
-        sys.exit(1)
+        return 1
     except KeyError as e:
         print(f"[错误] 列名不存在: {e}")
         print(f"[提示] 用 auto headers 命令查看可用列名")
-        sys.exit(1)
+        return 1
     except Exception as e:
         print(f"[错误] {type(e).__name__}: {e}")
-        sys.exit(1)
+        return 1
+    return code or 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
@@ -8,7 +8,12 @@
 
 import os
 import sys
+import csv
 import json
+import gzip
+import atexit
+import shutil
+import tempfile
 import subprocess
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -18,9 +23,17 @@ TOOL = os.path.join(SCRIPT_DIR, "excel_tool.py")
 PYTHON = sys.executable
 
 os.makedirs(TEST_DIR, exist_ok=True)
+# 解析缓存写到临时目录，避免污染用户缓存，也不在仓库里留下缓存文件
+CACHE_DIR = tempfile.mkdtemp(prefix="excel_tool_test_cache_")
+os.environ["EXCEL_TOOL_CACHE_DIR"] = CACHE_DIR
+atexit.register(shutil.rmtree, CACHE_DIR, ignore_errors=True)
+# benchmark.py 生成的测试文件同样写到临时目录
+BENCH_DIR = tempfile.mkdtemp(prefix="excel_tool_test_bench_")
+os.environ["EXCEL_TOOL_BENCH_DIR"] = BENCH_DIR
+atexit.register(shutil.rmtree, BENCH_DIR, ignore_errors=True)
 
 
-def run(cmd, label):
+def run(cmd, label, expect=None):
     print(f"\n{'='*60}")
     print(f"测试: {label}")
     print(f"命令: {' '.join(cmd)}")
@@ -31,6 +44,9 @@ def run(cmd, label):
     if result.stderr:
         print(f"[STDERR] {result.stderr}")
     print(f"[退出码] {result.returncode}")
+    if expect is not None and expect not in result.stdout:
+        print(f"[失败] 输出中未找到: {expect}")
+        return False
     return result.returncode == 0
 
 
@@ -135,6 +151,14 @@ def step3_test_auto(test_file):
          "-c", "区域,产品型号,销量"],
         "auto query - 销量>300，只看区域/型号/销量"
     )
+    ok &= run(
+        [PYTHON, TOOL, "auto", test_file, "headers", "--no-cache"],
+        "auto headers - 多 Sheet 共用一次工作簿打开", expect="工作簿打开 1 次"
+    )
+    ok &= run(
+        [PYTHON, TOOL, "auto", test_file, "preview", "--sheet", "库存", "--no-cache"],
+        "auto preview --sheet - 只侦察指定的 Sheet", expect="侦察 1/2 个 Sheet"
+    )
     return ok
 
 
@@ -188,9 +212,44 @@ def step4_test_clean(test_file):
     # 预览
     ok &= run(
         [PYTHON, TOOL, "clean", test_file, rules_path, "--preview", "--sheet", "销售月报"],
-        "clean --preview - 预览清洗结果"
+        "clean --preview - 预览清洗结果（逐步缓存时按原顺序执行）", expect="按原顺序执行（不做自动优化）"
     )
 
+    # 样本预览：表比样本大时只用样本执行，标出近似的步骤；--exact 按整表执行
+    preview = [PYTHON, TOOL, "clean", test_file, rules_path, "--preview", "--sheet", "销售月报", "--sample", "8", "--no-cache"]
+    ok &= run(preview, "clean --preview --sample 8 - 前 8 行样本预览", expect="步骤7 [聚合] 按['区域']: 3组（样本近似）")
+    ok &= run(preview + ["--sample-random"], "clean --preview --sample-random - 随机样本预览",
+              expect="按随机抽取的 8 行执行（整表共 18 行）")
+    ok &= run(preview + ["--exact"], "clean --preview --exact - 整表预览", expect="[清洗前] 18 行")
+    ok &= run([PYTHON, os.path.join(SCRIPT_DIR, "benchmark.py"), "preview", "--rows", "12000"],
+              "preview - 逐行步骤的样本预览与整表预览一致", expect="结果一致: 是")
+
+    # 样本预览的数值比较按整列是否含数值决定（只有最后一行是数值，样本里全是文本）：
+    # 取样时扫描整表统计，按整表筛选；之前的步骤改写了该列、样本中又没有数值时标注近似
+    import openpyxl
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["型号", "数量"])
+    for i in range(100):
+        ws.append([f"M{i}", "缺货" if i < 99 else 100])
+    sparse_file = os.path.join(TEST_DIR, "缺货样本.xlsx")
+    wb.save(sparse_file)
+    sparse_rules = os.path.join(TEST_DIR, "测试缺货筛选规则.json")
+    with open(sparse_rules, "w", encoding="utf-8") as f:
+        json.dump({"steps": [{"action": "filter", "conditions": [{"column": "数量", "op": ">", "value": 5}]}]},
+                  f, ensure_ascii=False, indent=2)
+    sample = [PYTHON, TOOL, "clean", sparse_file, sparse_rules, "--preview", "--sample", "10", "--no-cache"]
+    ok &= run(sample, "clean --preview --sample 10 - 前几行样本按整表统计做数值比较",
+              expect="步骤1 [筛选] AND 1条件: 10→0行\n")
+    ok &= run(sample + ["--sample-random"], "clean --preview --sample-random - 随机样本按整表统计做数值比较",
+              expect="步骤1 [筛选] AND 1条件: 10→0行\n")
+    with open(sparse_rules, "w", encoding="utf-8") as f:
+        json.dump({"steps": [{"action": "replace", "column": "数量", "mapping": {"无货": "缺货"}},
+                             {"action": "filter", "conditions": [{"column": "数量", "op": ">", "value": 5}]}]},
+                  f, ensure_ascii=False, indent=2)
+    ok &= run(sample, "clean --preview --sample 10 - 改写过的列样本中没有数值时标注近似",
+              expect="步骤2 [筛选] AND 1条件: 10→10行（样本近似）")
+
     # 导出 CSV
     csv_out = os.path.join(TEST_DIR, "清洗结果.csv")
     ok &= run(
@@ -212,6 +271,99 @@ def step4_test_clean(test_file):
         "clean -o xlsx - 导出Excel"
     )
 
+    # 分块执行：导出结果与整表执行逐字节一致
+    for full_out in [csv_out, json_out]:
+        chunked_out = full_out.replace("清洗结果", "清洗结果-分块")
+        ok &= run(
+            [PYTHON, TOOL, "clean", test_file, rules_path, "-o", chunked_out, "--sheet", "销售月报",
+             "--chunk-size", "7", "--no-cache"],
+            f"clean --chunk-size 7 -o {os.path.splitext(full_out)[1]} - 分块执行", expect="[分块] 落盘"
+        )
+        with open(full_out, "rb") as a, open(chunked_out, "rb") as b:
+            same = a.read() == b.read()
+        print(f"  分块与整表结果{'一致' if same else '不一致'}")
+        ok &= same
+
+    # 分块执行 aggregate：group_by 可以只写一个列名（字符串）
+    agg_rules = os.path.join(TEST_DIR, "测试单列聚合规则.json")
+    with open(agg_rules, "w", encoding="utf-8") as f:
+        json.dump({"steps": [{"action": "aggregate", "group_by": "区域", "metrics": {"销量": "sum"}}]},
+                  f, ensure_ascii=False, indent=2)
+    outs = []
+    for extra in [[], ["--chunk-size", "5"]]:
+        out = os.path.join(TEST_DIR, f"单列聚合{len(extra)}.csv")
+        ok &= run([PYTHON, TOOL, "clean", test_file, agg_rules, "-o", out, "--sheet", "销售月报", "--no-cache", *extra],
+                  f"clean aggregate group_by 字符串 {' '.join(extra) or '整表'}")
+        with open(out, "rb") as f:
+            outs.append(f.read())
+    print(f"  分块与整表结果{'一致' if outs[0] == outs[1] else '不一致'}")
+    ok &= outs[0] == outs[1]
+
+    # 分块执行 add_column：文本列是否转数值、整数还是浮点按整列决定（前 10 行全是文本，之后是整数）
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["型号", "数量"])
+    for i in range(20):
+        ws.append([f"M{i}", "缺货" if i < 10 else i])
+    stock_file = os.path.join(TEST_DIR, "缺货库存.xlsx")
+    wb.save(stock_file)
+    stock_rules = os.path.join(TEST_DIR, "测试缺货公式规则.json")
+    with open(stock_rules, "w", encoding="utf-8") as f:
+        json.dump({"steps": [{"action": "add_column", "name": "双倍", "formula": "{数量} * 2"}]},
+                  f, ensure_ascii=False, indent=2)
+    outs = []
+    for extra in [[], ["--chunk-size", "10"]]:
+        out = os.path.join(TEST_DIR, f"缺货公式{len(extra)}.csv")
+        ok &= run([PYTHON, TOOL, "clean", stock_file, stock_rules, "-o", out, "--no-cache", *extra],
+                  f"clean add_column {' '.join(extra) or '整表'} - 前几行全是文本的列")
+        with open(out, "rb") as f:
+            outs.append(f.read())
+    print(f"  分块与整表结果{'一致' if outs[0] == outs[1] else '不一致'}")
+    ok &= outs[0] == outs[1]
+
+    # 执行计划：筛选提前、文本步骤合并、无用列裁剪，结果与按原顺序执行一致
+    plan_rules = {"steps": [
+        {"action": "trim"},
+        {"action": "replace", "column": "区域", "mapping": {"华东区": "华东", "华南区": "华南"}},
+        {"action": "regex_replace", "column": "产品型号", "pattern": "\\s+", "replacement": "-"},
+        {"action": "add_column", "name": "均价", "formula": "{营收} / {销量}", "round": 1},
+        {"action": "filter", "conditions": [{"column": "类别", "op": "==", "value": "笔记本"}]},
+        {"action": "drop_columns", "columns": ["单价", "类别"]},
+    ]}
+    plan_path = os.path.join(TEST_DIR, "测试计划规则.json")
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump(plan_rules, f, ensure_ascii=False, indent=2)
+    ok &= run([PYTHON, TOOL, "clean", test_file, plan_path, "--preview", "--sheet", "销售月报", "--explain"],
+              "clean --explain - 打印执行计划并与原顺序对比", expect="结果一致: 是")
+    outs = []
+    for extra in [[], ["--no-optimize"]]:
+        out = os.path.join(TEST_DIR, f"计划结果{len(extra)}.csv")
+        ok &= run([PYTHON, TOOL, "clean", test_file, plan_path, "-o", out, "--sheet", "销售月报",
+                   "--no-cache", *extra], f"clean {' '.join(extra) or '默认优化'} -o csv")
+        with open(out, "rb") as f:
+            outs.append(f.read())
+    print(f"  优化与原顺序结果{'一致' if outs[0] == outs[1] else '不一致'}")
+    ok &= outs[0] == outs[1]
+
+    # 公式：条件、函数与文本列自动转数值
+    formula_rules = {"steps": [
+        {"action": "add_column", "name": "等级", "formula": "IF({销量} >= 100, '高', '低')"},
+        {"action": "add_column", "name": "营收补齐", "formula": "coalesce({营收}, {销量} * {单价}, 0)"},
+        {"action": "add_column", "name": "偏差", "formula": "round(abs({营收} - {销量} * {单价}), 1)"},
+        {"action": "add_column", "name": "笔记本", "formula": "{类别} in ['笔记本'] and {销量} > 0"},
+    ]}
+    formula_path = os.path.join(TEST_DIR, "测试公式规则.json")
+    with open(formula_path, "w", encoding="utf-8") as f:
+        json.dump(formula_rules, f, ensure_ascii=False, indent=2)
+    formula_out = os.path.join(TEST_DIR, "公式结果.csv")
+    ok &= run([PYTHON, TOOL, "clean", test_file, formula_path, "-o", formula_out, "--sheet", "销售月报",
+               "--no-cache"], "clean add_column - IF / coalesce / round / abs / in")
+    with open(formula_out, encoding="utf-8-sig") as f:
+        content = f.read()
+    formula_ok = "等级,营收补齐,偏差,笔记本" in content.splitlines()[0] and ",高," in content
+    print(f"  公式列{'正确' if formula_ok else '缺失或计算失败'}")
+    ok &= formula_ok
+
     # 验证导出文件
     print(f"\n{'='*60}")
     print("验证导出文件")
@@ -225,6 +377,505 @@ def step4_test_clean(test_file):
     return ok
 
 
+def step4b_test_export(test_file):
+    """测试流式导出：.csv.gz 解压后与 .csv 一致，.jsonl 每行一条记录"""
+    csv_out = os.path.join(TEST_DIR, "导出.csv")
+    gz_out = csv_out + ".gz"
+    jsonl_out = os.path.join(TEST_DIR, "导出.jsonl")
+    ok = True
+    for out in [csv_out, gz_out, jsonl_out]:
+        ok &= run([PYTHON, TOOL, "export", test_file, "-o", out, "--sheet", "销售月报"],
+                  f"export -o {os.path.basename(out)} - 流式导出", expect="[导出]")
+    ok &= run([PYTHON, TOOL, "export", test_file, "-o", os.path.join(TEST_DIR, "导出.xlsx.gz"),
+               "--sheet", "销售月报"], "export -o .xlsx.gz - 不支持的格式", expect="不支持的格式")
+
+    with open(csv_out, "rb") as a, gzip.open(gz_out, "rb") as b:
+        same = a.read() == b.read()
+    print(f"  .csv.gz 与 .csv {'一致' if same else '不一致'}")
+    with open(csv_out, encoding="utf-8-sig") as a, open(jsonl_out, encoding="utf-8") as b:
+        records = [json.loads(line) for line in b]
+        lines = sum(1 for _ in csv.reader(a)) - 1
+    print(f"  .jsonl {len(records)} 条记录，.csv {lines} 行")
+    return ok and same and len(records) == lines
+
+
+def step4c_test_batch(test_file):
+    """测试 batch：同一规则并行清洗目录下的多个工作簿，合并输出带来源文件列"""
+    batch_dir = os.path.join(TEST_DIR, "batch")
+    os.makedirs(batch_dir, exist_ok=True)
+    for name in ["分公司A.xlsx", "分公司B.xlsx"]:
+        shutil.copy(test_file, os.path.join(batch_dir, name))
+    rules_path = os.path.join(TEST_DIR, "测试清洗规则.json")
+    merged = os.path.join(TEST_DIR, "批量合并.csv")
+    ok = run([PYTHON, TOOL, "batch", batch_dir, "-r", rules_path, "--sheet", "销售月报",
+              "-o", merged, "--jobs", "2"],
+             "batch - 2 个工作簿并行清洗并合并", expect="成功 2 个，失败 0 个")
+
+    with open(os.path.join(TEST_DIR, "清洗结果.csv"), encoding="utf-8-sig") as f:
+        single = list(csv.reader(f))
+    with open(merged, encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    expected = [["来源文件"] + single[0]] + [[name] + r for name in ["分公司A.xlsx", "分公司B.xlsx"]
+                                               for r in single[1:]]
+    same = rows == expected
+    print(f"  合并结果与单文件清洗结果{'一致' if same else '不一致'}")
+    return ok and same
+
+
+def step4d_test_backends(test_file):
+    """测试 polars 处理后端：上面 clean / batch 的各组规则输出与 pandas 后端逐字节一致"""
+    try:
+        import polars  # noqa: F401
+    except ImportError:
+        print("\n[提示] 未安装 polars，跳过处理后端一致性测试（pip install polars）")
+        return True
+    ok = True
+    cases = [("测试清洗规则.json", "清洗结果.csv", []), ("测试清洗规则.json", "清洗结果.json", []),
+             ("测试计划规则.json", "计划结果0.csv", []), ("测试计划规则.json", "计划结果1.csv", ["--no-optimize"]),
+             ("测试公式规则.json", "公式结果.csv", [])]
+    for rules, expected, extra in cases:
+        out = os.path.join(TEST_DIR, "polars-" + expected)
+        ok &= run([PYTHON, TOOL, "clean", test_file, os.path.join(TEST_DIR, rules), "-o", out,
+                   "--sheet", "销售月报", "--no-cache", "--backend", "polars", *extra],
+                  f"clean --backend polars {rules} {' '.join(extra)}", expect="处理=polars")
+        with open(os.path.join(TEST_DIR, expected), "rb") as a, open(out, "rb") as b:
+            same = a.read() == b.read()
+        print(f"  {expected}: polars 与 pandas 结果{'一致' if same else '不一致'}")
+        ok &= same
+
+    # --explain 的对照按原顺序用 pandas 执行，优化后的计划用 polars 执行
+    ok &= run([PYTHON, TOOL, "clean", test_file, os.path.join(TEST_DIR, "测试计划规则.json"), "--preview",
+               "--sheet", "销售月报", "--explain", "--backend", "polars"],
+              "clean --explain --backend polars - 与 pandas 按原顺序执行对比", expect="结果一致: 是")
+
+    merged = os.path.join(TEST_DIR, "polars-批量合并.csv")
+    ok &= run([PYTHON, TOOL, "batch", os.path.join(TEST_DIR, "batch"), "-r", os.path.join(TEST_DIR, "测试清洗规则.json"),
+               "--sheet", "销售月报", "-o", merged, "--jobs", "2", "--backend", "polars"],
+              "batch --backend polars", expect="成功 2 个，失败 0 个")
+    with open(os.path.join(TEST_DIR, "批量合并.csv"), "rb") as a, open(merged, "rb") as b:
+        same = a.read() == b.read()
+    print(f"  批量合并.csv: polars 与 pandas 结果{'一致' if same else '不一致'}")
+    ok &= same
+
+    bench = os.path.join(SCRIPT_DIR, "benchmark.py")
+    ok &= run([PYTHON, bench, "backend", "--rows", "20000"],
+              "backend - pandas / polars 后端执行同一组步骤", expect="结果一致: 是")
+    return ok
+
+
+def step4e_test_category(test_file):
+    """测试低基数文本列分类编码：所有文本列都按分类读入时，clean / batch 的输出与普通文本列逐字节一致"""
+    ok = True
+    cases = [("测试清洗规则.json", "清洗结果.csv", []), ("测试清洗规则.json", "清洗结果.json", []),
+             ("测试计划规则.json", "计划结果0.csv", []), ("测试计划规则.json", "计划结果1.csv", ["--no-optimize"]),
+             ("测试公式规则.json", "公式结果.csv", [])]
+    os.environ.update(EXCEL_TOOL_CATEGORY_MIN_ROWS="1", EXCEL_TOOL_CATEGORY_RATIO="1")
+    try:
+        for rules, expected, extra in cases:
+            out = os.path.join(TEST_DIR, "category-" + expected)
+            ok &= run([PYTHON, TOOL, "clean", test_file, os.path.join(TEST_DIR, rules), "-o", out,
+                       "--sheet", "销售月报", "--no-cache", *extra],
+                      f"clean 分类编码 {rules} {' '.join(extra)}")
+            with open(os.path.join(TEST_DIR, expected), "rb") as a, open(out, "rb") as b:
+                same = a.read() == b.read()
+            print(f"  {expected}: 分类编码与普通文本列结果{'一致' if same else '不一致'}")
+            ok &= same
+
+        ok &= run([PYTHON, TOOL, "clean", test_file, os.path.join(TEST_DIR, "测试计划规则.json"), "--preview",
+                   "--sheet", "销售月报", "--no-cache", "--explain"],
+                  "clean --explain 分类编码 - 优化计划与按原顺序执行对比", expect="结果一致: 是")
+
+        merged = os.path.join(TEST_DIR, "category-批量合并.csv")
+        ok &= run([PYTHON, TOOL, "batch", os.path.join(TEST_DIR, "batch"), "-r", os.path.join(TEST_DIR, "测试清洗规则.json"),
+                   "--sheet", "销售月报", "-o", merged, "--jobs", "2"],
+                  "batch 分类编码", expect="成功 2 个，失败 0 个")
+        with open(os.path.join(TEST_DIR, "批量合并.csv"), "rb") as a, open(merged, "rb") as b:
+            same = a.read() == b.read()
+        print(f"  批量合并.csv: 分类编码与普通文本列结果{'一致' if same else '不一致'}")
+        ok &= same
+    finally:
+        del os.environ["EXCEL_TOOL_CATEGORY_MIN_ROWS"], os.environ["EXCEL_TOOL_CATEGORY_RATIO"]
+
+    bench = os.path.join(SCRIPT_DIR, "benchmark.py")
+    ok &= run([PYTHON, bench, "category", "--rows", "20000"],
+              "category - 普通文本 / 分类编码执行同一组步骤", expect="结果一致: 是")
+    return ok
+
+
+def step5_test_cache(test_file):
+    """测试解析缓存：首次解析写缓存，再次读取命中，cache 命令可查看和清理；clean 预览的步骤缓存可续跑"""
+    ok = True
+    ok &= run([PYTHON, TOOL, "cache", "clear"], "cache clear - 清空缓存")
+    ok &= run(
+        [PYTHON, TOOL, "auto", test_file, "query", "--sheet", "销售月报"],
+        "auto query - 首次解析写入缓存"
+    )
+    ok &= run(
+        [PYTHON, TOOL, "auto", test_file, "query", "--sheet", "销售月报"],
+        "auto query - 再次读取命中缓存", expect="[缓存] 命中"
+    )
+    ok &= run([PYTHON, TOOL, "cache"], "cache - 查看缓存", expect="销售月报")
+
+    # 内容哈希：复制到另一个路径的同一文件也命中
+    copied = os.path.join(TEST_DIR, "测试报表_副本.xlsx")
+    shutil.copyfile(test_file, copied)
+    ok &= run([PYTHON, TOOL, "auto", test_file, "query", "--sheet", "销售月报", "--cache-hash"],
+              "auto query --cache-hash - 按内容哈希写入缓存")
+    ok &= run([PYTHON, TOOL, "auto", copied, "query", "--sheet", "销售月报", "--cache-hash"],
+              "auto query --cache-hash - 复制的文件命中缓存", expect="[缓存] 命中")
+
+    # 步骤缓存：预览时缓存每一步的结果，只改最后一步时从未改动的前缀续跑
+    with open(os.path.join(TEST_DIR, "测试清洗规则.json"), encoding="utf-8") as f:
+        rules = json.load(f)
+    clean = [PYTHON, TOOL, "clean", test_file, os.path.join(TEST_DIR, "测试步骤缓存规则.json"), "--sheet", "销售月报"]
+    for desc, expect in [(True, "[清洗前]"), (True, "全部 8 个步骤未改动"), (False, "从步骤8继续")]:
+        rules["steps"][-1]["desc"] = desc
+        with open(os.path.join(TEST_DIR, "测试步骤缓存规则.json"), "w", encoding="utf-8") as f:
+            json.dump(rules, f, ensure_ascii=False, indent=2)
+        ok &= run(clean + ["--preview"], f"clean --preview 步骤缓存 - {expect}", expect=expect)
+    resumed, fresh = os.path.join(TEST_DIR, "步骤缓存续跑.csv"), os.path.join(TEST_DIR, "步骤缓存对照.csv")
+    ok &= run(clean + ["-o", resumed], "clean -o - 使用缓存的步骤结果", expect="全部 8 个步骤未改动")
+    ok &= run(clean + ["-o", fresh, "--no-cache"], "clean -o --no-cache - 从头执行对照")
+    with open(resumed, "rb") as a, open(fresh, "rb") as b:
+        same = a.read() == b.read()
+    print(f"  步骤缓存续跑与从头执行结果{'一致' if same else '不一致'}")
+    ok &= same
+    ok &= run([PYTHON, TOOL, "cache"], "cache - 查看步骤缓存", expect="前 8 步")
+
+    ok &= run([PYTHON, TOOL, "cache", "clear", test_file], "cache clear <文件> - 清理该文件缓存")
+    return ok
+
+
+def step5b_test_bounded_reads(test_file):
+    """测试 preview/headers 的有界读取和 query 的下推读取：未命中缓存时的结果与完整解析后（命中缓存）一致"""
+    def output(*args):
+        result = subprocess.run([PYTHON, TOOL, "auto", test_file, *args], capture_output=True, text=True)
+        lines = [l for l in result.stdout.splitlines()
+                 if l.strip() and not l.startswith(("[缓存]", "[耗时]"))]
+        return result.returncode, lines
+
+    ok = True
+    for args in [("headers", "--sheet", "销售月报"), ("preview", "-n", "30", "--sheet", "销售月报"),
+                 ("preview", "-n", "3", "--sheet", "销售月报"),
+                 ("headers", "--sheet", "库存"),
+                 ("query", "--where-col", "销量", "--where-op", ">", "--where-val", "300",
+                  "-c", "区域,产品型号,销量", "--sheet", "销售月报"),
+                 ("query", "--where-col", "区域", "--where-op", "contains", "--where-val", "华",
+                  "-s", "desc:营收", "-t", "5", "--sheet", "销售月报"),
+                 ("query", "--where-col", "销量", "--where-op", "!=", "--where-val", "320",
+                  "-c", "产品型号", "--sheet", "销售月报")]:
+        print(f"\n测试: auto {' '.join(args)} 流式 vs 缓存")
+        subprocess.run([PYTHON, TOOL, "cache", "clear", test_file], capture_output=True)
+        code_a, out_a = output(*args)
+        subprocess.run([PYTHON, TOOL, "auto", test_file, "query", *args[-2:]], capture_output=True)
+        code_b, out_b = output(*args)
+        same = code_a == code_b == 0 and out_a == out_b
+        print(f"  {'一致' if same else '不一致'}")
+        ok &= same
+    ok &= run(
+        [PYTHON, TOOL, "auto", test_file, "preview", "-n", "3", "--sheet", "销售月报", "--no-cache"],
+        "auto preview -n 3 - 只保留前几行，行数精确", expect="共 18 行，预览前 3 行"
+    )
+    return ok
+
+
+def step5c_test_parallel(test_file):
+    """测试多 Sheet 并行读取：输出与串行一致（忽略耗时行），--all-sheets 每个 Sheet 导出一个文件"""
+    def output(*args):
+        result = subprocess.run([PYTHON, TOOL, "auto", test_file, *args, "--no-cache"],
+                                capture_output=True, text=True)
+        return result.returncode, [l for l in result.stdout.splitlines() if not l.startswith("[耗时]")]
+
+    ok = True
+    for action in ["headers", "preview"]:
+        print(f"\n测试: auto {action} --jobs 2 并行 vs 串行")
+        code_a, out_a = output(action, "--jobs", "1")
+        code_b, out_b = output(action, "--jobs", "2")
+        same = code_a == code_b == 0 and out_a == out_b
+        print(f"  {'一致' if same else '不一致'}")
+        ok &= same
+
+    out = os.path.join(TEST_DIR, "全部.csv")
+    ok &= run([PYTHON, TOOL, "export", test_file, "-o", out, "--all-sheets", "--jobs", "2"],
+              "export --all-sheets --jobs 2 - 并行导出全部 Sheet", expect="2 进程并行读取")
+    for name in ["销售月报", "库存"]:
+        exists = os.path.exists(os.path.join(TEST_DIR, f"全部-{name}.csv"))
+        print(f"  全部-{name}.csv: {'存在' if exists else '缺失'}")
+        ok &= exists
+    return ok
+
+
+def step5d_test_daemon(test_file):
+    """测试常驻进程：--daemon 输出与本地执行一致（忽略耗时/缓存/空行），status 报告命中率"""
+    os.environ["EXCEL_TOOL_DAEMON_DIR"] = os.path.join(TEST_DIR, "daemon")
+
+    def output(*extra):
+        args = ["auto", test_file, "query", "--sheet", "销售月报",
+                "--where-col", "类别", "--where-op", "==", "--where-val", "笔记本"]
+        result = subprocess.run([PYTHON, TOOL, *args, *extra], capture_output=True, text=True)
+        lines = [l for l in result.stdout.splitlines()
+                 if l.strip() and not l.startswith(("[耗时]", "[缓存]"))]
+        return result.returncode, lines
+
+    ok = run([PYTHON, TOOL, "daemon", "start"], "daemon start - 启动常驻进程", expect="已启动")
+    try:
+        code_a, out_a = output("--no-cache")
+        for i in range(2):
+            print(f"\n测试: auto query --daemon 第 {i + 1} 次 vs 本地")
+            code_b, out_b = output("--daemon")
+            same = code_a == code_b == 0 and out_a == out_b
+            print(f"  {'一致' if same else '不一致'}")
+            ok &= same
+        # 作为参数值的 "--daemon" 原样转发，不被当成开关去掉
+        ok &= run([PYTHON, TOOL, "auto", test_file, "query", "--sheet", "销售月报", "--where-col", "区域",
+                   "--where-op", "==", "--where-val=--daemon", "--daemon"],
+                  "auto query --daemon - 参数值为 --daemon 时原样转发", expect="筛选后 0 条")
+        # 常驻进程按客户端的 EXCEL_TOOL_* 环境执行：关闭缓存时不命中，换缓存目录时写到客户端的目录
+        client_cache = tempfile.mkdtemp(prefix="excel_tool_client_cache_")
+        saved = os.environ["EXCEL_TOOL_CACHE_DIR"]
+        try:
+            os.environ["EXCEL_TOOL_NO_CACHE"] = "1"
+            result = subprocess.run([PYTHON, TOOL, "auto", test_file, "--sheet", "销售月报", "--daemon"],
+                                    capture_output=True, text=True)
+            no_cache = result.returncode == 0 and "[缓存] 命中" not in result.stdout
+            del os.environ["EXCEL_TOOL_NO_CACHE"]
+            os.environ["EXCEL_TOOL_CACHE_DIR"] = client_cache
+            subprocess.run([PYTHON, TOOL, "auto", test_file, "--sheet", "库存", "--daemon"], capture_output=True)
+            own_dir = os.path.isdir(client_cache) and len(os.listdir(client_cache)) > 0
+        finally:
+            os.environ.pop("EXCEL_TOOL_NO_CACHE", None)
+            os.environ["EXCEL_TOOL_CACHE_DIR"] = saved
+            shutil.rmtree(client_cache, ignore_errors=True)
+        print(f"\n测试: --daemon 按客户端环境执行\n  EXCEL_TOOL_NO_CACHE=1 不命中缓存: {'是' if no_cache else '否'}，"
+              f"EXCEL_TOOL_CACHE_DIR 写到客户端目录: {'是' if own_dir else '否'}")
+        ok &= no_cache and own_dir
+        ok &= run([PYTHON, TOOL, "daemon", "status"], "daemon status - 查看缓存命中率", expect="命中率")
+    finally:
+        ok &= run([PYTHON, TOOL, "daemon", "stop"], "daemon stop - 停止常驻进程", expect="已停止")
+    return ok
+
+
+def step5e_test_profile(test_file):
+    """测试 --profile：打印各阶段 / 步骤的剖析表，写出 JSON 记录；batch 子进程的记录经环境变量开启后并入 Chrome trace"""
+    rules_path = os.path.join(TEST_DIR, "测试清洗规则.json")
+    profile_json = os.path.join(TEST_DIR, "剖析.json")
+    ok = run([PYTHON, TOOL, "clean", test_file, rules_path, "--sheet", "销售月报", "--exact", "--no-cache",
+              "--profile", profile_json],
+             "clean --profile - 各阶段 / 步骤的耗时和内存", expect="[性能剖析] 已写出")
+    with open(profile_json, encoding="utf-8") as f:
+        records = json.load(f)["records"]
+    names = [r["name"] for r in records]
+    steps = [r for r in records if r["kind"] == "step"]
+    complete = (all(p in names for p in ["命令 clean", "读取", "清洗字符", "推断配置"])
+                and len(steps) > 0 and steps[0]["rows_in"] == 18
+                and all(r["wall"] >= 0 and r["py_peak_mb"] > 0 for r in records))
+    print(f"  JSON 记录 {len(records)} 条，含读取/清洗字符/各步骤行数: {'是' if complete else '否'}")
+    ok &= complete
+
+    trace = os.path.join(TEST_DIR, "剖析.trace.json")
+    os.environ["EXCEL_TOOL_PROFILE"] = trace
+    try:
+        ok &= run([PYTHON, TOOL, "batch", os.path.join(TEST_DIR, "batch"), "-r", rules_path,
+                   "--sheet", "销售月报", "-o", os.path.join(TEST_DIR, "剖析合并.csv"), "--jobs", "2"],
+                  "batch（EXCEL_TOOL_PROFILE）- 子进程记录并入 Chrome trace", expect="[性能剖析] 已写出")
+    finally:
+        del os.environ["EXCEL_TOOL_PROFILE"]
+    with open(trace, encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    pids = {e["pid"] for e in events}
+    merged = len(pids) >= 2 and all(e["ph"] == "X" and e["dur"] >= 0 for e in events) \
+        and sum(e["name"].startswith("步骤") for e in events) > 0
+    print(f"  trace 事件 {len(events)} 条，{len(pids)} 个进程: {'完整' if merged else '不完整'}")
+    return ok and merged
+
+
+def step6_test_engines(test_file):
+    """测试 xml 引擎：scout/auto 输出与 openpyxl 引擎一致（忽略引擎名和耗时行）"""
+    def output(engine, *args):
+        cmd = [PYTHON, TOOL, *args, "--engine", engine]
+        if args[0] != "scout":
+            cmd.append("--no-cache")
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        lines = [l for l in result.stdout.splitlines()
+                 if not l.startswith(("[引擎]", "[耗时]"))]
+        return result.returncode, lines
+
+    ok = True
+    for args in [("scout", test_file, "-n", "6"),
+                 ("auto", test_file, "preview", "-n", "30", "--sheet", "销售月报"),
+                 ("auto", test_file, "headers")]:
+        print(f"\n测试: xml 引擎 {' '.join(args[:1] + args[2:])}")
+        code_a, out_a = output("openpyxl", *args)
+        code_b, out_b = output("xml", *args)
+        same = code_a == code_b == 0 and out_a == out_b
+        print(f"  {'一致' if same else '不一致'}")
+        ok &= same
+    return ok
+
+
+def step6b_test_used_range():
+    """测试实际范围：<dimension> 声明为整张表、右侧和下方有只带格式的单元格时，
+    两种引擎读出的列和数据与正常文件一致，scout 报告实际范围并列出声明范围"""
+    import re
+    import zipfile
+    from openpyxl import Workbook
+    from openpyxl.styles import PatternFill
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "数据"
+    ws.append(["销售报表"])
+    ws.append(["区域", "销量", "单价"])
+    for i in range(300):
+        ws.append([["华东", "华南"][i % 2], i, 1.5])
+    plain = os.path.join(TEST_DIR, "实际范围_正常.xlsx")
+    wb.save(plain)
+    fill = PatternFill("solid", fgColor="FFFF00")
+    for r in range(2, 50):
+        ws.cell(row=r, column=200).fill = fill
+    for r in range(310, 2000):
+        ws.cell(row=r, column=2).fill = fill
+    styled = os.path.join(TEST_DIR, "实际范围_格式.xlsx")
+    wb.save(styled)
+    phantom = os.path.join(TEST_DIR, "实际范围_整表.xlsx")
+    with zipfile.ZipFile(styled) as src, zipfile.ZipFile(phantom, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            if item.filename.startswith("xl/worksheets/sheet"):
+                data = re.sub(rb'<dimension ref="[^"]*"\s*/>', b'<dimension ref="A1:XFD1048576"/>', data)
+            dst.writestr(item, data)
+
+    ok = run([PYTHON, TOOL, "scout", phantom, "-n", "3"],
+             "scout - 报告实际范围，列出声明范围", expect="声明 1048576行 × 16384列")
+    expected = os.path.join(TEST_DIR, "实际范围_正常.csv")
+    ok &= run([PYTHON, TOOL, "export", plain, "-o", expected, "--no-cache"], "export - 正常文件")
+    with open(expected, encoding="utf-8-sig") as f:
+        want = f.read()
+    for engine in ["openpyxl", "xml"]:
+        for path in [styled, phantom]:
+            out = os.path.join(TEST_DIR, f"实际范围_{engine}.csv")
+            ok &= run([PYTHON, TOOL, "export", path, "-o", out, "--engine", engine, "--no-cache"],
+                      f"export --engine {engine} - {os.path.basename(path)}")
+            with open(out, encoding="utf-8-sig") as f:
+                same = f.read() == want
+            print(f"  与正常文件一致（无空列名、无多余行）: {'是' if same else '否'}")
+            ok &= same
+    return ok
+
+
+def step6c_test_fill_merged():
+    """测试 --fill-merged：纵向合并的区域名填到每一行（两种引擎一致），左上角在被跳过的序号列的
+    横向合并也能填上；标题行的合并不影响表头，不加参数时与原来一致"""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "数据"
+    ws.append(["区域销售表"])
+    ws.merge_cells("A1:D1")
+    ws.append(["序号", "区域", "型号", "销量"])
+    regions = ["华东", "华南", "华北"]
+    for i in range(90):
+        r = i + 3
+        ws.cell(row=r, column=1, value=i + 1)
+        ws.cell(row=r, column=3, value=f"M{i % 7}")
+        ws.cell(row=r, column=4, value=i)
+        if i % 30 == 0:
+            ws.cell(row=r, column=2, value=regions[i // 30])
+            ws.merge_cells(start_row=r, start_column=2, end_row=r + 29, end_column=2)
+    ws.cell(row=93, column=1, value="合计")
+    ws.merge_cells("A93:C93")
+    ws.cell(row=93, column=4, value=4005)
+    path = os.path.join(TEST_DIR, "合并单元格.xlsx")
+    wb.save(path)
+
+    want = [["区域", "型号", "销量"]]
+    want += [[regions[i // 30], f"M{i % 7}", str(i)] for i in range(90)]
+    want.append(["合计", "合计", "4005"])
+    ok = True
+    for engine in ["openpyxl", "xml"]:
+        out = os.path.join(TEST_DIR, f"合并单元格_{engine}.csv")
+        ok &= run([PYTHON, TOOL, "export", path, "-o", out, "--engine", engine, "--fill-merged"],
+                  f"export --fill-merged --engine {engine} - 合并单元格填左上角的值")
+        with open(out, encoding="utf-8-sig", newline="") as f:
+            same = list(csv.reader(f)) == want
+        print(f"  每个合并的格子都填上了左上角的值: {'是' if same else '否'}")
+        ok &= same
+
+    out = os.path.join(TEST_DIR, "合并单元格_原样.csv")
+    ok &= run([PYTHON, TOOL, "export", path, "-o", out], "export - 不加 --fill-merged 只有左上角有值")
+    with open(out, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+    unchanged = rows[1][0] == "华东" and rows[2][0] == "" and rows[-1] == ["", "", "4005"]
+    print(f"  不加参数时与原来一致: {'是' if unchanged else '否'}")
+    return ok and unchanged
+
+
+def step7_test_normalize():
+    """测试向量化文本清洗：与逐值 _clean_text 结果一致（含低基数列、混合类型列）"""
+    bench = os.path.join(SCRIPT_DIR, "benchmark.py")
+    return run([PYTHON, bench, "normalize", "--rows", "2000", "--cols", "10"],
+               "normalize - 向量化清洗与逐值清洗一致", expect="结果一致: 是")
+
+
+def step7b_test_views():
+    """测试列类型视图：流程内共享转换与每步重新转换结果一致（含筛选后整数列的类型）"""
+    bench = os.path.join(SCRIPT_DIR, "benchmark.py")
+    return run([PYTHON, bench, "views", "--rows", "3000"],
+               "views - 共享列视图与逐步转换一致", expect="结果一致: 是")
+
+
+def step7c_test_formula():
+    """测试编译公式：与 df.eval 结果一致，numexpr / NumPy 两条路径一致"""
+    bench = os.path.join(SCRIPT_DIR, "benchmark.py")
+    ok = run([PYTHON, bench, "formula", "--rows", "30000"],
+             "formula - 编译公式与 df.eval 一致（大表）", expect="结果一致: 是")
+    ok &= run([PYTHON, bench, "formula", "--rows", "3000", "--files", "20"],
+              "formula - 多表共用编译结果", expect="结果一致: 是")
+    return ok
+
+
+def step7d_test_dedup():
+    """测试摘要去重：整表、分块（摘要常驻 / 分区落盘）与 drop_duplicates 结果一致"""
+    bench = os.path.join(SCRIPT_DIR, "benchmark.py")
+    ok = True
+    for keep in ["first", "last"]:
+        ok &= run([PYTHON, bench, "dedup", "--rows", "4000", "--keep", keep],
+                  f"dedup keep={keep} - 摘要判重与 drop_duplicates 一致", expect="结果一致: 是")
+    return ok
+
+
+def step8_test_startup():
+    """测试冷启动：help / steps-path 不导入 pandas、numpy、openpyxl"""
+    bench = os.path.join(SCRIPT_DIR, "benchmark.py")
+    return run([PYTHON, bench, "startup", "--runs", "1"],
+               "startup - 不读表的命令不加载重依赖", expect="未导入")
+
+
+def step8b_test_suite():
+    """测试规模基准：首次运行存为基线，再次运行与基线对比；基线耗时改小后报告回归、退出码为 1。
+
+    基线、结果和生成的报表只写到本次的临时目录（BENCH_DIR）：本机跑出的耗时不能当作提交的基线。
+    """
+    bench = os.path.join(SCRIPT_DIR, "benchmark.py")
+    baseline = os.path.join(BENCH_DIR, "suite-baseline.json")
+    args = [PYTHON, bench, "suite", "--rows", "500", "--cols", "10", "--title-rows", "2", "--dirty", "0.5",
+            "--baseline", baseline, "-o", os.path.join(BENCH_DIR, "suite-results.json")]
+    ok = run(args, "suite - 生成脏报表逐项计时，首次存为基线", expect="[基线] 已保存")
+    ok &= run(args + ["--threshold", "100"], "suite - 与基线对比", expect="[回归] 无")
+
+    with open(baseline, encoding="utf-8") as f:
+        data = json.load(f)
+    data["results"]["500"] = {op: seconds / 1000 for op, seconds in data["results"]["500"].items()}
+    with open(baseline, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    print(f"\n测试: suite - 基线耗时缩小 1000 倍后应报告回归")
+    result = subprocess.run(args + ["--min-seconds", "0"], capture_output=True, text=True)
+    detected = result.returncode == 1 and "超出阈值" in result.stdout
+    print(f"  {'已报告回归' if detected else '未报告回归'}（退出码 {result.returncode}）")
+    return ok and detected
+
+
 def main():
     print("=" * 60)
     print("  Excel Tool 全功能测试")
@@ -236,6 +887,24 @@ def main():
     results["scout"] = step2_test_scout(test_file)
     results["auto"] = step3_test_auto(test_file)
     results["clean"] = step4_test_clean(test_file)
+    results["export"] = step4b_test_export(test_file)
+    results["batch"] = step4c_test_batch(test_file)
+    results["backend"] = step4d_test_backends(test_file)
+    results["category"] = step4e_test_category(test_file)
+    results["cache"] = step5_test_cache(test_file)
+    results["bounded"] = step5b_test_bounded_reads(test_file)
+    results["parallel"] = step5c_test_parallel(test_file)
+    results["daemon"] = step5d_test_daemon(test_file)
+    results["profile"] = step5e_test_profile(test_file)
+    results["engines"] = step6_test_engines(test_file)
+    results["used_range"] = step6b_test_used_range()
+    results["fill_merged"] = step6c_test_fill_merged()
+    results["normalize"] = step7_test_normalize()
+    results["views"] = step7b_test_views()
+    results["formula"] = step7c_test_formula()
+    results["dedup"] = step7d_test_dedup()
+    results["startup"] = step8_test_startup()
+    results["suite"] = step8b_test_suite()
 
     print(f"\n\n{'='*60}")
     print("  测试汇总")